@@ -0,0 +1,25 @@
+"""
+benchmarks:  Synthetic genome-scale benchmarks for RepCalc
+
+Input data is generated locally from a seed, so runs need no network and
+two runs with the same size and seed read identical files.  Each scenario
+runs in its own process, so its peak memory is its own.
+
+Usage, from the RepCalc directory:
+    python3 -m benchmarks.run --size small --out report.json
+    python3 -m benchmarks.compare base.json report.json
+    python3 -m benchmarks.generate --size hg38 bench_data/hg38
+    python3 -m benchmarks.loadtest --size small --op density --clients 8
+
+Manifest:
+    generate.py
+        Writes TE tables, GFF and BED RoI files, configs and MXROI matrices.
+    scenarios.py
+        Timed analysisA, analysisB, analysisC, transpose and getconfig runs.
+    run.py
+        Runs scenarios and writes a JSON report.
+    compare.py
+        Compares two JSON reports.
+    loadtest.py
+        Measures throughput and latency of the resident server.
+"""
@@ -0,0 +1,124 @@
+"""
+compare.py:  Compare two benchmark reports
+
+Prints one line per scenario found in both reports:  median seconds of
+each, their ratio, and the ratio of peak resident memory.  Ratios above 1
+mean the new report is slower or larger.  Differences in data set, Python,
+NumPy, machine or settings are printed first, as they make ratios
+meaningless.
+
+Manifest:
+    main(argv)
+        Command line entry point.
+    compare(base, new)
+        Returns [(Scenario, BaseSeconds, NewSeconds, TimeRatio, MemoryRatio)].
+    differences(base, new)
+        Returns list of notes on what differs besides the commit.
+"""
+
+import sys
+import json
+import argparse
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python3 -m benchmarks.compare',
+        description='Compare two RepCalc benchmark reports.')
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--fail-above', type=float, default=None,
+        metavar='RATIO',
+        help='exit with status 1 if any time ratio exceeds RATIO')
+    args = parser.parse_args(argv)
+
+    with open(args.base, 'r') as f:
+        base = json.load(f)
+    with open(args.new, 'r') as f:
+        new = json.load(f)
+
+    for note in differences(base, new):
+        print("Warning:  " + note)
+
+    print("%-16s %12s %12s %8s %8s" % \
+        ('scenario', 'base s', 'new s', 'time', 'memory'))
+    rows = compare(base, new)
+    for name, base_seconds, new_seconds, time_ratio, memory_ratio in rows:
+        print("%-16s %12.4f %12.4f %8s %8s" % (name, base_seconds, \
+            new_seconds, _ratio(time_ratio), _ratio(memory_ratio)))
+
+    if args.fail_above is not None:
+        if any(x[3] is not None and x[3] > args.fail_above for x in rows):
+            return(1)
+    return(0)
+
+def compare(base, new):
+    """
+    Take two reports.  Return [(Scenario, BaseSeconds, NewSeconds,
+    TimeRatio, MemoryRatio)] for scenarios that succeeded in both, sorted
+    by name.  A ratio is None where it cannot be computed.
+    """
+
+    rows = []
+    for name in sorted(new['scenarios']):
+        after = new['scenarios'][name]
+        before = base['scenarios'].get(name)
+        if before is None or before['status'] != 'ok' or \
+            after['status'] != 'ok':
+            continue
+        rows.append((name,
+            before['median seconds'],
+            after['median seconds'],
+            _divide(after['median seconds'], before['median seconds']),
+            _divide(after.get('peak rss'), before.get('peak rss'))))
+    return(rows)
+
+def differences(base, new):
+    """
+    Take two reports.  Return list of notes on differences other than the
+    commit that affect comparison.
+    """
+
+    notes = []
+    if base.get('format') != new.get('format'):
+        notes.append("report formats differ")
+
+    for key in ['size', 'seed', 'generator', 'tes', 'rois']:
+        if base['dataset'].get(key) != new['dataset'].get(key):
+            notes.append("data set %s differs:  %s, %s" % \
+                (key, base['dataset'].get(key), new['dataset'].get(key)))
+
+    for key in ['python', 'implementation', 'numpy', 'machine', 'cpus']:
+        if base['environment'].get(key) != new['environment'].get(key):
+            notes.append("%s differs:  %s, %s" % (key, \
+                base['environment'].get(key), new['environment'].get(key)))
+
+    for key in ['jobs', 'cache', 'tracemalloc']:
+        if base['settings'].get(key) != new['settings'].get(key):
+            notes.append("setting %s differs:  %s, %s" % \
+                (key, base['settings'].get(key), new['settings'].get(key)))
+
+    for name in sorted(new['scenarios']):
+        if new['scenarios'][name]['status'] != 'ok':
+            notes.append("%s failed in new report:  %s" % \
+                (name, new['scenarios'][name]['error']))
+    return(notes)
+
+def _divide(numerator, denominator):
+    """
+    Take two numbers or None.  Return their ratio, or None.
+    """
+
+    if numerator is None or not denominator:
+        return(None)
+    return(float(numerator) / denominator)
+
+def _ratio(value):
+    """
+    Take ratio or None.  Return it formatted for the table.
+    """
+
+    if value is None:
+        return('-')
+    return('%.3fx' % value)
+
+if __name__ == '__main__':
+    sys.exit(main())
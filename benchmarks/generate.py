@@ -0,0 +1,371 @@
+"""
+generate.py:  Synthetic RepCalc input data
+
+Everything is drawn from random.Random(seed), so the same size and seed
+always give the same files.  Genome coordinates are scaled down with the
+number of TEs, so small data sets keep the TE density of hg38 and RoIs
+overlap about as many TEs as they would in real data.
+
+TE table columns, tab-delimited, after one header line:
+    0 class/subclass, 1 chromosome, 2 start, 3 end, 4 chromosome
+The chromosome is repeated in column 4, which WG reads to skip '_random'
+chromosomes.
+
+RoI files hold the same regions as GFF3 (ID=, chromosome, start, end in
+columns 8, 0, 3, 4) and as BED (name, chromosome, start, end in columns 3,
+0, 1, 2).  Each has one header line.
+
+Manifest:
+    dataset(directory, size, seed)
+        Writes or reuses a whole data set.  Returns its manifest dict.
+    load(directory)
+        Returns manifest of a written data set, with paths of its files.
+    chromosomes(scale)
+        Returns [(Chromosome, Length)], hg38 sizes times scale.
+    tetable(filename, count, chromosome_sizes, rng)
+        Writes TE table.  Returns {Label}>Count.
+    regions(count, chromosome_sizes, rng)
+        Returns [(ID, Chromosome, Start, End)].
+    writegff(filename, region_list)
+    writebed(filename, region_list)
+        Write RoI files.
+    config(filename, rules, rng)
+        Writes config in the grammar of config/example.conf.
+    matrix(filename, region_count, rng)
+        Writes an MXROI output matrix, input for transpose().
+"""
+
+import os
+import sys
+import json
+import math
+import random
+import argparse
+from bisect import bisect_right
+from itertools import accumulate
+
+# Bumped whenever the files written for a size and seed change.
+GENERATOR_VERSION = 1
+
+# Number of TEs, number of RoIs, and number of extra config rules.
+SIZES = {
+    'tiny': (20000, 200, 100),
+    'small': (200000, 2000, 1000),
+    'medium': (1000000, 10000, 5000),
+    'hg38': (5600000, 50000, 20000)}
+
+# TE count of the hg38 RepeatMasker annotation, at which scale is 1.
+HG38_TES = SIZES['hg38'][0]
+
+# hg38 assembled chromosomes and a few unplaced '_random' contigs.
+HG38_CHROMOSOMES = [
+    ('chr1', 248956422), ('chr2', 242193529), ('chr3', 198295559),
+    ('chr4', 190214555), ('chr5', 181538259), ('chr6', 170805979),
+    ('chr7', 159345973), ('chr8', 145138636), ('chr9', 138394717),
+    ('chr10', 133797422), ('chr11', 135086622), ('chr12', 133275309),
+    ('chr13', 114364328), ('chr14', 107043718), ('chr15', 101991189),
+    ('chr16', 90338345), ('chr17', 83257441), ('chr18', 80373285),
+    ('chr19', 58617616), ('chr20', 64444167), ('chr21', 46709983),
+    ('chr22', 50818468), ('chrX', 156040895), ('chrY', 57227415),
+    ('chr1_KI270706v1_random', 175055), ('chr4_GL000008v2_random', 209709),
+    ('chr9_KI270719v1_random', 176845), ('chr17_KI270729v1_random', 280839)]
+
+# RepeatMasker labels with their approximate hg38 counts, in thousands, and
+# mean lengths in bp.  Includes the '?' labels folded by example.conf.
+TE_FAMILIES = [
+    ('SINE/Alu', 1200, 280), ('SINE/MIR', 600, 140), ('SINE/tRNA', 2, 150),
+    ('LINE/L1', 1000, 900), ('LINE/L2', 470, 300), ('LINE/CR1', 65, 250),
+    ('LINE/RTE-X', 15, 300),
+    ('LTR/ERVL-MaLR', 370, 300), ('LTR/ERVL', 190, 400),
+    ('LTR/ERV1', 180, 500), ('LTR/ERVK', 12, 1500), ('LTR/Gypsy', 15, 300),
+    ('DNA/hAT-Charlie', 260, 250), ('DNA/TcMar-Tigger', 115, 350),
+    ('DNA/hAT-Tip100', 30, 250), ('DNA/hAT-Blackjack', 12, 250),
+    ('DNA/TcMar-Mariner', 10, 300), ('DNA/PiggyBac', 2, 300),
+    ('Retroposon/SVA', 4, 1500), ('RC/Helitron', 2, 300),
+    ('Simple_repeat', 700, 60), ('Low_complexity', 100, 50),
+    ('Satellite', 10, 600), ('Satellite/centr', 3, 1500),
+    ('snRNA', 4.5, 150), ('tRNA', 2, 70), ('rRNA', 1.7, 150),
+    ('scRNA', 1.4, 150), ('srpRNA', 1.5, 250),
+    ('Unknown', 8, 200), ('Other', 0.2, 200),
+    ('DNA?', 5, 200), ('DNA?/hAT?', 3, 200), ('LTR?', 2, 300),
+    ('SINE?', 0.5, 150), ('RC?/Helitron?', 0.6, 300)]
+
+# Spread of TE and RoI lengths around their means.
+LENGTH_SIGMA = 0.8
+ROI_MEAN_LENGTH = 1000
+# Lines written at a time.
+WRITE_BATCH = 10000
+
+def dataset(directory, size='tiny', seed=1):
+    """
+    Take directory, size name and seed.  Return manifest dict.
+
+    Files already in directory are reused if its manifest.json was written
+    for the same size, seed and generator version.  The manifest is written
+    last, so an interrupted run is started over.
+    """
+
+    te_count, roi_count, rules = SIZES[size]
+    manifest_path = os.path.join(directory, 'manifest.json')
+    wanted = {'generator': GENERATOR_VERSION, 'size': size, 'seed': seed}
+
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        if all(manifest.get(x) == wanted[x] for x in wanted):
+            return(manifest)
+    except (OSError, ValueError):
+        pass
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    files = {'te': 'te.tsv',
+        'gff': 'roi.gff',
+        'bed': 'roi.bed',
+        'config': 'config.conf',
+        'matrix': 'matrix.txt'}
+    paths = dict((x, os.path.join(directory, files[x])) for x in files)
+
+    rng = random.Random(seed)
+    scale = float(te_count) / HG38_TES
+    sizes = chromosomes(scale)
+    labels = tetable(paths['te'], te_count, sizes, rng)
+    region_list = regions(roi_count, sizes, rng)
+    writegff(paths['gff'], region_list)
+    writebed(paths['bed'], region_list)
+    config(paths['config'], rules, rng)
+    matrix(paths['matrix'], roi_count, rng)
+
+    manifest = dict(wanted)
+    manifest.update({'files': files,
+        'genome length': sum(x[1] for x in sizes),
+        'chromosomes': len(sizes),
+        'tes': te_count,
+        'labels': len(labels),
+        'rois': roi_count,
+        'roi length': sum(x[3] - x[2] for x in region_list),
+        'config rules': rules,
+        'bytes': dict((x, os.path.getsize(paths[x])) for x in paths)})
+
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return(manifest)
+
+def load(directory):
+    """
+    Take directory written by dataset().  Return its manifest dict, with
+    'paths' mapping each file's key to its path.
+    """
+
+    with open(os.path.join(directory, 'manifest.json'), 'r') as f:
+        manifest = json.load(f)
+    manifest['paths'] = dict((x, os.path.join(directory, \
+        manifest['files'][x])) for x in manifest['files'])
+    return(manifest)
+
+def chromosomes(scale):
+    """
+    Take scale.  Return [(Chromosome, Length)] of hg38 chromosomes, each
+    at least 100 kbp so that small data sets keep every chromosome.
+    """
+
+    return([(name, max(100000, int(length * scale))) \
+        for name, length in HG38_CHROMOSOMES])
+
+def tetable(filename, count, chromosome_sizes, rng):
+    """
+    Take filename, number of TEs, chromosome sizes and random.Random.
+    Write TE table.  Return {Label}>Count.
+
+    TEs are spread over chromosomes in proportion to their length, and
+    written sorted by start within each chromosome, as RepeatMasker does.
+    """
+
+    labels = [x[0] for x in TE_FAMILIES]
+    weights = list(accumulate(x[1] for x in TE_FAMILIES))
+    # Mean of a lognormal is exp(mu + sigma^2 / 2).
+    mus = dict((x[0], math.log(x[2]) - LENGTH_SIGMA ** 2 / 2) \
+        for x in TE_FAMILIES)
+    counts = dict((x, 0) for x in labels)
+    genome = float(sum(x[1] for x in chromosome_sizes))
+
+    with open(filename, 'w') as f:
+        f.write('class\tchromosome\tstart\tend\tchromosome\n')
+        remaining = count
+        for i, (chromosome, length) in enumerate(chromosome_sizes):
+            if i == len(chromosome_sizes) - 1:
+                here = remaining
+            else:
+                here = min(remaining, int(round(count * length / genome)))
+            remaining -= here
+
+            starts = sorted(rng.randrange(length) for x in range(here))
+            chosen = _choices(rng, labels, weights, here)
+            lines = []
+            for start, label in zip(starts, chosen):
+                end = min(length, start + 10 + \
+                    int(rng.lognormvariate(mus[label], LENGTH_SIGMA)))
+                counts[label] += 1
+                lines.append('%s\t%s\t%d\t%d\t%s\n' % \
+                    (label, chromosome, start, end, chromosome))
+                if len(lines) >= WRITE_BATCH:
+                    f.writelines(lines)
+                    lines = []
+            f.writelines(lines)
+
+    return(dict((x, counts[x]) for x in labels if counts[x]))
+
+def regions(count, chromosome_sizes, rng):
+    """
+    Take number of RoIs, chromosome sizes and random.Random.
+    Return [(ID, Chromosome, Start, End)], sorted by chromosome and start.
+
+    RoIs fall on assembled chromosomes only, as peaks called on '_random'
+    contigs are dropped by every analysis anyway.
+    """
+
+    placed = [x for x in chromosome_sizes if '_random' not in x[0]]
+    names = [x[0] for x in placed]
+    weights = list(accumulate(x[1] for x in placed))
+    order = dict((x, i) for i, x in enumerate(names))
+    mu = math.log(ROI_MEAN_LENGTH) - LENGTH_SIGMA ** 2 / 2
+    lengths = dict(placed)
+
+    region_list = []
+    for chromosome in _choices(rng, names, weights, count):
+        start = rng.randrange(lengths[chromosome])
+        end = min(lengths[chromosome], start + 1 + \
+            int(rng.lognormvariate(mu, LENGTH_SIGMA)))
+        region_list.append((chromosome, start, end))
+
+    region_list.sort(key=lambda x: (order[x[0]], x[1]))
+    return([('peak%d' % i, chromosome, start, end) \
+        for i, (chromosome, start, end) in enumerate(region_list)])
+
+def writegff(filename, region_list):
+    """
+    Take filename and regions() output.  Write GFF3 file.  Return nothing.
+    """
+
+    with open(filename, 'w') as f:
+        f.write('##gff-version 3\n')
+        f.writelines('%s\tbenchmark\tregion\t%d\t%d\t.\t+\t.\tID=%s\n' % \
+            (chromosome, start, end, name) \
+            for name, chromosome, start, end in region_list)
+
+def writebed(filename, region_list):
+    """
+    Take filename and regions() output.  Write BED file.  Return nothing.
+    """
+
+    with open(filename, 'w') as f:
+        f.write('track name=benchmark\n')
+        f.writelines('%s\t%d\t%d\t%s\t0\t+\n' % \
+            (chromosome, start, end, name) \
+            for name, chromosome, start, end in region_list)
+
+def config(filename, rules, rng):
+    """
+    Take filename, number of extra rules and random.Random.
+    Write config file.  Return nothing.
+
+    The rules of config/example.conf come first, so generated TE labels are
+    folded as they would be in practice.  The extra rules use every form the
+    grammar allows:  '=' and ':', explicit classes and class/subclass pairs,
+    $ and * wildcards, comment lines and trailing comments.  Their classes
+    are named 'Synthetic...', so they match no generated TE.
+    """
+
+    lines = ['# Generated by benchmarks.generate',
+        '',
+        'Unknown = Unclassified',
+        'Other = Unclassified',
+        'RC?/Helitron? = RC',
+        'RC/Helitron = RC',
+        'DNA? = DNA',
+        'SINE? = SINE',
+        'LTR? = LTR',
+        'rRNA = Small_RNA',
+        'srpRNA = Small_RNA',
+        'tRNA = Small_RNA',
+        'scRNA = Small_RNA',
+        'snRNA = Small_RNA',
+        '']
+
+    for i in range(rules):
+        form = rng.randrange(6)
+        if form == 0:
+            lines.append('Synthetic%d = Unclassified' % i)
+        elif form == 1:
+            lines.append('Synthetic%d / Sub%d : Synthetic%d' % (i, i, i))
+        elif form == 2:
+            lines.append('$/SyntheticSub%d = $/Sub%d' % (i, i))
+        elif form == 3:
+            lines.append('Synthetic%d/* : Renamed%d/*' % (i, i))
+        elif form == 4:
+            lines.append('Synthetic%d/Sub%d = Other%d/Sub%d  # trailing' % \
+                (i, i, i, i))
+        else:
+            lines.append('; comment %d' % i)
+
+    with open(filename, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+def matrix(filename, region_count, rng):
+    """
+    Take filename, number of regions and random.Random.
+    Write matrix in the layout of MXROI output.  Return nothing.
+
+    Rows are class rows and class/subclass rows made from the generated TE
+    labels, and most values are 0.0.
+    """
+
+    rows = []
+    classes = []
+    for label, x, y in TE_FAMILIES:
+        if '/' in label:
+            name, subclass = label.split('/', 1)
+        else:
+            name, subclass = label, 'No subclass'
+        name = name.rstrip('?')
+        if name not in classes:
+            classes.append(name)
+            rows.append('[%s]' % name)
+        rows.append('%s/%s' % (name, subclass.rstrip('?')))
+
+    with open(filename, 'w') as f:
+        f.write('Class\t' + '\t'.join('peak%d' % i \
+            for i in range(region_count)) + '\n')
+        for row in rows:
+            values = [('%.5f' % (rng.random() * 100)) \
+                if rng.random() < 0.1 else '0.0' \
+                for x in range(region_count)]
+            f.write(row + '\t' + '\t'.join(values) + '\n')
+
+def _choices(rng, population, cumulative, count):
+    """
+    Take random.Random, population, cumulative weights and count.
+    Return list of count members drawn with replacement.
+    """
+
+    total = cumulative[-1]
+    return([population[bisect_right(cumulative, rng.random() * total)] \
+        for x in range(count)])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python3 -m benchmarks.generate',
+        description='Write a synthetic RepCalc data set.')
+    parser.add_argument('directory')
+    parser.add_argument('--size', choices=sorted(SIZES, key=SIZES.get),
+        default='tiny')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    manifest = dataset(args.directory, args.size, args.seed)
+    json.dump(manifest, sys.stdout, indent=2, sort_keys=True)
+    print()
+    return(0)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,270 @@
+"""
+loadtest.py:  Throughput and latency of the resident analysis server
+
+Starts modules/rcserver.py on a generated data set, then sends requests
+from --clients threads, each with its own connection, as fast as answers
+come back.  Requests draw RoIs at random from the data set's BED file:
+one region per query request, --regions per density or matrix request.
+Nothing is fetched over the network; the server listens on a Unix socket
+in a temporary directory, or on a local TCP port with --tcp.
+
+The report holds requests per second and latency percentiles in
+milliseconds, with the environment and data set as in run.py reports.
+
+Usage, from the RepCalc directory:
+    python3 -m benchmarks.loadtest --size small --op density --clients 8
+
+Manifest:
+    main(argv)
+        Command line entry point.
+    loadtest(address, requests, clients, warmup)
+        Sends requests from client threads; returns latencies and errors.
+    makerequests(data, op, count, regions, seed)
+        Returns list of (op, fields) request arguments.
+    summarize(latencies, seconds)
+        Returns throughput and latency percentiles.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import benchmarks.generate as bg
+import benchmarks.run as br
+import modules.rcclient as rcn
+
+REPORT_FORMAT = 1
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python3 -m benchmarks.loadtest',
+        description='Load test the RepCalc server and write a JSON report.')
+    parser.add_argument('--size', choices=sorted(bg.SIZES, key=bg.SIZES.get),
+        default='tiny')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--data', default=None,
+        help='data set directory (default: bench_data/SIZE-SEED)')
+    parser.add_argument('--op', choices=['query', 'density', 'matrix'],
+        default='query')
+    parser.add_argument('--regions', type=int, default=10,
+        help='RoIs per density or matrix request')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--warmup', type=int, default=50,
+        help='untimed requests sent first')
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=None,
+        help='server analysis threads (default: number of CPUs)')
+    parser.add_argument('--tcp', action='store_true',
+        help='use a local TCP port instead of a Unix socket')
+    parser.add_argument('--out', default=None,
+        help='report file (default: standard output)')
+    args = parser.parse_args(argv)
+
+    directory = args.data or os.path.join(br.ROOT, 'bench_data', \
+        '%s-%d' % (args.size, args.seed))
+    print("Preparing %s data set in %s" % (args.size, directory), \
+        file=sys.stderr)
+    bg.dataset(directory, args.size, args.seed)
+    data = bg.load(directory)
+
+    requests = makerequests(data, args.op, args.warmup + args.requests, \
+        args.regions, args.seed)
+
+    scratch = tempfile.mkdtemp(prefix='repcalc-loadtest-')
+    command = [sys.executable, '-m', 'modules.rcserver',
+        '--te', 'bench=' + data['paths']['te'],
+        '--config', 'bench=' + data['paths']['config']]
+    if args.tcp:
+        command += ['--port', '0']
+    else:
+        command += ['--socket', os.path.join(scratch, 'server.sock')]
+    if args.workers:
+        command += ['--workers', str(args.workers)]
+
+    print("Starting server", file=sys.stderr)
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=br.ROOT, stdout=subprocess.PIPE)
+    try:
+        address = _listening(process)
+        startup = time.perf_counter() - started
+
+        print("Sending %d requests from %d clients" % (args.requests, \
+            args.clients), file=sys.stderr)
+        latencies, errors, seconds = loadtest(address, requests, \
+            args.clients, args.warmup)
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    del data['paths']
+    report = {'format': REPORT_FORMAT,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'environment': br.environment(),
+        'dataset': data,
+        'settings': {'op': args.op,
+            'regions': args.regions if args.op != 'query' else 1,
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'clients': args.clients,
+            'workers': args.workers,
+            'transport': 'tcp' if args.tcp else 'unix'},
+        'startup seconds': startup,
+        'errors': len(errors),
+        'first errors': errors[:10],
+        'results': summarize(latencies, seconds)}
+
+    text = json.dumps(report, indent=2, sort_keys=True) + '\n'
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+    return(1 if errors else 0)
+
+def makerequests(data, op, count, regions, seed):
+    """
+    Take data set manifest from generate.load(), op, number of requests,
+    RoIs per request and seed.  Return list of (op, fields).
+    """
+
+    rng = random.Random(seed)
+    # The BED file has one track line, then name in column 3.
+    rois = rcn.readregions(data['paths']['bed'], (3, 0, 1, 2))
+
+    requests = []
+    for i in range(count):
+        if op == 'query':
+            label, chromosome, start, end = rng.choice(rois)
+            requests.append(('query', {'te': 'bench',
+                'region': '%s:%d-%d' % (chromosome, start, end)}))
+        else:
+            chosen = rng.sample(rois, min(regions, len(rois)))
+            fields = {'te': 'bench', 'regions': chosen}
+            if op == 'density':
+                fields['length'] = sum(x[3] - x[2] for x in chosen) or 1
+            requests.append((op, fields))
+    return(requests)
+
+def loadtest(address, requests, clients, warmup=0):
+    """
+    Take server address, list of (op, fields), number of client threads
+    and number of untimed requests.  Send every request once.
+
+    address is a Unix socket path, or (host, port).  Return (latencies in
+    seconds of timed requests, list of error strings, seconds taken by
+    timed requests).
+    """
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    queue = list(reversed(requests[warmup:]))
+    warm = list(reversed(requests[:warmup]))
+    begin = threading.Barrier(clients + 1)
+
+    def connect():
+        if isinstance(address, tuple):
+            return(rcn.Client(address[0], address[1]))
+        return(rcn.Client(path=address))
+
+    def take(pending):
+        with lock:
+            if pending:
+                return(pending.pop())
+        return(None)
+
+    def client():
+        try:
+            connection = connect()
+        except OSError as ex:
+            with lock:
+                errors.append('connect:  %s' % ex)
+            begin.wait()
+            return
+
+        with connection:
+            request = take(warm)
+            while request is not None:
+                try:
+                    connection.request(request[0], **request[1])
+                except rcn.ServerError as ex:
+                    with lock:
+                        errors.append(str(ex))
+                request = take(warm)
+
+            begin.wait()
+            request = take(queue)
+            while request is not None:
+                started = time.perf_counter()
+                try:
+                    connection.request(request[0], **request[1])
+                except (rcn.ServerError, ConnectionError) as ex:
+                    with lock:
+                        errors.append(str(ex))
+                else:
+                    latency = time.perf_counter() - started
+                    with lock:
+                        latencies.append(latency)
+                request = take(queue)
+
+    threads = [threading.Thread(target=client) for x in range(clients)]
+    for thread in threads:
+        thread.start()
+    begin.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return(latencies, errors, time.perf_counter() - started)
+
+def summarize(latencies, seconds):
+    """
+    Take latencies and total seconds.  Return dict of requests per second
+    and latency mean, percentiles and maximum in milliseconds.
+    """
+
+    summary = {'requests': len(latencies),
+        'seconds': seconds,
+        'requests per second': len(latencies) / seconds if seconds else None}
+    if not latencies:
+        return(summary)
+
+    ordered = sorted(latencies)
+    summary['mean ms'] = 1000.0 * sum(ordered) / len(ordered)
+    for name, fraction in [('min', 0.0), ('p50', 0.5), ('p90', 0.9), \
+        ('p99', 0.99), ('p99.9', 0.999), ('max', 1.0)]:
+        summary[name + ' ms'] = 1000.0 * _percentile(ordered, fraction)
+    return(summary)
+
+def _percentile(ordered, fraction):
+    """
+    Take sorted list and fraction.  Return the nearest-rank percentile.
+    """
+
+    rank = int(round(fraction * (len(ordered) - 1)))
+    return(ordered[rank])
+
+def _listening(process):
+    """
+    Take server process.  Wait for its "Listening on" line.  Return the
+    address it gives, as a socket path or (host, port).
+    """
+
+    for line in process.stdout:
+        line = line.decode()
+        if line.startswith('Listening on '):
+            address = line[len('Listening on '):].strip()
+            if address.startswith('/'):
+                return(address)
+            host, port = address.rsplit(':', 1)
+            return((host, int(port)))
+    raise RuntimeError("Server exited with status %s." % process.wait())
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""
+run.py:  Run benchmark scenarios and write a JSON report
+
+Each run of each scenario is a fresh Python process, so imports are paid
+before timing starts and peak memory belongs to that one run.  Nothing is
+fetched over the network; data sets are generated locally and kept in
+--data, by default bench_data/ in the RepCalc directory, for later runs.
+
+The report records the commit, Python, NumPy and platform alongside the
+data set manifest, so reports from different commits can be checked for
+comparability by compare.py.
+
+Manifest:
+    main(argv)
+        Command line entry point.
+    runall(names, directory, settings, repeat)
+        Returns {Scenario}>Summary of repeat runs.
+    environment()
+        Returns dict describing this machine, Python and commit.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import tempfile
+
+import benchmarks.generate as bg
+import benchmarks.scenarios as bs
+
+REPORT_FORMAT = 1
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python3 -m benchmarks.run',
+        description='Run RepCalc benchmarks and write a JSON report.')
+    parser.add_argument('--size', choices=sorted(bg.SIZES, key=bg.SIZES.get),
+        default='tiny')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--data', default=None,
+        help='data set directory (default: bench_data/SIZE-SEED)')
+    parser.add_argument('--scenario', action='append', default=None,
+        choices=list(bs.SCENARIOS),
+        help='scenario to run; may be repeated (default: all)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--jobs', type=int, default=1)
+    parser.add_argument('--cache-dir', default=None,
+        help='use the TE index cache in this directory (default: off)')
+    parser.add_argument('--tracemalloc', action='store_true',
+        help='also record peak memory traced by Python; slows runs')
+    parser.add_argument('--out', default=None,
+        help='report file (default: standard output)')
+    parser.add_argument('--child', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        return(_child(*args.child))
+
+    directory = args.data or os.path.join(ROOT, 'bench_data', \
+        '%s-%d' % (args.size, args.seed))
+    settings = {'jobs': args.jobs,
+        'cache': args.cache_dir,
+        'tracemalloc': args.tracemalloc}
+
+    print("Preparing %s data set in %s" % (args.size, directory), \
+        file=sys.stderr)
+    manifest = bg.dataset(directory, args.size, args.seed)
+
+    names = args.scenario or list(bs.SCENARIOS)
+    report = {'format': REPORT_FORMAT,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'environment': environment(),
+        'dataset': manifest,
+        'settings': dict(settings, repeat=args.repeat),
+        'scenarios': runall(names, directory, settings, args.repeat)}
+
+    text = json.dumps(report, indent=2, sort_keys=True) + '\n'
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+
+    failed = [x for x in names if report['scenarios'][x]['status'] != 'ok']
+    return(1 if failed else 0)
+
+def runall(names, directory, settings, repeat):
+    """
+    Take scenario names, data set directory, settings and repeat count.
+    Return {Scenario}>Summary.
+
+    A summary holds every run's measurements, the minimum and median of
+    seconds, and the largest peak memory seen.  A scenario whose process
+    fails, or whose analysis returns a nonzero result code, is not run
+    again, and its summary holds the error.
+    """
+
+    summaries = {}
+    for name in names:
+        runs = []
+        error = None
+        for i in range(repeat):
+            print("%s, run %d of %d" % (name, i + 1, repeat), file=sys.stderr)
+            measured, error = _spawn(name, directory, settings)
+            if error is None and measured['result'] != 0:
+                error = 'result code %d' % measured['result']
+            if error is not None:
+                break
+            runs.append(measured)
+
+        summary = {'status': 'ok' if error is None else 'failed',
+            'error': error,
+            'runs': runs}
+        if runs:
+            seconds = sorted(x['seconds'] for x in runs)
+            summary['min seconds'] = seconds[0]
+            summary['median seconds'] = _median(seconds)
+            summary['median cpu seconds'] = \
+                _median(sorted(x['cpu seconds'] for x in runs))
+            for key in ['peak rss', 'children peak rss', 'traced peak']:
+                values = [x[key] for x in runs if x[key] is not None]
+                summary[key] = max(values) if values else None
+        summaries[name] = summary
+    return(summaries)
+
+def environment():
+    """
+    Return dict describing Python, NumPy, the machine and the commit.
+    """
+
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+
+    status = _git('status', '--porcelain', '--untracked-files=no')
+    return({'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'numpy': numpy_version,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'commit': _git('rev-parse', 'HEAD'),
+        'dirty': None if status is None else status != ''})
+
+def _spawn(name, directory, settings):
+    """
+    Take scenario name, data set directory and settings.  Run scenario once
+    in a new process.  Return (measurements, None) or (None, error text).
+    """
+
+    handle, result_path = tempfile.mkstemp(prefix='repcalc-bench-', \
+        suffix='.json')
+    os.close(handle)
+    command = [sys.executable, '-m', 'benchmarks.run', '--child', name, \
+        os.path.abspath(directory), result_path]
+    environ = dict(os.environ)
+    environ['REPCALC_BENCH_SETTINGS'] = json.dumps(settings)
+
+    try:
+        process = subprocess.Popen(command, cwd=ROOT, env=environ, \
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0].decode(errors='replace')
+        if process.returncode != 0:
+            lines = output.strip().splitlines()
+            return(None, lines[-1] if lines else \
+                'exit status %d' % process.returncode)
+        with open(result_path, 'r') as f:
+            return(json.load(f), None)
+    finally:
+        os.remove(result_path)
+
+def _child(name, directory, result_path):
+    """
+    Take scenario name, data set directory and result file.  Run scenario
+    and write its measurements to the result file.  Return exit status.
+    """
+
+    settings = json.loads(os.environ.get('REPCALC_BENCH_SETTINGS', '{}'))
+    measured = bs.runscenario(name, directory, settings)
+    with open(result_path, 'w') as f:
+        json.dump(measured, f)
+    return(0)
+
+def _git(*args):
+    """
+    Take git arguments.  Return git's stripped output in the RepCalc
+    directory, or None if git is missing or fails.
+    """
+
+    try:
+        output = subprocess.check_output(('git',) + args, cwd=ROOT, \
+            stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return(None)
+    return(output.decode().strip())
+
+def _median(values):
+    """
+    Take sorted list of numbers.  Return their median.
+    """
+
+    middle = len(values) // 2
+    if len(values) % 2:
+        return(values[middle])
+    return((values[middle - 1] + values[middle]) / 2.0)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+scenarios.py:  Timed RepCalc benchmark scenarios
+
+A scenario takes the data set from generate.dataset(), a scratch directory
+and the run settings, does its setup, and returns a function of no
+arguments.  Only that function is timed.  Outputs are written to the
+scratch directory, which the caller removes.
+
+Scenarios call the analysis functions with the arguments the command line
+would give them, so option and argument handling is timed as well.
+
+Manifest:
+    SCENARIOS
+        Ordered {Name}>Setup function.
+    runscenario(name, directory, settings)
+        Runs one scenario once in this process.  Returns measurements.
+"""
+
+import gc
+import os
+import sys
+import time
+import shutil
+import tempfile
+import tracemalloc
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import modules.rcfuncs as rcf
+import benchmarks.generate as bg
+
+def options(letters, settings):
+    """
+    Take option letters and run settings.  Return opt_dict as repcalc.py
+    builds it.
+    """
+
+    opt_dict = dict((x, x in letters) for x in 'abcqABst')
+    opt_dict['jobs'] = settings.get('jobs', 1)
+    opt_dict['cache'] = settings.get('cache')
+    opt_dict['batch'] = False
+    return(opt_dict)
+
+def getconfig(data, scratch, settings):
+    filename = data['paths']['config']
+    return(lambda: rcf.getconfig(filename))
+
+def analysisA(data, scratch, settings):
+    args = [str(data['genome length']), data['paths']['te'], '0', '2', '3',
+        os.path.join(scratch, 'wg.tbl'), data['paths']['config']]
+    opt_dict = options('aA', settings)
+    return(lambda: rcf.analysisA(args, opt_dict))
+
+def analysisB(data, scratch, settings):
+    args = [str(data['roi length']), data['paths']['te'], '0', '1', '2', '3',
+        data['paths']['gff'], '0', '3', '4',
+        os.path.join(scratch, 'roi.tbl'), data['paths']['config']]
+    opt_dict = options('bAB', settings)
+    return(lambda: rcf.analysisB(args, opt_dict))
+
+def analysisB_bed(data, scratch, settings):
+    args = [str(data['roi length']), data['paths']['te'], '0', '1', '2', '3',
+        data['paths']['bed'], '0', '1', '2',
+        os.path.join(scratch, 'roi.tbl'), data['paths']['config']]
+    opt_dict = options('bAB', settings)
+    return(lambda: rcf.analysisB(args, opt_dict))
+
+def analysisC(data, scratch, settings):
+    args = [data['paths']['te'], '0', '1', '2', '3',
+        data['paths']['gff'], '8', '0', '3', '4',
+        os.path.join(scratch, 'mxroi.txt'), data['paths']['config']]
+    opt_dict = options('cAB', settings)
+    return(lambda: rcf.analysisC(args, opt_dict))
+
+def analysisC_bed(data, scratch, settings):
+    args = [data['paths']['te'], '0', '1', '2', '3',
+        data['paths']['bed'], '3', '0', '1', '2',
+        os.path.join(scratch, 'mxroi.txt'), data['paths']['config']]
+    opt_dict = options('cAB', settings)
+    return(lambda: rcf.analysisC(args, opt_dict))
+
+def transpose(data, scratch, settings):
+    # transpose() rewrites its input, so work on a copy.
+    filename = os.path.join(scratch, 'matrix.txt')
+    shutil.copyfile(data['paths']['matrix'], filename)
+    return(lambda: rcf.transpose(filename))
+
+SCENARIOS = OrderedDict([
+    ('getconfig', getconfig),
+    ('analysisA', analysisA),
+    ('analysisB', analysisB),
+    ('analysisB-bed', analysisB_bed),
+    ('analysisC', analysisC),
+    ('analysisC-bed', analysisC_bed),
+    ('transpose', transpose)])
+
+def runscenario(name, directory, settings):
+    """
+    Take scenario name, data set directory and settings.  Return dict of
+    measurements:  seconds, cpu seconds, result, peak resident memory of
+    this process before and after the timed call and of its children, and,
+    if settings['tracemalloc'] is set, peak memory traced by Python.
+
+    Resident memory is in bytes, or None where the resource module is
+    missing.  The process should be fresh, as peak resident memory is never
+    reset.
+    """
+
+    data = bg.load(directory)
+
+    scratch = tempfile.mkdtemp(prefix='repcalc-bench-')
+    try:
+        function = SCENARIOS[name](data, scratch, settings)
+        gc.collect()
+        baseline = _peakrss(False)
+
+        if settings.get('tracemalloc'):
+            tracemalloc.start()
+        cpu = time.process_time()
+        start = time.perf_counter()
+        result = function()
+        seconds = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+        traced = None
+        if settings.get('tracemalloc'):
+            traced = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    return({'seconds': seconds,
+        'cpu seconds': cpu,
+        'result': result if isinstance(result, int) else 0,
+        'baseline rss': baseline,
+        'peak rss': _peakrss(False),
+        'children peak rss': _peakrss(True),
+        'traced peak': traced})
+
+def _peakrss(children):
+    """
+    Take whether to ask for child processes.  Return peak resident memory
+    in bytes, or None.
+    """
+
+    if resource is None:
+        return(None)
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    if sys.platform != 'darwin':
+        peak *= 1024
+    return(peak)
@@ -0,0 +1,486 @@
+"""
+rcapi.py:  In-memory Python API for RepCalc analyses
+
+The analyses of rcfuncs.py read files and write files.  The functions here
+take TE and RoI records already in memory and return result objects, so a
+pipeline can run many analyses in one process without temporary files.
+They run the same overlap and totalling code as the file analyses, and
+results match theirs exactly.  Writing a result to a file is a call to its
+write() method, which uses the same writers as the file analyses.
+
+TE records are (class label, chromosome, start, end), e.g.
+('LINE/L1?', 'chr1', 10000, 10468).  RoI records are (label, chromosome,
+start, end).  Instead of records, a dict of equal-length sequences or
+NumPy arrays may be given:  'classes', 'chromosomes', 'starts' and 'ends'
+for TEs, 'labels', 'chromosomes', 'starts' and 'ends' for RoIs.  As in the
+file analyses, chromosome labels are stripped of 'chr', and TEs on
+'_random' chromosomes are left out.
+
+Use:
+    config = rcapi.compileconfig(['RC/* : RC'])
+    tes = rcapi.TEData(records, config)
+    table = tes.density(rcapi.Regions(rois), length=1000000)
+    for row in table.rows():
+        print(row.superclass, row.subclass, row.frequency, row.percent)
+    matrix = tes.matrix(rcapi.Regions(rois))
+    labels, values = matrix.array()
+TEData and Regions parse their records once, and may be reused for any
+number of analyses and queries.
+
+Manifest:
+    compileconfig(lines)
+        Returns ConfigResolver of replacements in config lines.
+    TEData(tes, config)
+        Parsed TE records; runs analyses against them.
+    readte(fas_filename, config, columns, cache_dir)
+        Reads TE data file; returns TEData.
+    Regions(rois)
+        Parsed RoI records.
+    ClassRow(superclass, subclass, frequency, length, percent)
+        One row of a ClassTable.
+    ClassTable(totals, length)
+        Result of WG, ROI and region queries:  totals per class.
+    Matrix(region_dict, region_keys, registry)
+        Result of MXROI:  %-overlaps by class and RoI.
+    genome(tes, config, length)
+        Returns TEData(tes, config).genome(length).
+    density(tes, rois, config, length, jobs)
+        Returns TEData(tes, config).density(rois, length, jobs).
+    matrix(tes, rois, config, jobs)
+        Returns TEData(tes, config).matrix(rois, jobs).
+"""
+
+from collections import namedtuple
+from collections.abc import Mapping
+import modules.rcfuncs as rcf
+import modules.rcindex as rci
+import modules.rccolumns as rcc
+import modules.rcclasses as rcl
+import modules.rcquery as rcq
+
+def compileconfig(lines):
+    """
+    Take config lines, in the config file grammar.  Return ConfigResolver.
+
+    A ConfigResolver may be shared by any number of TEData.
+    """
+
+    if isinstance(lines, str):
+        lines = lines.splitlines()
+    return(rcf.parseconfig(lines, '<config>'))
+
+class TEData(object):
+    """
+    Parsed TE records, and the analyses run against them.
+
+    config is a ConfigResolver, e.g. from compileconfig() or
+    rcfuncs.getconfig(), or None to replace nothing.  Class labels are
+    classified once each, when the records are parsed.
+
+    With NumPy, records are held as rccolumns.TEColumns.  Otherwise they
+    are held as rcfuncs.fasbatch() holds them.
+    """
+
+    def __init__(self, tes, config=None):
+        if config is None:
+            config = rcf.ConfigResolver()
+        self.registry = rcf.classregistry(config)
+        labels, chromosomes, starts, ends = _fields(tes, 'classes')
+
+        if rcc.HAVE_NUMPY:
+            self.te = _tecolumns(labels, chromosomes, starts, ends, \
+                self.registry)
+        else:
+            self.te = [(chromosome.strip('chr'), int(start), int(end), \
+                self.registry.code(label)) for label, chromosome, start, end \
+                in zip(labels, chromosomes, starts, ends) \
+                if "_random" not in chromosome]
+
+        # fasmatrix() form of te, and RegionIndex on it, built when needed
+        self.te_dict = None
+        self.index = None
+
+    def __len__(self):
+        return(len(self.te))
+
+    def genome(self, length=None):
+        """
+        Take genome length or None.  Return ClassTable of whole-genome
+        totals {TEClass}>{Subclass}>[Frequency, Length], as WG.
+        """
+
+        if rcc.HAVE_NUMPY:
+            return(ClassTable(rcc.genomeclasses(self.te), length))
+
+        totals = rcl.ClassTotals(self.registry)
+        for chromosome, this_start, this_end, category in self.te:
+            totals.add(category, this_end - this_start)
+        return(ClassTable(totals, length))
+
+    def density(self, rois, length=None, jobs=1, merge=False):
+        """
+        Take Regions or RoI records, total RoI length or None, and job count.
+        Return ClassTable of overlap totals {TEClass}>{Subclass}>[Frequency,
+        OverlapLength], as ROI.
+
+        With merge, overlapping RoIs are merged first, as by repcalc.py
+        --merge.  Use rois.length() for the length of the merged RoIs.
+        """
+
+        rois = _regions(rois)
+        return(ClassTable(rcf.densitybatch(self.te, rois.chromosomes(merge), \
+            self.registry, jobs), length))
+
+    def matrix(self, rois, jobs=1):
+        """
+        Take Regions or RoI records, and job count.  Return Matrix of
+        %-overlaps by class and RoI, as MXROI.
+        """
+
+        rois = _regions(rois)
+        region_dict, region_keys = rcf.regionmatrix(rois.regions, \
+            rois.chr_regions, self.ranges(), jobs)
+        return(Matrix(region_dict, region_keys, self.registry))
+
+    def query(self, chromosome, start, end, length=None):
+        """
+        Take region, and length or None.  Return ClassTable of overlap
+        totals, as ROI with [start, end] as the only RoI.
+
+        Answered by rcquery.RegionIndex, built on the first query.  Each
+        later query takes a few binary searches per class.  Rows are in
+        order of first appearance among all TEs, not only those in the
+        region.
+        """
+
+        return(ClassTable(self.regionindex().query(chromosome, start, end), \
+            length))
+
+    def regionindex(self):
+        """
+        Return rcquery.RegionIndex answering query(), building it if needed.
+        """
+
+        if self.index is None:
+            self.index = rcq.RegionIndex(self.ranges(), self.registry)
+        return(self.index)
+
+    def ranges(self):
+        """
+        Return fasmatrix() mapping {Chromosome}>(Starts, Ends, Categories).
+        """
+
+        if self.te_dict is not None:
+            return(self.te_dict)
+
+        if rcc.HAVE_NUMPY:
+            self.te_dict = rcc.matrixranges(self.te)
+            return(self.te_dict)
+
+        # Map chromosome to {category: [[starts], [ends]]}
+        chromosome_ranges = {}
+        for chromosome, this_start, this_end, category in self.te:
+            if chromosome not in chromosome_ranges:
+                chromosome_ranges[chromosome] = {}
+            these_ranges = chromosome_ranges[chromosome]
+            if category not in these_ranges:
+                these_ranges[category] = [[], []]
+            these_ranges[category][0].append(this_start)
+            these_ranges[category][1].append(this_end)
+
+        self.te_dict = rcf._matrixranges(chromosome_ranges, self.registry)
+        return(self.te_dict)
+
+class Regions(object):
+    """
+    Parsed RoI records.
+
+    Attributes:
+        regions:  List of [RoI label, start, end], in record order
+        chr_regions:  Maps chromosome label to list of
+            (start, end, index into regions), as rcfuncs.piregions()
+    """
+
+    def __init__(self, rois):
+        labels, chromosomes, starts, ends = _fields(rois, 'labels')
+
+        self.regions = []
+        self.chr_regions = {}
+        # Map chromosome to [[start, end]] of every RoI, as pidensity()
+        self.chr_ranges = {}
+
+        for label, chromosome, start, end in \
+            zip(labels, chromosomes, starts, ends):
+            chromosome = str(chromosome).strip('chr')
+            start = int(start)
+            end = int(end)
+            self.regions.append([str(label), start, end])
+
+            if chromosome not in self.chr_ranges:
+                self.chr_ranges[chromosome] = []
+            self.chr_ranges[chromosome].append([start, end])
+
+            # A RoI with start > end never overlaps anything.
+            if start <= end:
+                if chromosome not in self.chr_regions:
+                    self.chr_regions[chromosome] = []
+                self.chr_regions[chromosome].append((start, end, \
+                    len(self.regions) - 1))
+
+        # pidensity() form, built when needed, without and with merging
+        self.index = {}
+
+    def __len__(self):
+        return(len(self.regions))
+
+    def chromosomes(self, merge=False):
+        """
+        Return pidensity() mapping {Chromosome Label}>IntervalIndex.
+
+        With merge, overlapping RoIs are merged by rcindex.mergeintervals().
+        """
+
+        merge = bool(merge)
+        if merge not in self.index:
+            self.index[merge] = {}
+            for chromosome, ranges in self.chr_ranges.items():
+                if merge:
+                    ranges = rci.mergeintervals(ranges)
+                self.index[merge][chromosome] = rci.IntervalIndex(ranges)
+        return(self.index[merge])
+
+    def length(self):
+        """
+        Return total length of the RoIs in bp, each bp counted once.
+        """
+
+        return(rcf.roilength(self.chromosomes()))
+
+ClassRow = namedtuple('ClassRow', \
+    ['superclass', 'subclass', 'frequency', 'length', 'percent'])
+
+class ClassTable(object):
+    """
+    Totals per class and subclass, as written to a .tbl file.
+
+    totals is an rcclasses.ClassTotals, read as a mapping
+    {TEClass}>{Subclass}>[Frequency, Length].  length is the genome or RoI
+    length that percentages are of, or None.
+    """
+
+    def __init__(self, totals, length=None):
+        self.totals = totals
+        self.length = length
+
+    def rows(self):
+        """
+        Return list of ClassRow, classes and subclasses in order of first
+        appearance.  percent is 100 * length / self.length, unrounded, or
+        None without a length.
+        """
+
+        rows = []
+        for this_class, codes in self.totals.registry.byclass( \
+            self.totals.order):
+            for category in codes:
+                frequency, length = self.totals.total(category)
+                percent = None
+                if self.length:
+                    percent = 100.0 * length / self.length
+                rows.append(ClassRow(this_class, \
+                    self.totals.registry[category][1], frequency, length, \
+                    percent))
+        return(rows)
+
+    def classes(self):
+        """
+        Return {TEClass}>{Subclass}>[Frequency, Length] as nested dicts.
+        """
+
+        return(self.totals.classes())
+
+    def write(self, out_filename, name=''):
+        """
+        Take output filename, and name written as the filename in its
+        header.  Write .tbl file, as WG and ROI do.  Return 0.
+
+        A length is required.
+        """
+
+        if not self.length:
+            raise ValueError("A length is required to write a .tbl file.")
+        rcf.writetbl(name, out_filename, self.totals, self.length)
+        return(0)
+
+class Matrix(object):
+    """
+    Percent overlaps by class and RoI, as pimatrix() returns them.
+
+    Attributes:
+        region_dict:  Maps category code to {column: %-overlap}
+        regions:  List of RoI labels; column indexes it.  RoIs without any
+            overlap are left out, as in MXROI output.
+        registry:  CategoryRegistry of category codes
+    """
+
+    def __init__(self, region_dict, region_keys, registry):
+        self.region_dict = region_dict
+        self.regions = region_keys
+        self.registry = registry
+
+    def rows(self):
+        """
+        Return list of (row label, [%-overlap per RoI]), rows as in MXROI
+        output:  "[Class]" totals, each followed by "Class/Subclass" rows if
+        it has more than one subclass.  Values are unrounded.
+        """
+
+        columns = range(len(self.regions))
+        return([(label, [cells.get(x, 0.0) for x in columns]) \
+            for label, cells in rcf._matrixrows(self.region_dict, \
+            self.registry)])
+
+    def array(self):
+        """
+        Return (row labels, values) of rows().  values is a 2-D NumPy array,
+        one row per label and one column per RoI, or a list of lists
+        without NumPy.
+        """
+
+        rows = self.rows()
+        labels = [x[0] for x in rows]
+        values = [x[1] for x in rows]
+        if rcc.HAVE_NUMPY:
+            values = rcc.np.array(values, dtype=rcc.np.float64).reshape( \
+                len(labels), len(self.regions))
+        return(labels, values)
+
+    def cells(self):
+        """
+        Return list of (class, subclass, RoI label, %-overlap), one per
+        subclass and RoI with a nonzero %-overlap, in sparse output order.
+        """
+
+        cells = []
+        for this_class, codes in self.registry.byclass(self.region_dict):
+            for category in codes:
+                row = self.region_dict[category]
+                for column in sorted(row):
+                    cells.append((this_class, self.registry[category][1], \
+                        self.regions[column], row[column]))
+        return(cells)
+
+    def write(self, out_filename, transposed=False, sparse=False):
+        """
+        Take output filename and output options, as -t and -s.  Write
+        output as MXROI does.  Return 0.
+        """
+
+        return(rcf.writematrix(out_filename, self.region_dict, self.regions, \
+            self.registry, {'t': transposed, 's': sparse}))
+
+def readte(fas_filename, config=None, columns=(0, 1, 2, 3), cache_dir=None):
+    """
+    Take TE data file, config, column indices of [class, chromosome, start,
+    end] and index file directory, as for rcfuncs.fasdensity().  Return
+    TEData of the file's records.
+    """
+
+    data = TEData([], config)
+    data.te = rcf.fasbatch(fas_filename, data.registry, list(columns), \
+        cache_dir)
+    return(data)
+
+def genome(tes, config=None, length=None):
+    """
+    Take TE records, config and genome length.  Return ClassTable, as WG.
+    """
+
+    return(_tedata(tes, config).genome(length))
+
+def density(tes, rois, config=None, length=None, jobs=1):
+    """
+    Take TE records, RoI records, config, RoI length and job count.
+    Return ClassTable, as ROI.
+    """
+
+    return(_tedata(tes, config).density(rois, length, jobs))
+
+def matrix(tes, rois, config=None, jobs=1):
+    """
+    Take TE records, RoI records, config and job count.  Return Matrix,
+    as MXROI.
+    """
+
+    return(_tedata(tes, config).matrix(rois, jobs))
+
+def _tedata(tes, config):
+    """
+    Take TEData or TE records, and config.  Return TEData.
+
+    config is ignored for TEData, which was classified when made.
+    """
+
+    if isinstance(tes, TEData):
+        return(tes)
+    return(TEData(tes, config))
+
+def _regions(rois):
+    """
+    Take Regions or RoI records.  Return Regions.
+    """
+
+    if isinstance(rois, Regions):
+        return(rois)
+    return(Regions(rois))
+
+def _fields(records, label_key):
+    """
+    Take records, or a dict of sequences, and the dict's key for labels.
+    Return (labels, chromosomes, starts, ends) sequences.
+    """
+
+    if isinstance(records, Mapping):
+        return(records[label_key], records['chromosomes'], \
+            records['starts'], records['ends'])
+
+    fields = list(zip(*records))
+    if not fields:
+        return([], [], [], [])
+    if len(fields) != 4:
+        raise ValueError("Records must have 4 fields.")
+    return(fields)
+
+def _tecolumns(labels, chromosomes, starts, ends, registry):
+    """
+    Take TE field sequences and CategoryRegistry.  Return TEColumns, as
+    rccolumns.loadcolumns() returns for a file of the same records.
+    """
+
+    np = rcc.np
+    class_codes, class_labels = _labelcodes(labels)
+    chromosome_codes, chromosome_labels = _labelcodes(chromosomes)
+    parts = {'starts': np.asarray(starts, dtype=np.int64),
+        'ends': np.asarray(ends, dtype=np.int64),
+        'chromosomes': chromosome_codes,
+        'classes': class_codes}
+    return(rcc.buildcolumns(parts, chromosome_labels, class_labels, registry))
+
+def _labelcodes(labels):
+    """
+    Take sequence of labels.  Return (int32 code per label, distinct
+    labels).  Codes are given in order of first appearance, as the file
+    loader gives them.
+    """
+
+    np = rcc.np
+    labels = np.asarray(labels)
+    if not len(labels):
+        return(np.zeros(0, dtype=np.int32), [])
+
+    distinct, first, inverse = np.unique(labels, return_index=True, \
+        return_inverse=True)
+    order = np.argsort(first)
+    rank = np.zeros(len(order), dtype=np.int32)
+    rank[order] = np.arange(len(order), dtype=np.int32)
+    return(rank[inverse.ravel()], [str(x) for x in distinct[order]])
@@ -0,0 +1,342 @@
+"""
+rcbins.py:  Windowed TE density along the genome
+
+Each chromosome is cut into fixed bins, e.g. of 10 kb, 100 kb or 1 Mb, and
+the bp of every TE are spread over the bins it covers.  A TE is visited
+once per chromosome, not once per bin:  for bin width w, a TE from start to
+end adds w to a difference array at start // w and takes it off again at
+end // w, and adds the partial first and last bins to a second array.  A
+prefix sum of the first array plus the second gives bp per bin, for every
+category of the chromosome at once.  Wider bins that are multiples of a
+narrower one are summed from it rather than computed from TEs again.
+
+Bins are half-open, [start, end), as in bedGraph, and a TE adds to a bin
+the bp the two ranges share.  TEs with end <= start cover no bin, where WG
+would count a negative length, so a class's bins add up to its WG length
+less those.  Without chromosome lengths, a chromosome's last bin ends at
+its last TE end.
+
+Manifest:
+    parsesizes(string)
+        Parses '10k,100k,1M'; returns sorted list of bin widths in bp.
+    sizelabel(size)
+        Returns '10kb', '1Mb' or '2500bp' for a bin width.
+    categoryorder(te_dict)
+        Returns category codes of fasbins() output in order of appearance.
+    chromosomebins(starts, ends, categories, sizes)
+        Returns bp per category and bin of one chromosome, for each width.
+    BinWriter(out_prefix, registry, codes, sizes)
+        Writes bedGraph-style tables of chromosomebins() output, one file
+        per class and bin width.
+"""
+
+import re
+import os
+import modules.rcstats as rcs
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SIZE_PATTERN = re.compile(r'^(\d+)\s*([kKmM]?)[bB]?[pP]?$')
+SIZE_UNITS = {'': 1, 'k': 1000, 'm': 1000000}
+
+# Significant digits of densities written
+DIGITS = 6
+
+def parsesizes(string):
+    """
+    Take comma-separated bin widths, e.g. '10000,100k,1M'.  Return sorted
+    list of distinct widths in bp.
+
+    A width is a positive integer, optionally followed by k or M, and
+    optionally by b or bp.  Raises ValueError on anything else.
+    """
+
+    sizes = set()
+    for part in string.split(','):
+        match = SIZE_PATTERN.match(part.strip())
+        if not match:
+            raise ValueError("Not a bin size:  %r" % part)
+        size = int(match.group(1)) * SIZE_UNITS[match.group(2).lower()]
+        if size < 1:
+            raise ValueError("Not a bin size:  %r" % part)
+        sizes.add(size)
+    return(sorted(sizes))
+
+def sizelabel(size):
+    """
+    Take bin width in bp.  Return it as used in output file names.
+    """
+
+    if size % 1000000 == 0:
+        return(str(size // 1000000) + 'Mb')
+    if size % 1000 == 0:
+        return(str(size // 1000) + 'kb')
+    return(str(size) + 'bp')
+
+###############################################################################
+# Binning
+
+def categoryorder(te_dict):
+    """
+    Take fasbins() output.  Return its category codes in order of first
+    appearance, chromosome by chromosome, as fasgenome() orders classes.
+    """
+
+    codes = []
+    seen = set()
+    for starts, ends, categories in te_dict.values():
+        if np is not None:
+            present, first = np.unique(np.asarray(categories), \
+                return_index=True)
+            categories = present[np.argsort(first)].tolist()
+        for category in categories:
+            if category not in seen:
+                seen.add(category)
+                codes.append(category)
+    return(codes)
+
+def chromosomebins(starts, ends, categories, sizes):
+    """
+    Take TE starts, ends and category codes of one chromosome, and sorted
+    bin widths.  Return (codes, {Width}>Bins, chromosome end).
+
+    codes lists the categories found, in order of first appearance.  Bins
+    holds one row per code, of bp per bin, as a 2-D int64 array with NumPy
+    or a list of lists without.  Rows are as long as needed to reach the
+    chromosome end, the greatest TE end.
+    """
+
+    if np is not None:
+        return(_binsarray(np.asarray(starts, dtype=np.int64), \
+            np.asarray(ends, dtype=np.int64), \
+            np.asarray(categories, dtype=np.int64), sizes))
+    return(_binslist(starts, ends, categories, sizes))
+
+def _binsarray(starts, ends, categories, sizes):
+    """
+    Take int64 arrays of TE starts, ends and categories, and widths.
+    Return chromosomebins() output, computed with NumPy.
+    """
+
+    keep = ends > starts
+    starts = np.maximum(starts[keep], 0)
+    ends = ends[keep]
+    present, first, rows = np.unique(categories[keep], return_index=True, \
+        return_inverse=True)
+    order = np.argsort(first)
+    codes = present[order].tolist()
+    # Renumber rows by order of first appearance
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    rows = rank[rows.reshape(-1)]
+
+    chromosome_end = int(ends.max()) if len(ends) else 0
+    bins = {}
+    for size in sizes:
+        count = -(-chromosome_end // size)
+        factor = _factor(size, bins)
+        if factor:
+            finer = bins[size // factor]
+            padded = np.zeros((len(codes), count * factor), dtype=np.int64)
+            padded[:, :finer.shape[1]] = finer
+            bins[size] = padded.reshape(len(codes), count, factor).sum(axis=2)
+            continue
+
+        # Flat index of (row, bin) with one spare bin per row, for TEs
+        # ending exactly on the chromosome's last bin boundary
+        first_bins = starts // size
+        last_bins = ends // size
+        low = rows * (count + 1) + first_bins
+        high = rows * (count + 1) + last_bins
+        cells = len(codes) * (count + 1)
+        # float64 sums of integer lengths are exact below 2**53 bp.
+        steps = np.bincount(low, minlength=cells) - \
+            np.bincount(high, minlength=cells)
+        partial = np.bincount(high, weights=ends - last_bins * size, \
+            minlength=cells) - np.bincount(low, \
+            weights=starts - first_bins * size, minlength=cells)
+        full = np.cumsum(steps.reshape(len(codes), count + 1), axis=1) * size
+        partial = np.rint(partial).astype(np.int64)
+        bins[size] = (full + partial.reshape(len(codes), count + 1))[:, :count]
+    return(codes, bins, chromosome_end)
+
+def _binslist(starts, ends, categories, sizes):
+    """
+    Take sequences of TE starts, ends and categories, and widths.  Return
+    chromosomebins() output, computed with lists.
+    """
+
+    codes = []
+    row_of = {}
+    tes = []
+    chromosome_end = 0
+    for start, end, category in zip(starts, ends, categories):
+        if end <= start:
+            continue
+        if category not in row_of:
+            row_of[category] = len(codes)
+            codes.append(category)
+        tes.append((max(start, 0), end, row_of[category]))
+        if end > chromosome_end:
+            chromosome_end = end
+
+    bins = {}
+    for size in sizes:
+        count = -(-chromosome_end // size)
+        factor = _factor(size, bins)
+        if factor:
+            bins[size] = [[sum(row[x:x + factor]) \
+                for x in range(0, len(row), factor)] \
+                for row in bins[size // factor]]
+            continue
+
+        steps = [[0] * (count + 1) for x in codes]
+        partial = [[0] * (count + 1) for x in codes]
+        for start, end, row in tes:
+            first_bin = start // size
+            last_bin = end // size
+            steps[row][first_bin] += size
+            steps[row][last_bin] -= size
+            partial[row][first_bin] -= start - first_bin * size
+            partial[row][last_bin] += end - last_bin * size
+
+        rows = []
+        for step_row, partial_row in zip(steps, partial):
+            total = 0
+            row = []
+            for i in range(count):
+                total += step_row[i]
+                row.append(total + partial_row[i])
+            rows.append(row)
+        bins[size] = rows
+    return(codes, bins, chromosome_end)
+
+def _factor(size, bins):
+    """
+    Take bin width and {Width}>Bins computed so far.  Return size divided
+    by the widest computed width that divides it, or 0 if none does.
+    """
+
+    factors = [size // x for x in bins if size % x == 0]
+    if not factors:
+        return(0)
+    return(min(factors))
+
+###############################################################################
+# Output
+
+class BinWriter(object):
+    """
+    Writes bedGraph-style tables of chromosomebins() output.
+
+    One tab-delimited file is written per class and bin width, named
+    out_prefix, the width and the class, e.g. out.100kb.SINE.bedGraph.  Its
+    columns are chromosome, bin start, bin end, the class's density, then
+    one density per subclass, each as the percentage of the bin occupied,
+    as writetbl() reports for the whole genome.  A header line starting
+    with '#' names the columns.  Bins where the class has no TEs are left
+    out, as bedGraph allows, so the first four columns are a bedGraph track.
+
+    codes lists the category codes to write, in the order their classes
+    and subclasses should appear.  Use as a context manager, calling
+    write() once per chromosome.
+    """
+
+    def __init__(self, out_prefix, registry, codes, sizes):
+        self.sizes = sizes
+        # Map category code to (class position, column in that class)
+        self.columns = {}
+        self.classes = []
+        # Number of subclasses of each class
+        self.widths = []
+        headers = []
+        for this_class, class_codes in registry.byclass(codes):
+            for column, code in enumerate(class_codes):
+                self.columns[code] = (len(self.classes), column)
+            self.classes.append(this_class)
+            self.widths.append(len(class_codes))
+            headers.append([this_class] + \
+                [registry[x][1] for x in class_codes])
+
+        self.filenames = {}
+        self.files = {}
+        directory = os.path.dirname(out_prefix)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        try:
+            for size in sizes:
+                for position, this_class in enumerate(self.classes):
+                    filename = '.'.join([out_prefix, sizelabel(size), \
+                        re.sub(r'[^\w.+-]', '_', this_class), 'bedGraph'])
+                    f = open(filename, 'w')
+                    self.files[(size, position)] = f
+                    self.filenames[(size, position)] = filename
+                    f.write('#' + '\t'.join(['chrom', 'start', 'end'] + \
+                        headers[position]) + '\n')
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *args):
+        self.close()
+        return(False)
+
+    def close(self):
+        """
+        Close every output file.  Return nothing.
+        """
+
+        for f in self.files.values():
+            f.close()
+
+    def write(self, chromosome, codes, bins, chromosome_end):
+        """
+        Take chromosome label and its chromosomebins() output.  Write its
+        nonzero bins to every file.  Return number of lines written.
+        """
+
+        lines = 0
+        for size in self.sizes:
+            rows = bins[size]
+            if np is not None:
+                rows = np.asarray(rows).tolist()
+
+            # Group this chromosome's rows by class
+            groups = {}
+            for row, code in zip(rows, codes):
+                position, column = self.columns[code]
+                if position not in groups:
+                    groups[position] = {}
+                groups[position][column] = row
+
+            for position, class_rows in groups.items():
+                table = [class_rows.get(x) for x in \
+                    range(self.widths[position])]
+                out = []
+                for i in range(len(rows[0])):
+                    values = [0 if x is None else x[i] for x in table]
+                    total = sum(values)
+                    if not total:
+                        continue
+                    start = i * size
+                    end = min(start + size, chromosome_end)
+                    out.append('\t'.join([chromosome, str(start), str(end)] + \
+                        [_density(x, end - start) for x in [total] + values]))
+                if out:
+                    self.files[(size, position)].write('\n'.join(out) + '\n')
+                    lines += len(out)
+        rcs.count('bins written', lines)
+        return(lines)
+
+def _density(length, width):
+    """
+    Take bp occupied and bin width.  Return percentage as a string.
+    """
+
+    return('%.*g' % (DIGITS, 100.0 * length / width))
@@ -0,0 +1,205 @@
+"""
+rccache.py:  Persistent binary index of parsed TE annotation data
+
+The first time an annotation file is read with a given column mapping, the
+raw columns from rccolumns.readcolumns() are written to an index file.  Later
+runs map that file into memory instead of parsing text.  Requires NumPy.
+
+Index files are named after the source file and its columns, e.g.
+hg38.fas.0-1-2-3.rcidx, and are written beside the source or into a cache
+directory.  An index is used only if its key still matches:  format version,
+source size, source mtime, a hash of the source's first and last
+SAMPLE_SIZE bytes, and the column mapping.  Class labels are stored as found
+in the file, and config replacement is applied as the index is loaded, so a
+changed config is always honoured without parsing again.
+
+File layout:
+    MAGIC, 8 bytes
+    Header length, 8 bytes, little-endian
+    Header, JSON:  key, labels, and (dtype, offset, length) of each array
+    Arrays, each starting on an ALIGNMENT byte boundary
+
+Manifest:
+    loadcolumns(fas_filename, columns, registry, cache_dir)
+        Returns rccolumns.TEColumns, from the index file when it is current.
+    cachepath(fas_filename, columns, cache_dir)
+        Returns path of index file for a source file and column mapping.
+    sourcekey(fas_filename, columns)
+        Returns dict identifying the current state of a source file.
+    readindex(path, key)
+        Returns readcolumns() output stored at path, or None if stale.
+    writeindex(path, key, parts, chromosome_labels, class_labels)
+        Writes readcolumns() output to path.
+"""
+
+import os
+import sys
+import json
+import struct
+import hashlib
+import modules.rccolumns as rcc
+import modules.rcstats as rcs
+import modules.rcprogress as rcr
+
+MAGIC = b'RCIDX\x00\x00\x01'
+VERSION = 1
+SUFFIX = '.rcidx'
+ALIGNMENT = 64
+# Bytes hashed from each end of the source file.
+SAMPLE_SIZE = 1 << 20
+
+ARRAYS = ['starts', 'ends', 'chromosomes', 'classes']
+
+def loadcolumns(fas_filename, columns, registry, cache_dir):
+    """
+    Take rccolumns.loadcolumns() arguments and cache directory.
+    Return TEColumns.
+
+    With cache_dir None, nothing is cached.  With cache_dir '', the index
+    is kept beside the source file.  An index that cannot be written is
+    skipped with a note; the parse result is returned all the same.
+    """
+
+    if cache_dir is None:
+        return(rcc.loadcolumns(fas_filename, columns, registry))
+
+    path = cachepath(fas_filename, columns, cache_dir)
+    key = sourcekey(fas_filename, columns)
+
+    parsed = readindex(path, key)
+    if parsed is not None:
+        rcs.count('te index rows', len(parsed[0]['starts']))
+        rcr.advance(key['size'])
+    else:
+        parsed = rcc.readcolumns(fas_filename, columns)
+        try:
+            writeindex(path, key, *parsed)
+        except OSError as ex:
+            print("Could not write index file %s:  %s" % (path, ex.strerror))
+
+    return(rcc.buildcolumns(*parsed, registry=registry))
+
+def cachepath(fas_filename, columns, cache_dir):
+    """
+    Take source file, columns and cache directory.  Return index file path.
+
+    Beside the source, the index is named after the source file.  In a
+    shared cache directory, a hash of the source's absolute path is added,
+    so same-named files from different directories do not collide.
+    """
+
+    name = os.path.basename(fas_filename) + '.' + \
+        '-'.join(str(x) for x in columns)
+
+    if not cache_dir:
+        return(os.path.join(os.path.dirname(fas_filename), name + SUFFIX))
+
+    source = os.path.abspath(fas_filename).encode(sys.getfilesystemencoding(), \
+        'surrogateescape')
+    name += '.' + hashlib.sha1(source).hexdigest()[:12]
+    return(os.path.join(cache_dir, name + SUFFIX))
+
+def sourcekey(fas_filename, columns):
+    """
+    Take source file and columns.  Return dict of values an index must match.
+    """
+
+    stat = os.stat(fas_filename)
+    sample = hashlib.sha1()
+    with open(fas_filename, "rb") as f:
+        sample.update(f.read(SAMPLE_SIZE))
+        if stat.st_size > SAMPLE_SIZE:
+            f.seek(max(SAMPLE_SIZE, stat.st_size - SAMPLE_SIZE))
+            sample.update(f.read(SAMPLE_SIZE))
+
+    return({'version': VERSION,
+        'byteorder': sys.byteorder,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+        'sample': sample.hexdigest(),
+        'columns': [int(x) for x in columns]})
+
+def readindex(path, key):
+    """
+    Take index file path and sourcekey() output.
+    Return readcolumns() output, or None if the index is missing or stale.
+
+    Arrays are memory-mapped read-only, not read into memory.
+    """
+
+    np = rcc.np
+
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return(None)
+            header_length, = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(header_length).decode())
+    except (OSError, ValueError, struct.error):
+        return(None)
+
+    if header.get('key') != key:
+        return(None)
+
+    parts = {}
+    for name in ARRAYS:
+        dtype, offset, length = header['arrays'][name]
+        if length:
+            parts[name] = np.memmap(path, dtype=np.dtype(dtype), mode='r', \
+                offset=offset, shape=(length,))
+        else:
+            parts[name] = np.zeros(0, dtype=np.dtype(dtype))
+
+    return(parts, header['chromosome labels'], header['class labels'])
+
+def writeindex(path, key, parts, chromosome_labels, class_labels):
+    """
+    Take index file path, sourcekey() output and readcolumns() output.
+    Write index file.  Return nothing.
+
+    The file is written under a temporary name and renamed into place, so
+    a run that is interrupted, or a concurrent run, never sees half an index.
+    """
+
+    directory = os.path.dirname(path) or '.'
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    # Lay out arrays after the header.  The header holds their offsets, so
+    # its length is fixed first by padding the offset fields to 20 digits.
+    arrays = {}
+    for name in ARRAYS:
+        arrays[name] = [parts[name].dtype.str, 10 ** 19, len(parts[name])]
+    header = {'key': key,
+        'chromosome labels': list(chromosome_labels),
+        'class labels': list(class_labels),
+        'arrays': arrays}
+    offset = _align(len(MAGIC) + 8 + len(json.dumps(header).encode()))
+    for name in ARRAYS:
+        arrays[name][1] = offset
+        offset = _align(offset + parts[name].nbytes)
+    header_bytes = json.dumps(header).encode()
+    header_bytes += b' ' * (arrays[ARRAYS[0]][1] - len(MAGIC) - 8 - \
+        len(header_bytes))
+
+    temp_path = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<Q', len(header_bytes)))
+            f.write(header_bytes)
+            for name in ARRAYS:
+                f.seek(arrays[name][1])
+                f.write(parts[name].tobytes())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def _align(offset):
+    """
+    Take byte offset.  Return it rounded up to a multiple of ALIGNMENT.
+    """
+
+    return(-(-offset // ALIGNMENT) * ALIGNMENT)
@@ -0,0 +1,185 @@
+"""
+rcclasses.py:  TE class bookkeeping shared by the analyses in rcfuncs.py
+
+Manifest:
+    CategoryRegistry(classify)
+        Interns (class, subclass) pairs as small integer codes.
+    ClassTotals(registry)
+        Accumulates [Frequency, Length] per category code; reads as a
+        mapping {TEClass}>{Subclass}>[Frequency, Length].
+"""
+
+from collections.abc import Mapping
+
+class CategoryRegistry(object):
+    """
+    Interns (class, subclass) pairs as small integer codes.
+
+    Codes are handed out in order of first interning, starting from 0, so
+    they can index flat lists and arrays.  Parsers intern each TE as it is
+    read, and analyses work on codes until output is written.
+
+    classify maps a raw TE label to its (class, subclass) pair, e.g.
+    rcfuncs.fasclass() with a config bound.  code() calls it once per
+    distinct raw label.
+    """
+
+    def __init__(self, classify=None):
+        self.classify = classify
+        # Map (class, subclass) to code
+        self.codes = {}
+        # Map code to (class, subclass)
+        self.labels = []
+        # Map raw label to code
+        self.raw_codes = {}
+
+    def __len__(self):
+        return(len(self.labels))
+
+    def __getitem__(self, code):
+        return(self.labels[code])
+
+    def intern(self, category):
+        """
+        Take (class, subclass).  Return its code, adding it if new.
+        """
+
+        try:
+            return(self.codes[category])
+        except KeyError:
+            code = len(self.labels)
+            self.codes[category] = code
+            self.labels.append(category)
+            return(code)
+
+    def code(self, label):
+        """
+        Take raw TE label.  Return code of its (class, subclass).
+        """
+
+        try:
+            return(self.raw_codes[label])
+        except KeyError:
+            code = self.intern(self.classify(label))
+            self.raw_codes[label] = code
+            return(code)
+
+    def byclass(self, codes):
+        """
+        Take codes in order of first appearance.  Return list of
+        (class, [codes]), with classes in order of first appearance.
+
+        This is the order in which nested {Class}>{Subclass} dicts built
+        from the same sequence would iterate.
+        """
+
+        groups = {}
+        for code in codes:
+            this_class = self.labels[code][0]
+            if this_class not in groups:
+                groups[this_class] = []
+            groups[this_class].append(code)
+        return(list(groups.items()))
+
+class ClassTotals(Mapping):
+    """
+    Accumulates [Frequency, Length] per category code.
+
+    Totals are kept in two flat lists indexed by code, so adding a TE is
+    one index per list.  Codes are remembered in order of first addition.
+
+    Read as a mapping, a ClassTotals is {TEClass}>{Subclass}>[Frequency,
+    Length], with classes and subclasses in order of first addition.  This
+    is the nested dict fasgenome() and fasdensity() used to build, so
+    writetbl() reads either.  The [Frequency, Length] lists it hands out
+    are copies.
+    """
+
+    __slots__ = ('registry', 'frequencies', 'lengths', 'order')
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.frequencies = []
+        self.lengths = []
+        # Codes in order of first addition
+        self.order = []
+
+    def add(self, category, length, count=1):
+        """
+        Take category code, length and count.  Add them to its totals.
+
+        count must be positive.
+        """
+
+        try:
+            if not self.frequencies[category]:
+                self.order.append(category)
+        except IndexError:
+            grow = category + 1 - len(self.frequencies)
+            self.frequencies.extend([0] * grow)
+            self.lengths.extend([0] * grow)
+            self.order.append(category)
+        self.frequencies[category] += count
+        self.lengths[category] += length
+
+    def addmany(self, categories, lengths):
+        """
+        Take sequences of category codes and lengths.  Add one TE for each.
+        """
+
+        for category, length in zip(categories, lengths):
+            self.add(category, length)
+
+    def merge(self, other):
+        """
+        Take another ClassTotals on the same registry.  Add its totals.
+
+        Merging partial totals in file order keeps first-addition order.
+        """
+
+        for category in other.order:
+            self.add(category, other.lengths[category], \
+                other.frequencies[category])
+
+    def total(self, category):
+        """
+        Take category code.  Return [Frequency, Length].
+        """
+
+        try:
+            return([self.frequencies[category], self.lengths[category]])
+        except IndexError:
+            return([0, 0])
+
+    def classes(self):
+        """
+        Return {TEClass}>{Subclass}>[Frequency, Length] as nested dicts.
+        """
+
+        classes = {}
+        for category in self.order:
+            superclass, subclass = self.registry[category]
+            if superclass not in classes:
+                classes[superclass] = {}
+            classes[superclass][subclass] = self.total(category)
+        return(classes)
+
+    def __getitem__(self, superclass):
+        subclasses = {}
+        for category in self.order:
+            if self.registry[category][0] == superclass:
+                subclasses[self.registry[category][1]] = self.total(category)
+        if not subclasses:
+            raise KeyError(superclass)
+        return(subclasses)
+
+    def __iter__(self):
+        seen = set()
+        for category in self.order:
+            superclass = self.registry[category][0]
+            if superclass not in seen:
+                seen.add(superclass)
+                yield superclass
+
+    def __len__(self):
+        return(len(set(self.registry[x][0] for x in self.order)))
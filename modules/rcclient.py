@@ -0,0 +1,186 @@
+"""
+rcclient.py:  Client for the resident analysis server in rcserver.py
+
+From Python:
+    with rcclient.Client(port=8765) as client:
+        result = client.request('density', te='hg38', length=5000000,
+            regions=[['peak0', 'chr1', 1000, 2000]])
+From the command line, in the RepCalc directory:
+    python3 -m modules.rcclient --port 8765 query hg38 chr7:5,000,000-6,200,000
+    python3 -m modules.rcclient --port 8765 density hg38 peaks.gff 5000000
+    python3 -m modules.rcclient --port 8765 matrix hg38 peaks.gff
+    python3 -m modules.rcclient --port 8765 datasets
+RoI files are read as MXROI reads them:  one header line, then label,
+chromosome, start and end in columns 0 1 2 3, or as given by --columns.
+Results are printed tab-delimited.
+
+Manifest:
+    main(argv)
+        Command line entry point.
+    Client(host, port, path, timeout)
+        Connection to a server; request() sends one request and waits.
+    ServerError
+        Raised when the server answers a request with an error.
+    readregions(pi_filename, columns)
+        Reads RoI file; returns list of [label, chromosome, start, end].
+"""
+
+import sys
+import json
+import socket
+import argparse
+import modules.rcio as rco
+
+DEFAULT_PORT = 8765
+
+class ServerError(Exception):
+    """
+    Raised when the server answers a request with an error.
+    """
+
+class Client(object):
+    """
+    Connection to a server, over TCP to host and port, or to the Unix
+    socket at path.
+
+    request() sends one request and waits for its response, so a Client
+    has one request in flight at a time.  For concurrent requests, use one
+    Client per thread.
+    """
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, path=None, \
+        timeout=None):
+        if path is not None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.settimeout(timeout)
+            self.socket.connect(path)
+        else:
+            self.socket = socket.create_connection((host, port), timeout)
+        self.stream = self.socket.makefile('rwb')
+        self.next_id = 0
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *args):
+        self.close()
+        return(False)
+
+    def close(self):
+        """
+        Close the connection.  Return nothing.
+        """
+
+        self.stream.close()
+        self.socket.close()
+
+    def request(self, op, **fields):
+        """
+        Take op and request fields.  Return result.
+
+        Raises ServerError if the server answers with an error, and
+        ConnectionError if it closes the connection.
+        """
+
+        self.next_id += 1
+        request = dict(fields, op=op, id=self.next_id)
+        self.stream.write(json.dumps(request).encode() + b'\n')
+        self.stream.flush()
+
+        line = self.stream.readline()
+        if not line:
+            raise ConnectionError("Server closed the connection.")
+        response = json.loads(line.decode())
+        if response.get('id') != request['id']:
+            raise ServerError(response.get('error', \
+                'Response to another request.'))
+        if not response['ok']:
+            raise ServerError(response['error'])
+        return(response['result'])
+
+def readregions(pi_filename, columns=(0, 1, 2, 3)):
+    """
+    Reads RoI file; returns list of [label, chromosome, start, end].
+
+    One header line is skipped, as by rcfuncs.piregions().
+    """
+
+    id_index, chr_index, start_index, end_index = columns
+    regions = []
+    with rco.openinput(pi_filename) as pi:
+        pi.readline()
+        for line in pi:
+            line_list = line.split()
+            if not line_list:
+                continue
+            regions.append([line_list[id_index], line_list[chr_index], \
+                int(line_list[start_index]), int(line_list[end_index])])
+    return(regions)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python3 -m modules.rcclient',
+        description='Send a request to a RepCalc server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--socket', default=None,
+        help='connect to this Unix socket instead of TCP')
+    parser.add_argument('--columns', default='0,1,2,3',
+        help='RoI columns of label, chromosome, start, end')
+    parser.add_argument('--sparse', action='store_true',
+        help='print only nonzero matrix cells')
+    parser.add_argument('op', choices=['datasets', 'genome', 'density', \
+        'matrix', 'query'])
+    parser.add_argument('arguments', nargs='*',
+        help='data set, then regions, a RoI file or a length')
+    args = parser.parse_args(argv)
+
+    columns = [int(x) for x in args.columns.split(',')]
+    needed = {'datasets': 0, 'genome': 1, 'density': 2, 'matrix': 2,
+        'query': 2}[args.op]
+    if len(args.arguments) < needed:
+        parser.error("%s needs %d more arguments" % (args.op, \
+            needed - len(args.arguments)))
+
+    client = Client(args.host, args.port, args.socket)
+    try:
+        if args.op == 'datasets':
+            for name, info in sorted(client.request('datasets').items()):
+                print(name + '\t' + str(info['tes']))
+
+        elif args.op == 'query':
+            for region in args.arguments[1:]:
+                result = client.request('query', te=args.arguments[0], \
+                    region=region)
+                for row in result['rows']:
+                    print('\t'.join([region] + [str(x) for x in row[:4]]))
+
+        elif args.op in ('genome', 'density'):
+            fields = {'te': args.arguments[0]}
+            if args.op == 'density':
+                fields['regions'] = readregions(args.arguments[1], columns)
+            if len(args.arguments) > needed:
+                fields['length'] = int(args.arguments[needed])
+            result = client.request(args.op, **fields)
+            for row in result['rows']:
+                print('\t'.join('' if x is None else str(x) for x in row))
+
+        else:
+            result = client.request('matrix', te=args.arguments[0], \
+                regions=readregions(args.arguments[1], columns), \
+                sparse=args.sparse)
+            if args.sparse:
+                for cell in result['cells']:
+                    print('\t'.join(str(x) for x in cell))
+            else:
+                print('Class\t' + '\t'.join(result['regions']))
+                for label, values in result['rows']:
+                    print(label + '\t' + '\t'.join(str(x) for x in values))
+    except ServerError as ex:
+        print("Server error:  " + str(ex), file=sys.stderr)
+        return(1)
+    finally:
+        client.close()
+    return(0)
+
+if __name__ == '__main__':
+    sys.exit(main())
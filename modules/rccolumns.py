@@ -0,0 +1,519 @@
+"""
+rccolumns.py:  Optional NumPy columnar loader for TE annotation data
+
+Everything here requires NumPy.  When NumPy is missing, HAVE_NUMPY is False
+and rcfuncs.py uses its line-by-line parsers instead.
+
+Manifest:
+    loadcolumns(fas_filename, columns, registry)
+        Reads .fas file in blocks; returns TEColumns.
+    readcolumns(fas_filename, columns)
+        Reads .fas file in blocks; returns raw columns before classification.
+    buildcolumns(parts, chromosome_labels, class_labels, registry)
+        Classifies readcolumns() output; returns TEColumns.
+    genomeclasses(te)
+        Returns fasgenome() mapping {TEClass}>{Subclass}>[Frequency, Length].
+    chromosomeclasses(te)
+        Returns {Chromosome}>genomeclasses() of that chromosome's TEs.
+    coverage(index, starts, ends)
+        Returns IntervalIndex.coverage() of each TE in start/end arrays.
+    densitylengths(te, chromosomes)
+        Returns array of each TE's total overlap with RoIs.
+    densityclasses(te, chromosomes, lengths)
+        Returns fasdensity() mapping {TEClass}>{Subclass}>[Freq., OverlapLength].
+    matrixranges(te)
+        Returns fasmatrix() mapping {Chromosome}>(Starts, Ends, Categories).
+    binranges(te)
+        Returns fasbins() mapping {Chromosome}>(Starts, Ends, Categories).
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import modules.rcio as rco
+import modules.rcclasses as rcl
+import modules.rcstats as rcs
+import modules.rcprogress as rcr
+
+HAVE_NUMPY = np is not None
+
+# Bytes read per block.  Blocks end on a line boundary.
+BLOCK_SIZE = 1 << 24
+
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+
+class TEColumns(object):
+    """
+    Columnar TE annotation data, one array element per TE line.
+
+    Attributes:
+        starts, ends:  int64 arrays of TE start and end
+        chromosomes:  int32 array of codes into chromosome_labels
+        categories:  int32 array of codes into registry
+        chromosome_labels:  list of chromosome strings, as found in the file
+        registry:  rcclasses.CategoryRegistry of (class, subclass) pairs,
+            after config replacement
+    """
+
+    def __init__(self, starts, ends, chromosomes, categories, \
+        chromosome_labels, registry):
+        self.starts = starts
+        self.ends = ends
+        self.chromosomes = chromosomes
+        self.categories = categories
+        self.chromosome_labels = chromosome_labels
+        self.registry = registry
+
+    def __len__(self):
+        return(len(self.starts))
+
+    def bychromosome(self):
+        """
+        Yield (chromosome label, row indices) in order of first appearance.
+
+        Labels are stripped of 'chr' as in pidensity(), and chromosomes
+        sharing a stripped label are grouped together.  Row indices are in
+        file order.
+        """
+
+        names = []
+        group_codes = {}
+        groups = np.zeros(len(self.chromosome_labels), dtype=np.int64)
+        for code, label in enumerate(self.chromosome_labels):
+            label = label.strip('chr')
+            if label not in group_codes:
+                group_codes[label] = len(names)
+                names.append(label)
+            groups[code] = group_codes[label]
+
+        row_groups = groups[self.chromosomes]
+        order = np.argsort(row_groups, kind='stable')
+        counts = np.bincount(row_groups, minlength=len(names))
+        bounds = np.concatenate(([0], np.cumsum(counts)))
+        present = np.flatnonzero(counts)
+        first = order[bounds[present]]
+
+        for group in present[np.argsort(first)]:
+            yield (names[group], order[bounds[group]:bounds[group + 1]])
+
+###############################################################################
+# Loader
+
+def loadcolumns(fas_filename, columns, registry):
+    """
+    Reads .fas file in blocks; returns TEColumns.
+
+    Input:
+        fas_filename:  File path to multiclass data.  One header line.
+        columns:  Column indices of [class, chromosome, start, end]
+        registry:  rcclasses.CategoryRegistry to intern classes with.
+            Each distinct raw label is classified once, not once per line.
+    Output:
+        te:  TEColumns
+    """
+
+    parts, chromosome_labels, class_labels = readcolumns(fas_filename, \
+        columns)
+    return(buildcolumns(parts, chromosome_labels, class_labels, registry))
+
+def readcolumns(fas_filename, columns):
+    """
+    Reads .fas file in blocks; returns raw columns before classification.
+
+    Input:
+        fas_filename:  File path to multiclass data.  One header line.
+        columns:  Column indices of [class, chromosome, start, end]
+    Output:
+        parts:  dict of arrays, one element per TE line:
+            'starts', 'ends':  int64 TE start and end
+            'chromosomes':  int32 codes into chromosome_labels
+            'classes':  int32 codes into class_labels
+        chromosome_labels:  list of chromosome strings, as found in the file
+        class_labels:  list of raw class strings, as found in the file
+
+    Blocks are tokenized with array operations on the raw bytes.  No Python
+    object is created per line; only distinct labels are decoded.  The file
+    may be compressed; see rcio.openinput().  Nothing
+    here depends on the config, so rccache.py may store the result.
+    """
+
+    id_index, chr_index, start_index, end_index = columns
+    # Map raw label bytes to codes, in order of first appearance.
+    raw_chromosomes = {}
+    raw_classes = {}
+    parts = {'starts': [], 'ends': [], 'chromosomes': [], 'classes': []}
+
+    with rco.openinput(fas_filename, "rb") as f:
+        # Skip header line
+        f.readline()
+
+        remainder = b''
+        while True:
+            chunk = f.read(BLOCK_SIZE)
+            if not chunk:
+                block = remainder
+                remainder = b''
+            else:
+                block = remainder + chunk
+                cut = block.rfind(b'\n') + 1
+                if not cut:
+                    remainder = block
+                    continue
+                block, remainder = block[:cut], block[cut:]
+
+            if block:
+                buf = np.frombuffer(block, dtype=np.uint8)
+                fields = _blockfields(block, columns)
+                parts['starts'].append(_parseints(buf, *fields[start_index]))
+                parts['ends'].append(_parseints(buf, *fields[end_index]))
+                parts['chromosomes'].append(_labelcodes(buf, \
+                    fields[chr_index], raw_chromosomes))
+                parts['classes'].append(_labelcodes(buf, \
+                    fields[id_index], raw_classes))
+
+            if not chunk:
+                break
+
+    dtypes = {'starts': np.int64, 'ends': np.int64, 'chromosomes': np.int32,
+        'classes': np.int32}
+    for key in parts:
+        if parts[key]:
+            parts[key] = np.concatenate(parts[key]).astype(dtypes[key], \
+                copy=False)
+        else:
+            parts[key] = np.zeros(0, dtype=dtypes[key])
+
+    rcs.count('te lines', len(parts['starts']))
+    return(parts,
+        [x.decode() for x in raw_chromosomes],
+        [x.decode() for x in raw_classes])
+
+def buildcolumns(parts, chromosome_labels, class_labels, registry):
+    """
+    Take readcolumns() output and CategoryRegistry.  Return TEColumns.
+
+    Each distinct class label is resolved once.
+    """
+
+    raw_to_category = np.zeros(len(class_labels), dtype=np.int32)
+    for code, label in enumerate(class_labels):
+        raw_to_category[code] = registry.code(label)
+
+    if rcs.active():
+        random_codes = [i for i, x in enumerate(chromosome_labels) \
+            if "_random" in x]
+        rcs.count('random rows skipped', \
+            int(np.isin(parts['chromosomes'], random_codes).sum()))
+
+    return(TEColumns(parts['starts'],
+        parts['ends'],
+        parts['chromosomes'],
+        raw_to_category[parts['classes']],
+        list(chromosome_labels),
+        registry))
+
+def _blockfields(block, columns):
+    """
+    Take a block of whole lines.  Return token (starts, lengths) by column.
+
+    A line lacking any of the requested columns, blank lines included,
+    raises IndexError, as indexing a split line would.
+    """
+
+    buf = np.frombuffer(block, dtype=np.uint8)
+    size = len(buf)
+    # Whitespace as bytes.split() sees it:  space, or \t \n \x0b \x0c \r
+    space = (buf == 32) | ((buf - np.uint8(9)) <= 4)
+
+    # Token boundaries are where whitespace flips to non-whitespace and back.
+    edges = np.empty(size + 1, dtype=bool)
+    edges[0] = not space[0]
+    edges[size] = not space[-1]
+    np.not_equal(space[1:], space[:-1], out=edges[1:size])
+    edges = np.flatnonzero(edges)
+    token_starts = edges[0::2]
+    token_lengths = edges[1::2] - token_starts
+    token_count = len(token_starts)
+
+    # Tokens before each newline end each line's tokens.  A blank line
+    # ends where the line before it did, so it has width 0.
+    line_ends = np.searchsorted(token_starts, np.flatnonzero(buf == 10))
+    if buf[-1] != 10:
+        # Last line of the file, without a newline
+        line_ends = np.append(line_ends, token_count)
+    line_starts = np.concatenate(([0], line_ends[:-1]))
+
+    line_widths = line_ends - line_starts
+    if len(line_widths) and line_widths.min() <= max(columns):
+        raise IndexError("list index out of range")
+
+    fields = {}
+    for column in set(columns):
+        selected = line_starts + column
+        fields[column] = (token_starts[selected], token_lengths[selected])
+    return(fields)
+
+def _parseints(buf, starts, lengths):
+    """
+    Take token positions.  Return int64 array of their values.
+
+    Raises ValueError on the first token int() would reject, and
+    OverflowError on a value outside int64, where the line-by-line
+    parsers' arrays overflow.
+    """
+
+    values = np.zeros(len(starts), dtype=np.int64)
+    if not len(starts):
+        return(values)
+
+    first = buf[starts]
+    negative = first == ord('-')
+    signed = negative | (first == ord('+'))
+    bad = signed & (lengths == 1)
+    ends = starts + lengths
+    scale = np.ones(len(starts), dtype=np.int64)
+
+    # Read digits from the right, so each token is aligned on its last byte.
+    for j in range(1, int(lengths.max()) + 1):
+        used = lengths - signed >= j
+        digits = buf[np.where(used, ends - j, 0)].astype(np.int64) - ord('0')
+        bad |= used & ((digits < 0) | (digits > 9))
+        values += np.where(used, digits * scale, 0)
+        scale *= 10
+
+    if bad.any():
+        row = np.flatnonzero(bad)[0]
+        token = bytes(buf[starts[row]:ends[row]]).decode()
+        raise ValueError("invalid literal for int() with base 10: %r" % token)
+
+    values[negative] *= -1
+
+    # More than 18 digits may have wrapped.  Parse those few with int().
+    for row in np.flatnonzero(lengths - signed > 18).tolist():
+        value = int(bytes(buf[starts[row]:ends[row]]))
+        if not INT64_MIN <= value <= INT64_MAX:
+            raise OverflowError("coordinate out of range:  %d" % value)
+        values[row] = value
+    return(values)
+
+def _labelcodes(buf, positions, table):
+    """
+    Take token positions and mapping of labels to codes.  Return codes.
+
+    New labels are added to table.  Each label is packed into 8-byte words,
+    which are hashed to group rows.  Every row's words are then checked
+    against its group's first row, so a hash collision cannot merge two
+    labels.
+    """
+
+    starts, lengths = positions
+    if not len(starts):
+        return(np.zeros(0, dtype=np.int32))
+
+    # View of 8 bytes starting at every position of buf.
+    padded = np.append(buf, np.zeros(8, dtype=np.uint8))
+    words = np.ndarray((len(buf),), dtype='<u8', buffer=padded, strides=(1,))
+    masks = np.array([(1 << (8 * x)) - 1 for x in range(9)], dtype=np.uint64)
+
+    packed = [lengths.astype(np.uint64)]
+    for offset in range(0, int(lengths.max()), 8):
+        remaining = np.clip(lengths - offset, 0, 8)
+        positions = np.minimum(starts + offset, len(buf) - 1)
+        packed.append(words[positions] & masks[remaining])
+
+    hashes = np.zeros(len(starts), dtype=np.uint64)
+    for word in packed:
+        hashes = hashes * np.uint64(1000003) + word
+
+    keys, first, inverse = np.unique(hashes, return_index=True, \
+        return_inverse=True)
+    inverse = inverse.ravel()
+    for word in packed:
+        if not (word == word[first][inverse]).all():
+            # Hash collision.  Group on the packed words themselves.
+            keys, first, inverse = np.unique(np.stack(packed, axis=1), \
+                axis=0, return_index=True, return_inverse=True)
+            inverse = inverse.ravel()
+            break
+
+    codes = np.zeros(len(first), dtype=np.int32)
+    for i, row in enumerate(first.tolist()):
+        label = bytes(buf[starts[row]:starts[row] + lengths[row]])
+        if label not in table:
+            table[label] = len(table)
+        codes[i] = table[label]
+    return(codes[inverse])
+
+###############################################################################
+# Analysis chains on TEColumns
+
+def _tally(te, rows, lengths):
+    """
+    Take TEColumns, row indices and lengths.  Return rcclasses.ClassTotals.
+
+    Categories are added in order of first appearance among rows, as the
+    line-by-line parsers would add them.
+    """
+
+    categories = te.categories[rows]
+    count = len(te.registry)
+    frequencies = np.bincount(categories, minlength=count)
+    # float64 sums of integer lengths are exact below 2**53 bp.
+    totals = np.bincount(categories, weights=lengths, minlength=count)
+    present, first = np.unique(categories, return_index=True)
+
+    classes = rcl.ClassTotals(te.registry)
+    for code in present[np.argsort(first)].tolist():
+        classes.add(code, int(totals[code]), int(frequencies[code]))
+    return(classes)
+
+def genomeclasses(te):
+    """
+    Take TEColumns.  Return fasgenome() mapping {Class}>{Sub}>[Freq, Length].
+    """
+
+    skip = np.array(["_random" in x for x in te.chromosome_labels] + [False])
+    rows = np.flatnonzero(~skip[te.chromosomes])
+    return(_tally(te, rows, te.ends[rows] - te.starts[rows]))
+
+def chromosomeclasses(te):
+    """
+    Take TEColumns.  Return {Chromosome}>genomeclasses() of its TEs.
+
+    Chromosome labels are as found in the file, in order of first
+    appearance, and '_random' chromosomes are left out.
+    """
+
+    classes = {}
+    for chromosome, rows in _chromosomerows(te):
+        classes[chromosome] = _tally(te, rows, te.ends[rows] - te.starts[rows])
+    return(classes)
+
+def coverage(index, starts, ends):
+    """
+    Take IntervalIndex and TE start and end arrays.  Return overlap lengths.
+
+    Each length is IntervalIndex.coverage() of that TE.  Well-formed TEs are
+    totalled with its prefix-sum form over the whole array at once.
+    """
+
+    pi_starts = np.asarray(index.starts, dtype=np.int64)
+    pi_ends = np.asarray(index.ends, dtype=np.int64)
+    start_sums = np.asarray(index.start_sums, dtype=np.int64)
+    end_sums = np.asarray(index.end_sums, dtype=np.int64)
+
+    def cumulative(positions):
+        started = np.searchsorted(pi_starts, positions, side='right')
+        ended = np.searchsorted(pi_ends, positions, side='right')
+        return((started * positions - start_sums[started]) - \
+            (ended * positions - end_sums[ended]))
+
+    lengths = cumulative(ends) - cumulative(starts)
+
+    for i in np.flatnonzero(starts > ends).tolist():
+        lengths[i] = index.coverage(int(starts[i]), int(ends[i]))
+    return(lengths)
+
+def densitylengths(te, chromosomes):
+    """
+    Take TEColumns and pidensity() output.  Return overlap length per TE.
+
+    TEs on chromosomes without RoIs, or on '_random' chromosomes, get 0.
+    """
+
+    lengths = np.zeros(len(te), dtype=np.int64)
+
+    for chromosome, rows in te.bychromosome():
+        rcr.check()
+        if "_random" in chromosome or chromosome not in chromosomes:
+            continue
+        lengths[rows] = coverage(chromosomes[chromosome], te.starts[rows], \
+            te.ends[rows])
+        rcs.count('overlap comparisons', len(rows))
+
+    return(lengths)
+
+def densityclasses(te, chromosomes, lengths=None):
+    """
+    Take TEColumns and pidensity() output.  Return fasdensity() mapping.
+
+    lengths, if given, is densitylengths() output computed elsewhere, e.g.
+    by rcparallel.densitylengths().
+    """
+
+    if lengths is None:
+        lengths = densitylengths(te, chromosomes)
+
+    rows = np.flatnonzero(lengths > 0)
+    return(_tally(te, rows, lengths[rows]))
+
+def matrixranges(te):
+    """
+    Take TEColumns.  Return fasmatrix() mapping.
+
+    {Chromosome}>(Starts, Ends, Categories), as int64 arrays.  Each
+    chromosome's TEs are grouped by class, then subclass, in order of first
+    appearance, and are otherwise in file order.
+    """
+
+    te_dict = {}
+
+    for chromosome, rows in te.bychromosome():
+        if "_random" in chromosome:
+            continue
+
+        categories = te.categories[rows]
+        present, first = np.unique(categories, return_index=True)
+
+        # Rank each category by its position in the grouped order.
+        rank = np.zeros(len(te.registry), dtype=np.int64)
+        grouped = te.registry.byclass(present[np.argsort(first)].tolist())
+        position = 0
+        for this_class, codes in grouped:
+            for code in codes:
+                rank[code] = position
+                position += 1
+
+        order = rows[np.argsort(rank[categories], kind='stable')]
+        te_dict[chromosome] = (te.starts[order], te.ends[order], \
+            te.categories[order].astype(np.int64))
+
+    return(te_dict)
+
+def binranges(te):
+    """
+    Take TEColumns.  Return fasbins() mapping.
+
+    {Chromosome}>(Starts, Ends, Categories), as int64 arrays in file order.
+    Chromosome labels are as found in the file, in order of first
+    appearance, and '_random' chromosomes are left out.
+    """
+
+    te_dict = {}
+    for chromosome, rows in _chromosomerows(te):
+        te_dict[chromosome] = (te.starts[rows], te.ends[rows], \
+            te.categories[rows].astype(np.int64))
+    return(te_dict)
+
+def _chromosomerows(te):
+    """
+    Take TEColumns.  Yield (chromosome label, row indices) per chromosome.
+
+    Unlike TEColumns.bychromosome(), labels are as found in the file, and
+    '_random' chromosomes are left out.  Chromosomes are in order of first
+    appearance, and rows in file order.
+    """
+
+    order = np.argsort(te.chromosomes, kind='stable')
+    counts = np.bincount(te.chromosomes, minlength=len(te.chromosome_labels))
+    bounds = np.concatenate(([0], np.cumsum(counts)))
+    present = np.flatnonzero(counts)
+    first = order[bounds[present]]
+
+    for code in present[np.argsort(first)].tolist():
+        chromosome = te.chromosome_labels[code]
+        if "_random" not in chromosome:
+            yield (chromosome, order[bounds[code]:bounds[code + 1]])
@@ -0,0 +1,356 @@
+"""
+rccoverage.py:  Union coverage of TE ranges
+
+WG and ROI normally total the length of every TE, so bp covered by nested
+or overlapping TEs are counted once per TE.  In union coverage mode, each
+chromosome's TE ranges are first merged with a sweep line, per category,
+and bp are counted once however many TEs cover them.  Class totals and
+"Total interspersed repeats" are merged again across their subclasses and
+classes, so every figure is bp genuinely occupied.  For ROI, merged ranges
+are clipped to the union of the RoIs.
+
+Ranges are half-open, [start, end), so a TE covers end - start bp.  TEs
+with end <= start cover nothing.
+
+The sweep sorts ranges by start, then keeps a running maximum of ends:  a
+range starting beyond it opens a new merged range.  Input already sorted by
+start is detected and not sorted again, so the sweep is O(n) on sorted
+tables and O(n log n) otherwise.  Category groups are formed with a stable
+counting sort, which keeps each category's ranges in file order.
+
+A depth histogram is kept alongside:  bp covered by exactly 1, 2, 3... TEs.
+
+Manifest:
+    mergeranges(starts, ends)
+        Returns sorted, disjoint (starts, ends) covering the same bp.
+    intersectranges(starts, ends, mask_starts, mask_ends)
+        Returns mergeranges() output clipped to mask ranges.
+    depthhistogram(starts, ends, mask)
+        Returns {Depth}>bp covered by exactly that many ranges.
+    regionranges(chromosomes)
+        Returns {Chromosome}>mergeranges() of pidensity() output.
+    CoverageTotals(totals, te_dict, regions)
+        ClassTotals with lengths replaced by union coverage.
+"""
+
+import modules.rcclasses as rcl
+import modules.rcstats as rcs
+import modules.rcprogress as rcr
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+###############################################################################
+# Sweep line
+
+def mergeranges(starts, ends):
+    """
+    Take TE starts and ends.  Return (starts, ends) of their union:  sorted,
+    disjoint ranges, as int64 arrays with NumPy or lists without.
+
+    Ranges that touch, e.g. [0, 5) and [5, 8), are merged.
+    """
+
+    if np is None:
+        return(_mergelist(starts, ends))
+
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    keep = ends > starts
+    starts = starts[keep]
+    ends = ends[keep]
+    if not len(starts):
+        return(starts, ends)
+    if (starts[1:] < starts[:-1]).any():
+        order = np.argsort(starts, kind='stable')
+        starts = starts[order]
+        ends = ends[order]
+
+    reach = np.maximum.accumulate(ends)
+    opens = np.empty(len(starts), dtype=bool)
+    opens[0] = True
+    opens[1:] = starts[1:] > reach[:-1]
+    first = np.flatnonzero(opens)
+    last = np.append(first[1:] - 1, len(starts) - 1)
+    return(starts[first], reach[last])
+
+def _mergelist(starts, ends):
+    """
+    Take TE starts and ends.  Return mergeranges() output as lists.
+    """
+
+    ranges = [(x, y) for x, y in zip(starts, ends) if y > x]
+    if any(ranges[i][0] > ranges[i + 1][0] for i in range(len(ranges) - 1)):
+        ranges.sort()
+
+    merged_starts = []
+    merged_ends = []
+    for start, end in ranges:
+        if merged_ends and start <= merged_ends[-1]:
+            if end > merged_ends[-1]:
+                merged_ends[-1] = end
+        else:
+            merged_starts.append(start)
+            merged_ends.append(end)
+    return(merged_starts, merged_ends)
+
+def _pairs(starts, ends, mask_starts, mask_ends):
+    """
+    Take two sets of sorted, disjoint ranges.  Return (index into the
+    first set, starts, ends) of every nonempty intersection, in order.
+    """
+
+    if np is None:
+        indices = []
+        out_starts = []
+        out_ends = []
+        j = 0
+        for i, (start, end) in enumerate(zip(starts, ends)):
+            while j < len(mask_ends) and mask_ends[j] <= start:
+                j += 1
+            k = j
+            while k < len(mask_starts) and mask_starts[k] < end:
+                low = max(start, mask_starts[k])
+                high = min(end, mask_ends[k])
+                if high > low:
+                    indices.append(i)
+                    out_starts.append(low)
+                    out_ends.append(high)
+                k += 1
+        return(indices, out_starts, out_ends)
+
+    mask_starts = np.asarray(mask_starts, dtype=np.int64)
+    mask_ends = np.asarray(mask_ends, dtype=np.int64)
+    # Mask ranges [low, high) of each range are those ending after its
+    # start and starting before its end.
+    low = np.searchsorted(mask_ends, starts, side='right')
+    high = np.searchsorted(mask_starts, ends, side='left')
+    counts = np.maximum(high - low, 0)
+    indices = np.repeat(np.arange(len(starts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - \
+        counts, counts)
+    masks = np.repeat(low, counts) + offsets
+    out_starts = np.maximum(starts[indices], mask_starts[masks])
+    out_ends = np.minimum(ends[indices], mask_ends[masks])
+    keep = out_ends > out_starts
+    return(indices[keep], out_starts[keep], out_ends[keep])
+
+def intersectranges(starts, ends, mask_starts, mask_ends):
+    """
+    Take mergeranges() output and sorted, disjoint mask ranges.  Return
+    (starts, ends) of the bp they share, sorted and disjoint.
+    """
+
+    indices, starts, ends = _pairs(starts, ends, mask_starts, mask_ends)
+    return(starts, ends)
+
+def depthhistogram(starts, ends, mask=None):
+    """
+    Take TE starts and ends, and optionally mergeranges() output to count
+    within.  Return {Depth}>bp covered by exactly Depth TEs.
+
+    Depth 0 is left out.
+    """
+
+    if np is None:
+        events = []
+        for start, end in zip(starts, ends):
+            if end > start:
+                events.append((start, 1))
+                events.append((end, -1))
+        events.sort()
+
+        # Segments of constant depth:  [start, end), depth
+        seg_starts = []
+        seg_ends = []
+        depths = []
+        depth = 0
+        for i, (position, delta) in enumerate(events):
+            depth += delta
+            if depth and i + 1 < len(events) and \
+                events[i + 1][0] > position:
+                seg_starts.append(position)
+                seg_ends.append(events[i + 1][0])
+                depths.append(depth)
+
+        if mask is not None:
+            indices, seg_starts, seg_ends = _pairs(seg_starts, seg_ends, \
+                mask[0], mask[1])
+            depths = [depths[x] for x in indices]
+
+        histogram = {}
+        for start, end, depth in zip(seg_starts, seg_ends, depths):
+            histogram[depth] = histogram.get(depth, 0) + end - start
+        return(histogram)
+
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    keep = ends > starts
+    positions = np.concatenate((starts[keep], ends[keep]))
+    deltas = np.concatenate((np.ones(keep.sum(), dtype=np.int64), \
+        -np.ones(keep.sum(), dtype=np.int64)))
+    order = np.argsort(positions, kind='stable')
+    positions = positions[order]
+    depths = np.cumsum(deltas[order])[:-1]
+    seg_starts = positions[:-1]
+    seg_ends = positions[1:]
+    keep = (depths > 0) & (seg_ends > seg_starts)
+    seg_starts = seg_starts[keep]
+    seg_ends = seg_ends[keep]
+    depths = depths[keep]
+
+    if mask is not None:
+        indices, seg_starts, seg_ends = _pairs(seg_starts, seg_ends, \
+            mask[0], mask[1])
+        depths = depths[indices]
+
+    # float64 sums of integer lengths are exact below 2**53 bp.
+    totals = np.bincount(depths, weights=seg_ends - seg_starts)
+    return(dict((int(x), int(round(totals[x]))) \
+        for x in np.flatnonzero(totals)))
+
+def _length(ranges):
+    """
+    Take (starts, ends) of disjoint ranges.  Return bp covered.
+    """
+
+    starts, ends = ranges
+    if np is None:
+        return(sum(ends) - sum(starts))
+    return(int(ends.sum() - starts.sum()))
+
+def regionranges(chromosomes):
+    """
+    Take pidensity() output.  Return {Chromosome}>mergeranges() of its RoIs.
+    """
+
+    regions = {}
+    for chromosome, index in chromosomes.items():
+        regions[chromosome] = mergeranges([x[0] for x in index], \
+            [x[1] for x in index])
+    return(regions)
+
+###############################################################################
+# Totals
+
+class CoverageTotals(rcl.ClassTotals):
+    """
+    ClassTotals with lengths replaced by union coverage.
+
+    Frequencies and order are those of totals, from fasgenome() or
+    fasdensity().  Each category's length is the bp covered by the union
+    of its TEs in te_dict, {Chromosome}>(Starts, Ends, Categories), clipped
+    to regions if given:  mergeranges() of RoIs per chromosome, from
+    regionranges().  grouplength() gives the union across several classes,
+    and depths holds depthhistogram() of all TEs, summed over chromosomes.
+    """
+
+    __slots__ = ('ranges', 'depths', 'groups')
+
+    def __init__(self, totals, te_dict, regions=None):
+        rcl.ClassTotals.__init__(self, totals.registry)
+        self.frequencies = list(totals.frequencies)
+        self.lengths = [0] * len(self.frequencies)
+        self.order = list(totals.order)
+        # Map category code to {Chromosome}>merged (Starts, Ends)
+        self.ranges = {}
+        self.depths = {}
+        # Map frozenset of classes to grouplength()
+        self.groups = {}
+
+        merged = 0
+        for chromosome, (starts, ends, categories) in te_dict.items():
+            rcr.check()
+            mask = None
+            if regions is not None:
+                if chromosome not in regions:
+                    continue
+                mask = regions[chromosome]
+
+            for category, ranges in _bycategory(starts, ends, categories):
+                if category >= len(self.frequencies) or \
+                    not self.frequencies[category]:
+                    continue
+                ranges = mergeranges(*ranges)
+                if mask is not None:
+                    ranges = intersectranges(ranges[0], ranges[1], *mask)
+                merged += len(ranges[0])
+                if category not in self.ranges:
+                    self.ranges[category] = {}
+                self.ranges[category][chromosome] = ranges
+                self.lengths[category] += _length(ranges)
+
+            for depth, length in depthhistogram(starts, ends, mask).items():
+                self.depths[depth] = self.depths.get(depth, 0) + length
+
+        rcs.count('merged ranges', merged)
+
+    def grouplength(self, superclasses):
+        """
+        Take class labels.  Return bp covered by the union of their TEs.
+        """
+
+        key = frozenset(superclasses)
+        if key in self.groups:
+            return(self.groups[key])
+
+        # Map chromosome to [merged ranges of each category]
+        chromosomes = {}
+        for category in self.order:
+            if self.registry[category][0] not in key:
+                continue
+            for chromosome, ranges in self.ranges.get(category, {}).items():
+                if chromosome not in chromosomes:
+                    chromosomes[chromosome] = []
+                chromosomes[chromosome].append(ranges)
+
+        length = 0
+        for chromosome, parts in chromosomes.items():
+            if len(parts) == 1:
+                length += _length(parts[0])
+            elif np is not None:
+                length += _length(mergeranges( \
+                    np.concatenate([x[0] for x in parts]), \
+                    np.concatenate([x[1] for x in parts])))
+            else:
+                length += _length(mergeranges( \
+                    [y for x in parts for y in x[0]], \
+                    [y for x in parts for y in x[1]]))
+
+        self.groups[key] = length
+        return(length)
+
+def _bycategory(starts, ends, categories):
+    """
+    Take TE starts, ends and categories of one chromosome.  Yield
+    (category, (starts, ends)) for each category, with TEs in file order.
+    """
+
+    if np is None:
+        groups = {}
+        for start, end, category in zip(starts, ends, categories):
+            if category not in groups:
+                groups[category] = ([], [])
+            groups[category][0].append(start)
+            groups[category][1].append(end)
+        for category, ranges in groups.items():
+            yield (category, ranges)
+        return
+
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    categories = np.asarray(categories, dtype=np.int64)
+    if not len(categories):
+        return
+    # Stable sorts of 16-bit keys are radix sorts, O(n).
+    keys = categories
+    if categories.max() < (1 << 15):
+        keys = categories.astype(np.int16)
+    order = np.argsort(keys, kind='stable')
+    counts = np.bincount(categories)
+    bounds = np.concatenate(([0], np.cumsum(counts)))
+    for category in np.flatnonzero(counts).tolist():
+        rows = order[bounds[category]:bounds[category + 1]]
+        yield (category, (starts[rows], ends[rows]))
@@ -3,43 +3,128 @@ rcfuncs.py:  Functions imported by repcalc.py and rcgraphics.py
 
 Manifest: 
     getconfig(filename)
-        Reads config file then returns mapping of search terms to replacements.
+        Reads config file then returns ConfigResolver of replacements.
+    parseconfig(lines, filename)
+        Returns ConfigResolver of replacements in config lines.
+    configreplace(string, config_dict)
+        Returns replacement class for string, or string itself.
+    ConfigResolver(explicit, wildcard_class, wildcard_subclass)
+        Compiled config.  Resolves class labels with a cache of results.
+    fasclass(label, replace_dict)
+        Applies config replacement to TE label; returns (Class, Subclass).
+    classregistry(replace_dict)
+        Returns CategoryRegistry interning TE labels via fasclass().
     gethelp(filename)
         Reads formatted help file; returns mapping of topics to help strings.
 
-    fasgenome(fas_filename, replace_dict)
+    getsizes(filename)
+        Reads chrom.sizes or .fai file; returns mapping {Chromosome}>Length.
+    genomelength(argument)
+        Returns WG length given in bp or as a chrom.sizes or .fai file.
+    fasgenome(fas_filename, replace_dict, columns, cache_dir, coverage,
+            by_chromosome)
         Reads .fas file; returns mapping {TEClass}>{Subclass}>[Frequency, Length].
+    chromosomesections(sizes, chromosome_classes)
+        Returns writetbl() sections for chromosomes found in sizes.
     outgenome(fas_filename, out_filename, classes, region_length)
         Writes .tbl file based on output from fasgenome().
 
-    pidensity(pi_filename)
-        Reads RoI data; returns mapping {Chromosome Label}>[TE Start,TE End].
-    fasdensity(fas_filename, chromosomes, replace_dict)
+    fasbins(fas_filename, registry, columns, cache_dir)
+        Reads .fas file; returns {Chromosome}>(Starts, Ends, Categories).
+    writebins(out_prefix, te_dict, registry, sizes)
+        Writes windowed density of fasbins() output as bedGraph-style tables.
+
+    pidensity(pi_filename, columns, merge)
+        Reads RoI data; returns mapping {Chromosome Label}>IntervalIndex.
+    roilength(chromosomes)
+        Returns bp covered by RoIs of pidensity() output, each bp once.
+    fasdensity(fas_filename, chromosomes, replace_dict, columns, jobs,
+            cache_dir, coverage)
         Reads .fas file; returns map {TEClass}>{Subclass}>[Freq., OverlapLength].
     outdensity(fas_filename, out_filename, classes, region_length)
         Writes .tbl file based on output from fasdensity().
 
-    fasmatrix(fas_filename, replace_dict)
-        Reads .fas file; returns {Chromosome}>{TEClass}>{Sub}>[Pairs]>(Start,End).
-    pimatrix(pi_filename, te_dict)
+    fasmatrix(fas_filename, registry, columns, cache_dir)
+        Reads .fas file; returns {Chromosome}>(Starts, Ends, Categories).
+    pimatrix(pi_filename, te_dict, columns, jobs, roi_cache)
         Reads RoI data. Returns: dict of TE x RoI %-overlaps, list of keys.
-    outmatrix(out_filename, region_dict, region_keys)
+    regionmatrix(regions, chr_regions, te_dict, jobs, roi_cache)
+        Returns pimatrix() output for piregions() output.
+    assemblematrix(regions, hits)
+        Returns pimatrix() output for TE hits of each RoI.
+    regioncache(out_filename, fas_filename, fas_columns, config, opt_dict)
+        Returns rcroicache.RegionCache for MXROI output, if enabled.
+    outmatrix(out_filename, region_dict, region_keys, registry, transposed)
         Takes output from pimatrix() to write TE x RoI %-overlaps to file.
+    outsparse(out_filename, region_dict, region_keys, registry, by_region)
+        Takes output from pimatrix() to write nonzero %-overlaps, one per line.
+    writematrix(out_filename, region_dict, region_keys, registry, opt_dict)
+        Writes pimatrix() output as opt_dict selects:  dense or sparse.
     transpose(filename)
         Rewrites filename using the transpose of tab-delimited data in filename.
+
+    fasregions(fas_filename, registry, columns, cache_dir)
+        Reads .fas file; returns RegionIndex answering fasdensity() per region.
+
+    fascombined(fas_filename, chromosomes, registry, columns, jobs, cache_dir)
+        Reads .fas file once; returns fasgenome(), fasdensity(), fasmatrix().
+
+    batchfiles(pattern)
+        Expands glob or @list file; returns list of RoI file paths.
+    batchoutput(out_dir, pi_filename, extension)
+        Returns output path in out_dir named after RoI file.
+    fasbatch(fas_filename, registry, columns, cache_dir)
+        Reads .fas file once; returns TE data for densitybatch().
+    densitybatch(te, chromosomes, registry, jobs)
+        Returns map {TEClass}>{Subclass}>[Freq., OverlapLength], as fasdensity().
 """
 
 import re
 import os
 import sys
+import glob
+import json
+import hashlib
+import tempfile
+from array import array
+import modules.rcindex as rci
+import modules.rccolumns as rcc
+import modules.rcclasses as rcl
+import modules.rcparallel as rcp
+import modules.rccache as rck
+import modules.rcio as rco
+import modules.rcquery as rcq
+import modules.rcstats as rcs
+import modules.rcprogress as rcr
+import modules.rcroicache as rcv
+import modules.rcbins as rcb
+import modules.rccoverage as rcu
+
+# Bytes of input transpose() holds in memory at once.
+TRANSPOSE_BLOCK = 1 << 26
+# RoIs formatted at once by transposed outmatrix().
+MATRIX_CHUNK = 4096
+
 LOCAL_PATH = os.path.dirname(os.path.realpath(__file__)).strip('modules')
 
 ###############################################################################
 # Application functions
 
+@rcs.staged('config')
 def getconfig(filename):
     """
-    Take config filename.  Return dict of replacements.
+    Take config filename.  Return ConfigResolver of replacements.
+    """
+
+    with open(filename, 'r') as f:
+        return(parseconfig(f, filename))
+
+def parseconfig(lines, filename='config'):
+    """
+    Take config lines and a name for error messages.  Return
+    ConfigResolver of replacements.
+
+    lines may be an open config file or any iterable of strings.
     """
 
     def checkformat(string):
@@ -75,111 +160,123 @@ def getconfig(filename):
         'wildcard class': {},
         'wildcard subclass': {}}
 
-    with open(filename, 'r') as f:
-        for full_line in f:
-            line = full_line.strip()
+    for full_line in lines:
+        line = full_line.strip()
 
-            # Skip blank lines and comment-only lines
-            if not line:
-                continue
+        # Skip blank lines and comment-only lines
+        if not line:
+            continue
 
-            first_char = line[0]
-            if first_char in comments:
-                continue
+        first_char = line[0]
+        if first_char in comments:
+            continue
 
-            # Remove comments
-            line = re.split(';', re.split('#', line)[0])[0]
-        
-            strings = re.split('/', line)
-            # Strip new whitespace
-            strings = [x.strip() for x in strings]
+        # Remove comments
+        line = re.split(';', re.split('#', line)[0])[0]
+    
+        strings = re.split('/', line)
+        # Strip new whitespace
+        strings = [x.strip() for x in strings]
 
-            formatted, equal_sign = checkformat(line)
+        formatted, equal_sign = checkformat(line)
 
-            if formatted:
+        if formatted:
 
-                if equal_sign:
-                    terms = re.split('=', line)
-                else:
-                    terms = re.split(':', line)
+            if equal_sign:
+                terms = re.split('=', line)
+            else:
+                terms = re.split(':', line)
 
-                terms = [x.strip() for x in terms]
-                match_term = terms[0]
-                replace_term = terms[1]
+            terms = [x.strip() for x in terms]
+            match_term = terms[0]
+            replace_term = terms[1]
 
-                match_splits = re.split('/', match_term)
-                match_splits = [x.strip() for x in match_splits]
-                replace_splits = re.split('/', replace_term)
-                replace_splits = [x.strip() for x in replace_splits]
+            match_splits = re.split('/', match_term)
+            match_splits = [x.strip() for x in match_splits]
+            replace_splits = re.split('/', replace_term)
+            replace_splits = [x.strip() for x in replace_splits]
 
-                ###
-                # Parse match term
-                # Case match based on number of /
-                slashes = len(match_splits) - 1
+            ###
+            # Parse match term
+            # Case match based on number of /
+            slashes = len(match_splits) - 1
 
-                if slashes > 1:
-                    # Too many slashes.  Formatting error.
-                    print("Bad config line in " + filename + ":\n\t" + full_line)
-            
-                #elif slashes == 0:
-                    # Shouldn't be possible; blank lines should have already been skipped.
-            
-                elif slashes == 0:
-                    # Simple case.  Just a class.  Assume no wildcards.
-                    config_dict["explicit"][match_term] = replace_term
+            if slashes > 1:
+                # Too many slashes.  Formatting error.
+                print("Bad config line in " + filename + ":\n\t" + full_line)
+        
+            #elif slashes == 0:
+                # Shouldn't be possible; blank lines should have already been skipped.
+        
+            elif slashes == 0:
+                # Simple case.  Just a class.  Assume no wildcards.
+                config_dict["explicit"][match_term] = replace_term
+                continue
+        
+            elif slashes == 1:
+                # Complex case.  Class and subclass.
+                match_left = match_splits[0]
+                match_right = match_splits[1]
+                wildcard_class = False
+                wildcard_subclass = False
+
+                # Is left $?
+                if match_left == '$':
+                    wildcard_class = True
+
+                # Is right *?
+                if match_right == '*':
+                    wildcard_subclass = True
+
+                # Check for explicit class
+                if not (wildcard_class or wildcard_subclass):
+                    config_dict['explicit'][match_term] = replace_term
                     continue
-            
-                elif slashes == 1:
-                    # Complex case.  Class and subclass.
-                    match_left = match_splits[0]
-                    match_right = match_splits[1]
-                    wildcard_class = False
-                    wildcard_subclass = False
-
-                    # Is left $?
-                    if match_left == '$':
-                        wildcard_class = True
-
-                    # Is right *?
-                    if match_right == '*':
-                        wildcard_subclass = True
-
-                    # Check for explicit class
-                    if not (wildcard_class or wildcard_subclass):
-                        config_dict['explicit'][match_term] = replace_term
-                        continue
-
-                    # Were both wildcards given?
-                    if (wildcard_class and wildcard_subclass):
-                        print("Error - Both wildcards * and $ were given.  Omitting term.")
-                        continue
-
-                    # Handle last cases.
-                    if wildcard_class:
-                        config_dict['wildcard class'][match_right] = replace_splits[0:2]
-                    elif wildcard_subclass:
-                        config_dict['wildcard subclass'][match_left] = replace_splits[0:2]
 
-                else:
-                    #TODO error message.  Somehow, left_splits is negative.
-                    print("Bad config line in " + filename + ":\n\t" + full_line)
-                    print("Class/subclass structure violated.")
-                    sys.exit(1)
+                # Were both wildcards given?
+                if (wildcard_class and wildcard_subclass):
+                    print("Error - Both wildcards * and $ were given.  Omitting term.")
+                    continue
+
+                # Handle last cases.
+                if wildcard_class:
+                    config_dict['wildcard class'][match_right] = replace_splits[0:2]
+                elif wildcard_subclass:
+                    config_dict['wildcard subclass'][match_left] = replace_splits[0:2]
 
             else:
-                #TODO error message.
-                print("Bad config line format in " + filename + ":\n\t" + full_line)
+                #TODO error message.  Somehow, left_splits is negative.
+                print("Bad config line in " + filename + ":\n\t" + full_line)
+                print("Class/subclass structure violated.")
                 sys.exit(1)
 
-    return(config_dict)
+        else:
+            #TODO error message.
+            print("Bad config line format in " + filename + ":\n\t" + full_line)
+            sys.exit(1)
+
+    return(ConfigResolver(config_dict['explicit'],
+        config_dict['wildcard class'],
+        config_dict['wildcard subclass']))
 
 def configreplace(string, config_dict):
     """
     Take a class.  Return replacement class or original class.
+
+    If config_dict is a ConfigResolver, its cached result is returned.
+    """
+
+    try:
+        return(config_dict.resolve(string))
+    except AttributeError:
+        return(_configreplace(string, config_dict))
+
+def _configreplace(string, config_dict):
+    """
+    Take a class.  Return replacement class or original class, uncached.
     """
 
     string = string.strip()
-    output = string
     strings = re.split('/', string)
     slashes = len(strings) - 1
 
@@ -188,22 +285,17 @@ def configreplace(string, config_dict):
         print("Formatting error:  string %s does not meet input requirements for transposable element class/subclass labels." % string)
         sys.exit(1)
 
-    elif slashes == 0:
-        # Simple case.  Just a class.  Check against explicit matches.
-        for key in config_dict['explicit']:
-            if key == string:
-                return(config_dict['explicit'][key])
+    # First, see if it's explicit.
+    if string in config_dict['explicit']:
+        return(config_dict['explicit'][string])
 
+    if slashes == 0:
+        # Simple case.  Just a class, and no explicit match.
         return(string)
   
     elif slashes == 1:
         # Complex case.  Class and subclass.
-        # First, see if it's explicit.
-        for key in config_dict['explicit']:
-            if key == string:
-                return config_dict['explicit'][key]
-
-        # If not, check wildcards.
+        # If not explicit, check wildcards.
 
         class_key = strings[0]
         subclass_key = strings[1]
@@ -237,6 +329,92 @@ def configreplace(string, config_dict):
         # string into a string, without adding a / character.
         return str('/'.join(replacements))
 
+class ConfigResolver(dict):
+    """
+    Compiled config, as returned by getconfig().
+
+    Still maps 'explicit', 'wildcard class' and 'wildcard subclass' to their
+    dicts, so it may be used anywhere a plain config dict is.  An empty
+    ConfigResolver replaces nothing, and stands in for a missing config file.
+
+    resolve() looks up explicit and wildcard matches by key, and caches each
+    result, so a label is resolved only once however many TE lines carry it.
+    hits and misses count cache lookups.
+    """
+
+    def __init__(self, explicit=None, wildcard_class=None, \
+        wildcard_subclass=None):
+        dict.__init__(self)
+        self['explicit'] = explicit or {}
+        self['wildcard class'] = wildcard_class or {}
+        self['wildcard subclass'] = wildcard_subclass or {}
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+        rcs.source(self.counters)
+
+    def resolve(self, string):
+        """
+        Take a class.  Return replacement class or original class.
+        """
+
+        try:
+            result = self.cache[string]
+        except KeyError:
+            self.misses += 1
+            result = _configreplace(string, self)
+            self.cache[string] = result
+            return(result)
+        self.hits += 1
+        return(result)
+
+    def stats(self):
+        """
+        Return dict of cache counters:  labels, hits, misses.
+        """
+
+        return({'labels': len(self.cache),
+            'hits': self.hits,
+            'misses': self.misses})
+
+    def fingerprint(self):
+        """
+        Return hash of the replacements, the same for equal configs.
+        """
+
+        text = json.dumps([self['explicit'], self['wildcard class'],
+            self['wildcard subclass']], sort_keys=True)
+        return(hashlib.sha1(text.encode()).hexdigest())
+
+    def counters(self):
+        """
+        Return cache counters as rcstats names them.
+        """
+
+        return({'config cache hits': self.hits,
+            'config cache misses': self.misses})
+
+def fasclass(label, replace_dict):
+    """
+    Take raw TE class label.  Return (class, subclass) after replacement.
+
+    Labels lacking a subclass are routed to subclass "No subclass".
+    """
+
+    full_class = configreplace(re.split(r"\?", label)[0], replace_dict)
+
+    if "/" in full_class:
+        class_items = re.split(r"/", full_class)
+        return((class_items[0], class_items[1]))
+    return((full_class, "No subclass"))
+
+def classregistry(replace_dict):
+    """
+    Take config.  Return CategoryRegistry classifying labels with fasclass().
+    """
+
+    return(rcl.CategoryRegistry(lambda label: fasclass(label, replace_dict)))
+
 def gethelp(filename):
     """
     Reads formatted help file, then returns mapping of topics to help strings.
@@ -289,15 +467,36 @@ def gethelp(filename):
 ###############################################################################
 # Analysis functions
 
-def analysisA(args, opt_dict):
+def genomelength(argument):
+    """
+    Take WG length argument:  bp, or a chrom.sizes or .fai file.  Return
+    (length in bp, getsizes() output or None).
+
+    A file's length is the total of its sequences, less '_random' ones.
+    Raises ValueError or OSError if argument is neither.
+    """
+
     try:
-        length = int(args[0])
+        return((int(argument), None))
     except ValueError:
+        sizes = getsizes(argument)
+    return((sum(sizes[x] for x in sizes if "_random" not in x), sizes))
+
+def analysisA(args, opt_dict):
+    # The length is in bp, or a chrom.sizes or .fai file to total.
+    try:
+        length, sizes = genomelength(args[0])
+    except (OSError, ValueError):
         return(3)
+    if opt_dict.get('by_chromosome') and sizes is None:
+        return(7)
 
     fas_filename = args[1]
     skip = 0
-    columns = [0,2,3]
+    # Chromosome column 4 is kept from the RepeatMasker-style layout WG
+    # was written for, unless opt_dict['chromosome_column'] gives another.
+    chr_index = opt_dict.get('chromosome_column', 4)
+    columns = [0,chr_index,2,3]
 
     if opt_dict['A']:
         # Expects repeat class, start, end
@@ -307,6 +506,7 @@ def analysisA(args, opt_dict):
             columns = [int(x) for x in columns]
         except ValueError:
             return(2)
+        columns = [columns[0], chr_index, columns[1], columns[2]]
 
     out_filename = args[2 + skip]
 
@@ -317,18 +517,26 @@ def analysisA(args, opt_dict):
         config_filename = args[3 + skip]
         config = getconfig(config_filename)
     except IndexError:
-        config = {}
-
-    classes = fasgenome(fas_filename, config, columns)
+        config = ConfigResolver()
+
+    by_chromosome = bool(opt_dict.get('by_chromosome'))
+    classes = fasgenome(fas_filename, config, columns, opt_dict.get('cache'),
+        opt_dict.get('union'), by_chromosome)
+    sections = None
+    if by_chromosome:
+        classes, chromosome_classes = classes
+        sections = chromosomesections(sizes, chromosome_classes)
     writetbl(fas_filename,
         out_filename,
         classes,
-        length)
+        length,
+        sections)
     return(0)
 
 def analysisB(args, opt_dict):
+    # 'auto' takes the length of the merged RoIs.  See roilength().
     try:
-        length = int(args[0])
+        length = None if args[0] == 'auto' else int(args[0])
     except ValueError:
         return(3)
 
@@ -352,7 +560,7 @@ def analysisB(args, opt_dict):
     if opt_dict['B']:
         # Expects chromosome, start, end
         pi_skip = 3
-        pi_columns = args[(2 + fas_skip) : (5 + fas_skip)]
+        pi_columns = args[(3 + fas_skip) : (6 + fas_skip)]
         try:
             pi_columns = [int(x) for x in pi_columns]
         except ValueError:
@@ -366,11 +574,47 @@ def analysisB(args, opt_dict):
         config_filename = args[4 + fas_skip + pi_skip]
         config = getconfig(config_filename)
     except IndexError:
-        config = {}
-
-    chromosomes = pidensity(pi_filename, pi_columns)
-
-    classes = fasdensity(fas_filename, chromosomes, config, fas_columns)
+        config = ConfigResolver()
+
+    jobs = opt_dict.get('jobs', 1)
+    if jobs > 1 and not rcc.HAVE_NUMPY:
+        print("NumPy not found.  ROI analysis will run in a single process.")
+
+    if opt_dict.get('batch'):
+        # pi_filename is a pattern of RoI files, out_filename a directory.
+        pi_filenames = batchfiles(pi_filename)
+        if not pi_filenames:
+            return(4)
+        if not os.path.isdir(out_filename):
+            os.makedirs(out_filename)
+
+        registry = classregistry(config)
+        te = fasbatch(fas_filename, registry, fas_columns,
+            opt_dict.get('cache'))
+
+        for pi_filename in pi_filenames:
+            rcs.count('roi files')
+            chromosomes = pidensity(pi_filename, pi_columns,
+                opt_dict.get('merge'))
+            this_length = length or roilength(chromosomes)
+            if not this_length:
+                print("No RoI length in " + pi_filename + ".  Skipped.")
+                continue
+            classes = densitybatch(te, chromosomes, registry, jobs)
+            writetbl(fas_filename,
+                batchoutput(out_filename, pi_filename, '.tbl'),
+                classes,
+                this_length)
+        return(0)
+
+    chromosomes = pidensity(pi_filename, pi_columns, opt_dict.get('merge'))
+    if length is None:
+        length = roilength(chromosomes)
+        if not length:
+            return(3)
+
+    classes = fasdensity(fas_filename, chromosomes, config, fas_columns, jobs,
+        opt_dict.get('cache'), opt_dict.get('union'))
 
     writetbl(fas_filename,
         out_filename,
@@ -413,25 +657,272 @@ def analysisC(args, opt_dict):
         config_filename = args[3 + fas_skip + pi_skip]
         config = getconfig(config_filename)
     except IndexError:
-        config = {}
+        config = ConfigResolver()
+
+    registry = classregistry(config)
+
+    if opt_dict.get('batch'):
+        # pi_filename is a pattern of RoI files, out_filename a directory.
+        pi_filenames = batchfiles(pi_filename)
+        if not pi_filenames:
+            return(4)
+        if not os.path.isdir(out_filename):
+            os.makedirs(out_filename)
+
+        te_dict = fasmatrix(fas_filename, registry, fas_columns,
+            opt_dict.get('cache'))
+
+        for pi_filename in pi_filenames:
+            rcs.count('roi files')
+            batch_filename = batchoutput(out_filename, pi_filename, '.txt')
+            region_dict, region_keys = pimatrix(pi_filename, te_dict,
+                pi_columns, opt_dict.get('jobs', 1),
+                regioncache(batch_filename, fas_filename, fas_columns,
+                    config, opt_dict))
+            result = writematrix(batch_filename, region_dict, region_keys,
+                registry, opt_dict)
+        return(result)
 
     print("Loading TE data...") #TESTCODE
-    te_dict = fasmatrix(fas_filename, config, fas_columns)
-    print("Done.  Loading region of interest data...") #TESTCODE
-    region_dict, region_keys = pimatrix(pi_filename, te_dict, pi_columns)
-    print("Done.  Writing output data...") #TESTCODE
+    te_dict = fasmatrix(fas_filename, registry, fas_columns,
+        opt_dict.get('cache'))
+    roi_cache = regioncache(out_filename, fas_filename, fas_columns, config,
+        opt_dict)
+
+    def run():
+        print("Done.  Loading region of interest data...") #TESTCODE
+        region_dict, region_keys = pimatrix(pi_filename, te_dict, pi_columns,
+            opt_dict.get('jobs', 1), roi_cache)
+        print("Done.  Writing output data...") #TESTCODE
+
+        return(writematrix(out_filename, region_dict, region_keys, registry,
+            opt_dict))
+
+    result = run()
+
+    if opt_dict.get('watch'):
+        # TE data stays loaded; each rerun overlaps only changed RoIs.
+        rcv.watch(pi_filename, run)
+
+    return(result)
+
+def regioncache(out_filename, fas_filename, fas_columns, config, opt_dict):
+    """
+    Take MXROI output file, TE file, TE columns, config and options.
+    Return rcroicache.RegionCache for the output, or None unless
+    opt_dict['incremental'] or opt_dict['watch'] is set.
+
+    The cache is kept beside the output, or in opt_dict['cache'] if that
+    is a directory.
+    """
+
+    if not (opt_dict.get('incremental') or opt_dict.get('watch')):
+        return(None)
+    return(rcv.RegionCache(rcv.cachepath(out_filename, opt_dict.get('cache')),
+        rcv.cachekey(fas_filename, fas_columns, config)))
+
+def analysisAll(args, opt_dict):
+    # Combined mode has no batch, incremental or watch runs, union coverage
+    # or per-chromosome blocks.
+    if any(opt_dict.get(x) for x in ['batch', 'incremental', 'watch',
+        'union', 'by_chromosome']):
+        return(8)
+
+    # Genome length for WG, as for analysisA(), then RoI length for ROI,
+    # as for analysisB().
+    try:
+        genome_length = genomelength(args[0])[0]
+        length = None if args[1] == 'auto' else int(args[1])
+    except (IndexError, OSError, ValueError):
+        return(3)
+    args = args[1:]
+
+    fas_filename = args[1]
+    fas_skip = 0
+    fas_columns = [0,1,2,3]
+
+    if opt_dict['A']:
+        # Expects repeat class, chromosome, start, end
+        fas_skip = 4
+        fas_columns = args[2:6]
+        try:
+            fas_columns = [int(x) for x in fas_columns]
+        except ValueError:
+            return(2)
+
+    pi_filename = args[2 + fas_skip]
+    pi_skip = 0
+    pi_columns = [0,1,2,3]
+
+    if opt_dict['B']:
+        # Expects id, chromosome, start, end
+        pi_skip = 4
+        pi_columns = args[(3 + fas_skip) : (7 + fas_skip)]
+        try:
+            pi_columns = [int(x) for x in pi_columns]
+        except ValueError:
+            return(2)
 
-    result = outmatrix(out_filename, region_dict, region_keys)
+    # Outputs are named by adding .wg.tbl, .roi.tbl and .mxroi.txt
+    out_prefix = args[3 + fas_skip + pi_skip]
+    if "/" not in out_prefix:
+        out_prefix = os.path.join(LOCAL_PATH, 'output', out_prefix)
 
-    if opt_dict['t']:
-        result = transpose(out_filename)
+    try:
+        config_filename = args[4 + fas_skip + pi_skip]
+        config = getconfig(config_filename)
+    except IndexError:
+        config = ConfigResolver()
+
+    registry = classregistry(config)
+    jobs = opt_dict.get('jobs', 1)
+
+    regions, chr_regions = piregions(pi_filename, pi_columns)
+    chromosomes = {}
+    with rcs.stage('roi parse'):
+        for key in chr_regions:
+            # MXROI keeps every RoI.  ROI may merge them; see pidensity().
+            if opt_dict.get('merge'):
+                chromosomes[key] = rci.IntervalIndex(
+                    rci.mergeintervals(chr_regions[key]))
+            else:
+                chromosomes[key] = rci.IntervalIndex(chr_regions[key])
+
+    if length is None:
+        length = roilength(chromosomes)
+        if not length:
+            return(3)
+    # RoIs lie within the genome.  Anything else is likely the two lengths
+    # swapped.
+    if genome_length < length:
+        return(3)
+
+    genome_classes, density_classes, te_dict = fascombined(fas_filename,
+        chromosomes, registry, fas_columns, jobs, opt_dict.get('cache'))
+
+    writetbl(fas_filename,
+        out_prefix + '.wg.tbl',
+        genome_classes,
+        genome_length)
+    writetbl(fas_filename,
+        out_prefix + '.roi.tbl',
+        density_classes,
+        length)
+
+    region_dict, region_keys = regionmatrix(regions, chr_regions, te_dict,
+        jobs)
+    result = writematrix(out_prefix + '.mxroi.txt', region_dict, region_keys,
+        registry, opt_dict)
 
     return(result)
 
+def analysisQ(args, opt_dict):
+    fas_filename = args[0]
+    fas_skip = 0
+    fas_columns = [0,1,2,3]
+
+    if opt_dict['A']:
+        # Expects repeat class, chromosome, start, end
+        fas_skip = 4
+        fas_columns = args[1:5]
+        try:
+            fas_columns = [int(x) for x in fas_columns]
+        except ValueError:
+            return(2)
+
+    # Regions, then optionally a config file.
+    region_strings = args[1 + fas_skip:]
+    config = ConfigResolver()
+    if region_strings and os.path.isfile(region_strings[-1]):
+        config = getconfig(region_strings[-1])
+        region_strings = region_strings[:-1]
+
+    try:
+        regions = [rcq.parseregion(x) for x in region_strings]
+    except ValueError:
+        return(5)
+    if not regions:
+        return(5)
+
+    registry = classregistry(config)
+    index = fasregions(fas_filename, registry, fas_columns,
+        opt_dict.get('cache'))
+
+    with rcs.stage('write'):
+        for region_string, region in zip(region_strings, regions):
+            classes = index.query(*region)
+            for superclass in classes:
+                for subclass in classes[superclass]:
+                    frequency, length = classes[superclass][subclass]
+                    print('\t'.join([region_string, superclass, subclass,
+                        str(frequency), str(length)]))
+
+    return(0)
+
+def analysisW(args, opt_dict):
+    try:
+        sizes = rcb.parsesizes(args[0])
+    except ValueError:
+        return(6)
+
+    fas_filename = args[1]
+    fas_skip = 0
+    fas_columns = [0,1,2,3]
+
+    if opt_dict['A']:
+        # Expects repeat class, chromosome, start, end
+        fas_skip = 4
+        fas_columns = args[2:6]
+        try:
+            fas_columns = [int(x) for x in fas_columns]
+        except ValueError:
+            return(2)
+
+    # Outputs are named by adding the bin width, the class and .bedGraph
+    out_prefix = args[2 + fas_skip]
+    if "/" not in out_prefix:
+        out_prefix = os.path.join(LOCAL_PATH, 'output', out_prefix)
+
+    try:
+        config_filename = args[3 + fas_skip]
+        config = getconfig(config_filename)
+    except IndexError:
+        config = ConfigResolver()
+
+    registry = classregistry(config)
+    te_dict = fasbins(fas_filename, registry, fas_columns,
+        opt_dict.get('cache'))
+    return(writebins(out_prefix, te_dict, registry, sizes))
+
 ###############################################################################
 # Genome density function chain
 
-def fasgenome(fas_filename, replace_dict, columns):
+def getsizes(filename):
+    """
+    Reads chrom.sizes or FASTA .fai file; returns {Chromosome}>Length.
+
+    Both have a sequence name, then its length, on each line, separated by
+    tabs.  Further columns, as in .fai files, and lines starting with '#'
+    are ignored.  Chromosomes are in file order.  Raises ValueError on a
+    line without a length, or on a file without chromosomes.
+    """
+
+    sizes = {}
+    with rco.openinput(filename) as f:
+        for line in f:
+            line_list = line.split()
+            if not line_list or line_list[0].startswith('#'):
+                continue
+            try:
+                sizes[line_list[0]] = int(line_list[1])
+            except (IndexError, ValueError):
+                raise ValueError("Not a chrom.sizes or .fai line:  %r" % line)
+    if not sizes:
+        raise ValueError("No chromosomes in " + filename)
+    return(sizes)
+
+def fasgenome(fas_filename, replace_dict, columns, cache_dir=None,
+    coverage=False, by_chromosome=False):
     """
     Reads .fas file, and returns mapping {TEClass}>{Subclass}>[Frequency, Length].
 
@@ -442,79 +933,148 @@ def fasgenome(fas_filename, replace_dict, columns):
     List contains
         1.  Frequency of subclass
         2.  Total length of TE subclass, in bp's
+    The mapping is an rcclasses.ClassTotals, accumulated per category code.
+
+    Uses the NumPy columnar loader in rccolumns.py when NumPy is available.
+    Unless cache_dir is None, parsed data is then kept in an index file by
+    rccache.py; see rccache.loadcolumns().
+
+    columns are [class, chromosome, start, end].  The chromosome column is
+    used to skip '_random' chromosomes, and to group TEs by chromosome.
+
+    With coverage, lengths are union coverage per chromosome instead of
+    summed TE lengths, and an rccoverage.CoverageTotals is returned.
+
+    With by_chromosome, returns (classes, {Chromosome}>classes) instead,
+    with the same totals for each chromosome's TEs alone.  These are kept
+    in the same pass, chromosomes in order of first appearance.
     """
 
     id_index = columns[0]
-    start_index = columns[1]
-    end_index = columns[2]
+    chr_index = columns[1]
+    start_index = columns[2]
+    end_index = columns[3]
 
-    classes = {}
+    if rcc.HAVE_NUMPY:
+        with rcs.stage('te parse'):
+            te = rck.loadcolumns(fas_filename,
+                [id_index, chr_index, start_index, end_index],
+                classregistry(replace_dict), cache_dir)
+        with rcs.stage('aggregation'):
+            classes = rcc.genomeclasses(te)
+            chromosome_classes = {}
+            if by_chromosome:
+                chromosome_classes = rcc.chromosomeclasses(te)
+            if coverage:
+                te_dict = rcc.binranges(te)
+                classes, chromosome_classes = _genomecoverage(classes,
+                    chromosome_classes, te_dict)
+            if by_chromosome:
+                return((classes, chromosome_classes))
+            return(classes)
+
+    registry = classregistry(replace_dict)
+    classes = rcl.ClassTotals(registry)
+    # Map chromosome to ClassTotals of its TEs, for by_chromosome
+    chromosome_classes = {}
+    # Map chromosome to (starts, ends, categories), for coverage
+    te_dict = {}
+    lines = 0
+    skipped = 0
     
-    with open(fas_filename, "r") as f:
+    with rcs.stage('te parse'), rco.openinput(fas_filename) as f:
         # Skip header line
         f.readline()
     
         for line in f:
-
-            ## Remove newline, extraneous whitespace.
-            line = line.strip('\n').strip()
+            lines += 1
 
             # Split line on white space
-            line_list = re.split(r"\s*", line)
-
-            # Handle special cases of classes.
-            full_class = re.split(r"\?", line_list[id_index])[0]
-
-            full_class = configreplace(full_class, replace_dict)
+            line_list = line.split()
 
             # Determine if this chromosome was considered in other studies.
-            chromosome = line_list[4]
+            chromosome = line_list[chr_index]
             #TODO:  HARDCODING ISSUE
             # Should we consider chrY_random since we aren't matching to piRNA?
             if "_random" in chromosome:
+                skipped += 1
                 continue
 
-            length = int(line_list[end_index]) - int(line_list[start_index])
+            this_start = int(line_list[start_index])
+            this_end = int(line_list[end_index])
 
-            if "/" in full_class:
-                # Split on /
-                superclass, subclass = re.split(r"/", full_class)
+            # Class and subclass are looked up by code, after config
+            # replacement.  See fasclass().
+            category = registry.code(line_list[id_index])
+            classes.add(category, this_end - this_start)
+
+            if by_chromosome:
+                if chromosome not in chromosome_classes:
+                    chromosome_classes[chromosome] = rcl.ClassTotals(registry)
+                chromosome_classes[chromosome].add(category,
+                    this_end - this_start)
+
+            if coverage:
+                if chromosome not in te_dict:
+                    te_dict[chromosome] = ([], [], [])
+                te_dict[chromosome][0].append(this_start)
+                te_dict[chromosome][1].append(this_end)
+                te_dict[chromosome][2].append(category)
+
+    rcs.count('te lines', lines)
+    rcs.count('random rows skipped', skipped)
+    if coverage:
+        with rcs.stage('aggregation'):
+            classes, chromosome_classes = _genomecoverage(classes,
+                chromosome_classes, te_dict)
+    if by_chromosome:
+        return((classes, chromosome_classes))
+    return(classes)
 
-                if superclass in classes:
-                    # Found class.  Does it also have this subclass?
-                    this_class = classes[superclass]
+def _genomecoverage(classes, chromosome_classes, te_dict):
+    """
+    Take genome ClassTotals, {Chromosome}>ClassTotals and fasbins() form of
+    the same TEs.  Return both as rccoverage.CoverageTotals.
+    """
 
-                    if subclass in this_class:
-                        # Yes, so add to the data
-                        this_class[subclass][0] += 1
-                        this_class[subclass][1] += length
-                    else:
-                        # No, so add the subclass
-                        this_class[subclass] = [1, length]
-
-                else:
-                    # Missing superclass - add superclass and subclass 
-                    # to classes.  Initialize count and length of subclass.
-                    classes[superclass] = {subclass: [1, length]}
-            else:
-                # No /, so route to subclass "No subclass".
-                if full_class in classes:
-                    try:
-                        # Found class. Update data.
-                        classes[full_class]["No subclass"][0] += 1
-                        classes[full_class]["No subclass"][1] += length
-                    except KeyError:
-                        # Missing subclass.  Initialize.
-                        classes[full_class]["No subclass"] = [1, length]
-                else:
-                    # full_class is missing altogether.
-                    # Initialize full_class and OTHER.
-                    classes[full_class] = {"No subclass": [1, length]}
+    chromosome_coverage = {}
+    for chromosome, totals in chromosome_classes.items():
+        chromosome_coverage[chromosome] = rcu.CoverageTotals(totals,
+            {chromosome: te_dict[chromosome]})
+    return((rcu.CoverageTotals(classes, te_dict), chromosome_coverage))
 
+def chromosomesections(sizes, chromosome_classes):
+    """
+    Take getsizes() output and {Chromosome}>ClassTotals from fasgenome().
+    Return writetbl() sections:  list of (Chromosome, ClassTotals, Length).
 
-    return(classes)
+    Sections are in the order of sizes.  Chromosomes are matched by name,
+    or failing that with 'chr' stripped from both.  Chromosomes with TEs
+    but no length are reported and left out.
+    """
 
-def writetbl(fas_filename, out_filename, classes, region_length):
+    stripped = {}
+    for chromosome in sizes:
+        stripped.setdefault(chromosome.strip('chr'), chromosome)
+
+    # Map size file name to TE file chromosome
+    found = {}
+    for chromosome in chromosome_classes:
+        name = chromosome
+        if name not in sizes:
+            name = stripped.get(chromosome.strip('chr'))
+        if name is None:
+            print("No length for chromosome " + chromosome + \
+                ".  Left out of per-chromosome sections.")
+            continue
+        found[name] = chromosome
+
+    return([(found[x], chromosome_classes[found[x]], sizes[x]) \
+        for x in sizes if x in found])
+
+@rcs.staged('write')
+def writetbl(fas_filename, out_filename, classes, region_length,
+    sections=None):
     """
     Writes .tbl file based on output from fasgenome().
 
@@ -525,155 +1085,295 @@ def writetbl(fas_filename, out_filename, classes, region_length):
     (For each Class)
     Total Interspersed Repeats
     Singleton Classes
+    (Coverage depth, for union coverage)
+
+    If classes is an rccoverage.CoverageTotals, class totals, Unclassified
+    and Total interspersed repeats are bp covered by the union of their
+    TEs, not sums of subclass lengths, and a depth histogram is added.
+
+    sections is a list of (Chromosome, classes, Length), from
+    chromosomesections().  Each is written after the genome as a block of
+    its own, with a 'chromosome:' line in its header.
+
+    Each block is built as a list of strings and joined, and the file is
+    written once.  out_filename ending in '.gz' is gzipped.
+    """
+
+    blocks = [_tblblock(fas_filename, classes, region_length)]
+    for chromosome, chromosome_classes, length in sections or []:
+        blocks.append(_tblblock(fas_filename, chromosome_classes, length,
+            chromosome))
+    with rco.openoutput(out_filename) as out:
+        out.write('\n'.join(blocks))
+
+def _tblblock(fas_filename, classes, region_length, chromosome=None):
+    """
+    Take writetbl() arguments for one block, with its chromosome label if a
+    per-chromosome block.  Return the block as a string.
     """
 
     eqblock = "="*50 + '\n'
+    union = isinstance(classes, rcu.CoverageTotals)
+
+    out = []
+    out.append(eqblock)
+    out.append("filename: " + re.split(".out", fas_filename)[0] + '\n')
+    if chromosome is not None:
+        out.append("chromosome: " + chromosome + '\n')
+    out.append("total length: " + str(region_length) + '\n')
+    if union:
+        out.append("lengths: union coverage\n")
+    out.append(eqblock)
+    out.append("               number of      length   percentage\n")
+    out.append("               elements*    occupied  of sequence\n")
+    out.append("-"*50+'\n')
+
+    precision = 3
+    keys = list(classes.keys())
+    tir = 0
+
+    # SINE LINE LTR elements DNA elements 
+    main_keys = ['SINE','LINE','LTR','DNA']
+
+    for key in main_keys:
+        # A chromosome's block may lack a class found genome-wide.
+        if chromosome is not None and key not in classes:
+            continue
+        subclass_keys = list(classes[key].keys())
+        # Calculate total class data from subclass data
+        # [sum of frequencies, sum of lengths, percent overlap with genome]
+        class_totals = [0,0,0]
+
+        for sub_key in subclass_keys:
+            class_totals[0] += classes[key][sub_key][0]
+            class_totals[1] += classes[key][sub_key][1]
+        if union:
+            class_totals[1] = classes.grouplength([key])
+
+        class_totals[2] = round(100 * class_totals[1] / region_length, precision)
+        ir_string = str(class_totals[2])
+        if ir_string == '0.0':
+            ir_string = ''.join(['< 0.', ('0' * precision), '5'])
+
+        tir += class_totals[1]
+
+        # Write class data
+        # Note that 'out.append('a' + 'b' + ...)' breaks in some Pythons.
+        out_list = ['\n', key, ':', '\t' * 2, \
+            str(class_totals[0]), '\t', \
+            str(class_totals[1]), ' bp\t', \
+            ir_string, ' %\n']
+        out.append(''.join(out_list))
+
+        # Write subclass data
+        # Check for 'No subclass' data.  Remove from key list if present.
+        try:
+            subclass_keys.remove('No subclass')
+            has_no_subclass = True
+        except ValueError:
+            has_no_subclass = False
 
-    with open(out_filename,'w') as out:
-        out.write(eqblock)
-        out.write("filename: " + re.split(".out", fas_filename)[0] + '\n')
-        out.write("total length: " + str(region_length) + '\n')
-        out.write(eqblock)
-        out.write("               number of      length   percentage\n")
-        out.write("               elements*    occupied  of sequence\n")
-        out.write("-"*50+'\n')
+        for sub_key in subclass_keys:
+            totals = round(100 * classes[key][sub_key][1] / \
+                region_length, precision)
+            ir_string = str(totals)
+            if ir_string == '0.0':
+                ir_string = ''.join(['< 0.', ('0' * precision), '5'])
 
-        precision = 3
-        keys = list(classes.keys())
-        tir = 0
+            out_list = [" " * 6, sub_key, '\t', \
+                str(classes[key][sub_key][0]), '\t', \
+                str(classes[key][sub_key][1]), ' bp\t', \
+            ir_string, ' %\n']
+            out.append(''.join(out_list))
+
+        # Write 'No subclass' data, if present.
+        if has_no_subclass:
+            totals = round(100 * classes[key]['No subclass'][1] / \
+                region_length, precision)
+            ir_string = str(totals)
+            if ir_string == '0.0':
+                ir_string = ''.join(['< 0.', ('0' * precision), '5'])
 
-        # SINE LINE LTR elements DNA elements 
-        main_keys = ['SINE','LINE','LTR','DNA']
+            out_list = [" " * 6, 'No subclass\t', \
+                str(classes[key]['No subclass'][0]), '\t', \
+                str(classes[key]['No subclass'][1]), ' bp\t', \
+            ir_string, ' %\n']
+            out.append(''.join(out_list))
 
-        for key in main_keys:
+
+    # Handle Unknown, Other, and Unclassified
+    un_keys = ['Unknown', 'Other', 'Unclassified']
+    un_totals = [0,0,0]
+    for key in un_keys:
+        try:
             subclass_keys = list(classes[key].keys())
-            # Calculate total class data from subclass data
-            # [sum of frequencies, sum of lengths, percent overlap with genome]
-            class_totals = [0,0,0]
+        except KeyError:
+            continue
+        for sub_key in subclass_keys:
+            un_totals[0] += classes[key][sub_key][0]
+            un_totals[1] += classes[key][sub_key][1]
+    if union:
+        un_totals[1] = classes.grouplength(un_keys)
+
+    tir += un_totals[1]
+    if union:
+        tir = classes.grouplength(main_keys + un_keys)
+
+    un_totals[2] += round(100 * un_totals[1] / region_length, precision)
+    if un_totals[1]:
+        # Don't execute anything here if there's nothing to report.
+        # Thus, we condition on whether or not un_totals is 0.
+        ir_string = str(un_totals[2])
+        if ir_string == '0.0':
+            ir_string = ''.join(['< 0.', ('0' * precision), '5'])
+
+        un_list = ['\nUnclassified:\t\t', \
+            str(un_totals[0]), '\t', \
+            str(un_totals[1]), 'bp\t', \
+            ir_string, '%\n']
+        
+        out.append(''.join(un_list))
+
+    # Calculate and write total interspersed repeats
+    tir_density = str(round((100 * tir / region_length), precision))
+    if tir_density == '0.0':
+        tir_density = ''.join(['< 0.', ('0' * precision), '5'])
+
+    out.append("Total interspersed repeats:\t" + \
+        str(tir) + 'bp\t' + \
+        tir_density + '%\n\n\n')
+
+    # Handle remaining classes
+    keys = [x for x in keys if x not in (main_keys + un_keys)]
+    for key in keys:
+        subclass_keys = list(classes[key].keys())
+        class_totals = [0,0,0]
+
+        for sub_key in subclass_keys:
+            class_totals[0] += classes[key][sub_key][0]
+            class_totals[1] += classes[key][sub_key][1]
+        if union:
+            class_totals[1] = classes.grouplength([key])
+
+        class_totals[2] = 100 * class_totals[1] / region_length
+
+        # Unlike the classes above, remaining classes below the precision
+        # print as 0.0, as in the original release.
+        ir_string = str(round(class_totals[2], precision))
+
+        out_list = ['\n', key, ':', '\t' * 2, \
+            str(class_totals[0]), '\t', \
+            str(class_totals[1]), ' bp\t', \
+            ir_string, ' %\n']
+        out.append(''.join(out_list))
+
+    if union:
+        # bp covered by exactly 1, 2, and 3 or more TEs
+        depths = [classes.depths.get(1, 0), classes.depths.get(2, 0),
+            sum(y for x, y in classes.depths.items() if x >= 3)]
+        out.append("\nCoverage depth:\n")
+        for label, length in zip(['1 TE', '2 TEs', '3+ TEs'], depths):
+            ir_string = str(round(100 * length / region_length, precision))
+            if ir_string == '0.0' and length:
+                ir_string = ''.join(['< 0.', ('0' * precision), '5'])
+            out.append(''.join([" " * 6, label, '\t', str(length), \
+                ' bp\t', ir_string, ' %\n']))
 
-            for sub_key in subclass_keys:
-                class_totals[0] += classes[key][sub_key][0]
-                class_totals[1] += classes[key][sub_key][1]
+    out.append(eqblock)
+    return(''.join(out))
 
-            class_totals[2] = round(100 * class_totals[1] / region_length, precision)
-            ir_string = str(class_totals[2])
-            if ir_string == '0.0':
-                ir_string = ''.join(['< 0.', ('0' * precision), '5'])
+###############################################################################
+# Windowed density function chain
 
-            tir += class_totals[1]
+def fasbins(fas_filename, registry, columns, cache_dir=None):
+    """
+    Reads .fas file; returns {Chromosome}>(Starts, Ends, Categories).
 
-            # Write class data
-            # Note that 'out.write('a' + 'b' + ...)' breaks in some Pythons.
-            out_list = ['\n', key, ':', '\t' * 2, \
-                str(class_totals[0]), '\t', \
-                str(class_totals[1]), ' bp\t', \
-                ir_string, ' %\n']
-            out.write(''.join(out_list))
+    Input:
+        fas_filename:  File path to multiclass data
+        registry:  CategoryRegistry interning TE labels, from classregistry()
+        columns:  Column indices of [class, chromosome, start, end]
+        cache_dir:  Index file directory, as for fasdensity()
+    Output:
+        te_dict:  Maps chromosomes to three equal-length integer arrays:
+            TE starts, TE ends and TE category codes in registry.
 
-            # Write subclass data
-            # Check for 'No subclass' data.  Remove from key list if present.
-            try:
-                subclass_keys.remove('No subclass')
-                has_no_subclass = True
-            except ValueError:
-                has_no_subclass = False
-
-            for sub_key in subclass_keys:
-                totals = round(100 * classes[key][sub_key][1] / \
-                    region_length, precision)
-                ir_string = str(totals)
-                if ir_string == '0.0':
-                    ir_string = ''.join(['< 0.', ('0' * precision), '5'])
-
-                out_list = [" " * 6, sub_key, '\t', \
-                    str(classes[key][sub_key][0]), '\t', \
-                    str(classes[key][sub_key][1]), ' bp\t', \
-                ir_string, ' %\n']
-                out.write(''.join(out_list))
-
-            # Write 'No subclass' data, if present.
-            if has_no_subclass:
-                totals = round(100 * classes[key]['No subclass'][1] / \
-                    region_length, precision)
-                ir_string = str(totals)
-                if ir_string == '0.0':
-                    ir_string = ''.join(['< 0.', ('0' * precision), '5'])
-
-                out_list = [" " * 6, 'No subclass\t', \
-                    str(classes[key]['No subclass'][0]), '\t', \
-                    str(classes[key]['No subclass'][1]), ' bp\t', \
-                ir_string, ' %\n']
-                out.write(''.join(out_list))
-
-
-        # Handle Unknown, Other, and Unclassified
-        un_keys = ['Unknown', 'Other', 'Unclassified']
-        un_totals = [0,0,0]
-        for key in un_keys:
-            try:
-                subclass_keys = list(classes[key].keys())
-            except KeyError:
-                continue
-            for sub_key in subclass_keys:
-                un_totals[0] += classes[key][sub_key][0]
-                un_totals[1] += classes[key][sub_key][1]
+    Unlike fasmatrix(), chromosome labels are kept as found in the file,
+    e.g. 'chr7', since they are written to bedGraph output, and TEs stay in
+    file order.  '_random' chromosomes are left out, as by fasgenome().
 
-        tir += un_totals[1]
+    Uses the NumPy columnar loader in rccolumns.py when NumPy is available.
+    """
 
-        un_totals[2] += round(100 * un_totals[1] / region_length, precision)
-        if un_totals[1]:
-            # Don't execute anything here if there's nothing to report.
-            # Thus, we condition on whether or not un_totals is 0.
-            ir_string = str(un_totals[2])
-            if ir_string == '0.0':
-                ir_string = ''.join(['< 0.', ('0' * precision), '5'])
-    
-            un_list = ['\nUnclassified:\t\t', \
-                str(un_totals[0]), '\t', \
-                str(un_totals[1]), 'bp\t', \
-                ir_string, '%\n']
-            
-            out.write(''.join(un_list))
+    id_index = columns[0]
+    chr_index = columns[1]
+    start_index = columns[2]
+    end_index = columns[3]
 
-        # Calculate and write total interspersed repeats
-        tir_density = str(round((100 * tir / region_length), precision))
-        if tir_density == '0.0':
-            tir_density = ''.join(['< 0.', ('0' * precision), '5'])
+    if rcc.HAVE_NUMPY:
+        with rcs.stage('te parse'):
+            te = rck.loadcolumns(fas_filename, columns, registry, cache_dir)
+            return(rcc.binranges(te))
 
-        out.write("Total interspersed repeats:\t" + \
-            str(tir) + 'bp\t' + \
-            tir_density + '%\n\n\n')
+    te_dict = {}
+    lines = 0
+    skipped = 0
 
-        # Handle remaining classes
-        keys = [x for x in keys if x not in (main_keys + un_keys)]
-        for key in keys:
-            subclass_keys = list(classes[key].keys())
-            class_totals = [0,0,0]
+    with rcs.stage('te parse'), rco.openinput(fas_filename) as f:
+        # Skip header line
+        f.readline()
 
-            for sub_key in subclass_keys:
-                class_totals[0] += classes[key][sub_key][0]
-                class_totals[1] += classes[key][sub_key][1]
+        for line in f:
+            lines += 1
+            line_list = line.split()
 
-            class_totals[2] = 100 * class_totals[1] / region_length
+            chromosome = line_list[chr_index]
+            #TODO:  HARDCODING ISSUE
+            if "_random" in chromosome:
+                skipped += 1
+                continue
 
-            ir_string = str(round(class_totals[2], precision))
-            if ir_string is '0.0':
-                ir_string = ''.join(['< 0.', ('0' * precision), '5'])
+            if chromosome not in te_dict:
+                te_dict[chromosome] = (array('q'), array('q'), array('q'))
+            starts, ends, categories = te_dict[chromosome]
+            starts.append(int(line_list[start_index]))
+            ends.append(int(line_list[end_index]))
+            categories.append(registry.code(line_list[id_index]))
 
-            out_list = ['\n', key, ':', '\t' * 2, \
-                str(class_totals[0]), '\t', \
-                str(class_totals[1]), ' bp\t', \
-                ir_string, ' %\n']
-            out.write(''.join(out_list))
+    rcs.count('te lines', lines)
+    rcs.count('random rows skipped', skipped)
+    return(te_dict)
+
+def writebins(out_prefix, te_dict, registry, sizes):
+    """
+    Takes output from fasbins() to write windowed TE density.
+
+    For each bin width in sizes, one bedGraph-style table is written per
+    class, named out_prefix, the width and the class, e.g.
+    out.100kb.SINE.bedGraph.  See rcbins.BinWriter for the layout.
 
-        out.write(eqblock)
+    Chromosomes are binned one at a time, for every width at once, so only
+    one chromosome's bins are held in memory.
+    """
+
+    codes = rcb.categoryorder(te_dict)
+    with rcb.BinWriter(out_prefix, registry, codes, sizes) as writer:
+        for chromosome, (starts, ends, categories) in te_dict.items():
+            rcr.check()
+            with rcs.stage('aggregation'):
+                bins = rcb.chromosomebins(starts, ends, categories, sizes)
+            with rcs.stage('write'):
+                writer.write(chromosome, *bins)
+
+    return(0)
 
 ###############################################################################
 # Overlap density function chain
 
-def pidensity(pi_filename, columns):
+@rcs.staged('roi parse')
+def pidensity(pi_filename, columns, merge=False):
     """
-    Reads .gff file; returns mapping {Chromosome Label}>[TE Start,TE End].
+    Reads .gff file; returns mapping {Chromosome Label}>IntervalIndex.
 
     Expects either 1 header line or no header line.
     This is checked by attempting to cast the first item in the first line
@@ -681,6 +1381,13 @@ def pidensity(pi_filename, columns):
     If this succeeds, iteration proceeds as normal for the first line.
     If this check fails (ValueError), exactly 1 header line is assumed,
     and execution jumps to the next line in the file buffer.
+
+    Each chromosome's [start, end] pairs are built into an
+    rcindex.IntervalIndex so fasdensity() can query overlaps directly.
+
+    With merge, RoIs sharing a position are first merged by
+    rcindex.mergeintervals(), so that a TE overlapping duplicate or
+    overlapping RoIs has each bp counted once.
     """
 
     chr_index = columns[0]
@@ -689,20 +1396,20 @@ def pidensity(pi_filename, columns):
 
     # Create chromosome dict.
     chromosomes = {}
+    lines = 0
     
     # Fill chromosome dict.
-    with open(pi_filename, "r") as pi:
+    with rco.openinput(pi_filename) as pi:
         # Skip header line
         pi.readline()
 
         for line in pi:
-            keys = list(chromosomes.keys())
             line = line.strip()
-            line_list = re.split(r"\s*", line)
+            line_list = line.split()
 
             key = line_list[chr_index].strip('chr')
 
-            if key not in keys:
+            if key not in chromosomes:
                 chromosomes[key] = []
 
             # Append [start,end]
@@ -713,10 +1420,40 @@ def pidensity(pi_filename, columns):
                 print("ValueError in line:")
                 print(line)
                 sys.exit(1)
+            lines += 1
     # pi_filename closed.
+
+    rcs.count('roi lines', lines)
+
+    merged = 0
+    for key in chromosomes:
+        if merge:
+            ranges = rci.mergeintervals(chromosomes[key])
+            merged += len(chromosomes[key]) - len(ranges)
+            chromosomes[key] = ranges
+        chromosomes[key] = rci.IntervalIndex(chromosomes[key])
+    if merge:
+        rcs.count('rois merged', merged)
+
     return(chromosomes)
 
-def fasdensity(fas_filename, chromosomes, replace_dict, columns):
+def roilength(chromosomes):
+    """
+    Take pidensity() output.  Return total length of RoIs, in bp.
+
+    Overlapping RoIs are merged first, so each bp is counted once, whether
+    or not pidensity() merged them.  Used in place of a length given by
+    the user.
+    """
+
+    length = 0
+    for index in chromosomes.values():
+        for start, end in rci.mergeintervals(list(index)):
+            length += end - start
+    return(length)
+
+def fasdensity(fas_filename, chromosomes, replace_dict, columns, jobs=1,
+    cache_dir=None, coverage=False):
     """
     Reads .fas file; returns map {TEClass}>{Subclass}>[Frequency, OverlapLength].
     
@@ -725,11 +1462,24 @@ def fasdensity(fas_filename, chromosomes, replace_dict, columns):
 
     Input:
         fas_filename:  File path to multiclass data
-        chromosomes:  A dict mapping chromosome labels to a 
-            list of integer pairs
+        chromosomes:  A dict mapping chromosome labels to an
+            IntervalIndex of RoI ranges, as returned by pidensity()
         replace_dict: A dict mapping search terms to replacement terms
+        jobs:  Number of worker processes.  Ignored without NumPy.
+        cache_dir:  Index file directory for rccache.py, '' to keep index
+            files beside fas_filename, or None for no index.  Ignored
+            without NumPy.
     Output:
-        classes:  A dictionary mapping ????
+        classes:  rcclasses.ClassTotals, read as a mapping
+            {TEClass}>{Subclass}>[Frequency, OverlapLength]
+
+    Uses the NumPy columnar loader in rccolumns.py when NumPy is available.
+    With jobs > 1, overlaps are then totalled in a process pool by
+    rcparallel.densitylengths().
+
+    With coverage, lengths are union coverage of TEs within the union of
+    RoIs instead of summed overlaps, and an rccoverage.CoverageTotals is
+    returned.  Frequencies are unchanged.
     """
 
     id_index = columns[0]
@@ -737,24 +1487,36 @@ def fasdensity(fas_filename, chromosomes, replace_dict, columns):
     start_index = columns[2]
     end_index = columns[3]
 
-    classes = {}
+    if rcc.HAVE_NUMPY:
+        with rcs.stage('te parse'):
+            te = rck.loadcolumns(fas_filename, columns,
+                classregistry(replace_dict), cache_dir)
+        with rcs.stage('overlap'):
+            lengths = rcp.densitylengths(te, chromosomes, jobs)
+        with rcs.stage('aggregation'):
+            classes = rcc.densityclasses(te, chromosomes, lengths)
+            if coverage:
+                return(rcu.CoverageTotals(classes, rcc.matrixranges(te), \
+                    rcu.regionranges(chromosomes)))
+            return(classes)
+
+    registry = classregistry(replace_dict)
+    classes = rcl.ClassTotals(registry)
+    # Map chromosome to (starts, ends, categories), for coverage
+    te_dict = {}
+    lines = 0
+    skipped = 0
+    compared = 0
     
-    with open(fas_filename, "r") as f:
+    with rcs.stage('te parse'), rco.openinput(fas_filename) as f:
         # Skip header line
         f.readline()
     
-        #for count, line in enumerate(f,start=0):
         for line in f:
-            ## Remove newline, extraneous whitespace.
-            line = line.strip('\n').strip()
+            lines += 1
 
             # Split line on whitespace
-            line_list = re.split(r"\s*", line)
-
-            ## Handle special cases of classes.
-            full_class = re.split(r"\?", line_list[id_index])[0]
-
-            full_class = configreplace(full_class, replace_dict)
+            line_list = line.split()
 
             ## Determine whether or not this transposable element overlaps one or
             ## more RoIs, and determine the total length of overlap.
@@ -764,6 +1526,7 @@ def fasdensity(fas_filename, chromosomes, replace_dict, columns):
             # As before, can we legitimately hard code this?
             # If so, we better explain why!
             if "_random" in chromosome:
+                skipped += 1
                 continue
 
             try:
@@ -773,85 +1536,55 @@ def fasdensity(fas_filename, chromosomes, replace_dict, columns):
     
             this_start = int(line_list[start_index])
             this_end = int(line_list[end_index])
-            length = 0
-            overlap_count = 0
     
-            ## Look for overlaps and record length of overlap.
-            for each_range in ranges:
-                pi_start = each_range[0]
-                pi_end = each_range[1]
-    
-                # Is the start of the transposable element in range?
-                start_in_range = pi_start <= this_start <= pi_end
-                # Is the end of the transposable element in range?
-                end_in_range = pi_start <= this_end <= pi_end
-                # Does the transposable element contain the RoI?
-                te_contains_RoI = this_start <= pi_start <= \
-                    pi_end <= this_end
-                
-                if te_contains_RoI:
-                    # Find length of overlap:
-                    length += pi_end - pi_start
-                elif start_in_range and end_in_range:
-                    length += this_end - this_start
-                elif start_in_range and not end_in_range:
-                    length += pi_end - this_start
-                elif end_in_range and not start_in_range:
-                    length += this_end - pi_start
-
+            ## Record total length of overlap with all RoIs.
+            length = ranges.coverage(this_start, this_end)
+            compared += 1
 
             ## If an overlap exists, record class/subclass data.
             if length > 0:
-                if "/" in full_class:
-                    # Split on /
-                    superclass, subclass = re.split(r"/", full_class)
-
-                    if superclass in classes:
-                        # Found class.  Does it also have this subclass?
-                        this_class = classes[superclass]
-
-                        if subclass in classes[superclass]:
-                            # Yes, so add to the data
-                            this_class[subclass][0] += 1
-                            this_class[subclass][1] += length
-                        else:
-                            # No, so add the subclass
-                            this_class[subclass] = [1, length]
-
-                    else:
-                        # Missing superclass - add superclass and subclass 
-                        # to classes.  Initialize count and length of subclass.
-                        classes[superclass] = {subclass: [1, length]}
-                else:
-                    # No /, so route to subclass "No subclass".
-                    if full_class in classes:
-                        try:
-                            # Found class. Update data.
-                            classes[full_class]["No subclass"][0] += 1
-                            classes[full_class]["No subclass"][1] += length
-                        except KeyError:
-                            # Missing subclass.  Initialize.
-                            classes[full_class]["No subclass"] = [1, length]
-                    else:
-                        # full_class is missing altogether.
-                        # Initialize full_class and OTHER.
-                        classes[full_class] = {"No subclass": [1, length]}
-
+                category = registry.code(line_list[id_index])
+                classes.add(category, length)
+
+                if coverage:
+                    if chromosome not in te_dict:
+                        te_dict[chromosome] = ([], [], [])
+                    te_dict[chromosome][0].append(this_start)
+                    te_dict[chromosome][1].append(this_end)
+                    te_dict[chromosome][2].append(category)
+
+    rcs.count('te lines', lines)
+    rcs.count('random rows skipped', skipped)
+    rcs.count('overlap comparisons', compared)
+    if coverage:
+        with rcs.stage('aggregation'):
+            return(rcu.CoverageTotals(classes, te_dict, \
+                rcu.regionranges(chromosomes)))
     return(classes)
 
 ###############################################################################
 # Matrix function chain
 
-def fasmatrix(fas_filename, replace_dict, columns):
+@rcs.staged('te parse')
+def fasmatrix(fas_filename, registry, columns, cache_dir=None):
     """
-    Reads .fas file; returns {Chromosome}>{TEClass}>{Sub}>[Pairs]>(Start,End).
+    Reads .fas file; returns {Chromosome}>(Starts, Ends, Categories).
 
     Input:
         fas_filename:  File path to multiclass data
-        replace_dict: A dictionary mapping search terms to replacement terms
+        registry:  CategoryRegistry interning TE labels, from classregistry()
+        cache_dir:  Index file directory, as for fasdensity()
     Output:
-        te_dict:  Maps chromosomes to classes to subclasses to lists of range pairs
+        te_dict:  Maps chromosomes to three equal-length integer arrays:
+            TE starts, TE ends and TE category codes in registry.
     Side effects:
+        Adds classes found in fas_filename to registry.
+
+    On each chromosome, TEs are grouped by class, then by subclass, in order
+    of first appearance, and are otherwise in file order.  This is the order
+    pimatrix() accumulates overlaps in.
+
+    Uses the NumPy columnar loader in rccolumns.py when NumPy is available.
     """
 
     id_index = columns[0]
@@ -859,56 +1592,77 @@ def fasmatrix(fas_filename, replace_dict, columns):
     start_index = columns[2]
     end_index = columns[3]
 
-    te_dict = {}
+    if rcc.HAVE_NUMPY:
+        te = rck.loadcolumns(fas_filename, columns, registry, cache_dir)
+        return(rcc.matrixranges(te))
+
+    # Map chromosome to {category: [[starts], [ends]]}
+    chromosome_ranges = {}
+    lines = 0
+    skipped = 0
     
-    with open(fas_filename, "r") as f:
+    with rco.openinput(fas_filename) as f:
         # Skip header line
         f.readline()
     
         for line in f:
+            lines += 1
+
             ## Remove newline, extraneous whitespace.
             line = line.strip('\n').strip()
             
-            line_list = re.split(r"\s*",line)
+            line_list = line.split()
     
             chromosome = line_list[chr_index].strip('chr')
 
             #TODO:  HARDCODING ISSUE
             if "_random" in chromosome:
+                skipped += 1
                 continue
 
             this_start = int(line_list[start_index])
             this_end = int(line_list[end_index])
             
-            ## Handle special cases of classes.
-            #TODO:  HARDCODING ISSUE - question mark.
-            full_class = re.split(r"\?", line_list[id_index])[0]
+            ## Look up class and subclass code.
+            category = registry.code(line_list[id_index])
 
-            full_class = configreplace(full_class, replace_dict)
+            if chromosome not in chromosome_ranges:
+                chromosome_ranges[chromosome] = {}
+            these_ranges = chromosome_ranges[chromosome]
+            if category not in these_ranges:
+                these_ranges[category] = [[], []]
 
-            ## Look for subclass
-            if "/" in full_class:
-                class_items = re.split(r"/", full_class)
-                this_class = class_items[0]
-                this_subclass = class_items[1]
-            else:
-                this_class = full_class
-                this_subclass = "No subclass"
-    
-                    
-            if chromosome not in te_dict.keys():
-                te_dict[chromosome] = {}
-            if this_class not in te_dict[chromosome].keys():
-                te_dict[chromosome][this_class] = {}
-            if this_subclass not in te_dict[chromosome][this_class].keys():
-                te_dict[chromosome][this_class][this_subclass] = []
+            these_ranges[category][0].append(this_start)
+            these_ranges[category][1].append(this_end)
 
-            te_dict[chromosome][this_class][this_subclass].append((this_start, \
-                this_end))
+    rcs.count('te lines', lines)
+    rcs.count('random rows skipped', skipped)
+    return(_matrixranges(chromosome_ranges, registry))
+
+def _matrixranges(chromosome_ranges, registry):
+    """
+    Take {Chromosome}>{Category}>[[Starts], [Ends]] and CategoryRegistry.
+    Return fasmatrix() mapping {Chromosome}>(Starts, Ends, Categories).
+    """
+
+    te_dict = {}
+
+    for chromosome, these_ranges in chromosome_ranges.items():
+        starts = array('q')
+        ends = array('q')
+        categories = array('q')
+
+        for this_class, codes in registry.byclass(list(these_ranges)):
+            for category in codes:
+                starts.extend(these_ranges[category][0])
+                ends.extend(these_ranges[category][1])
+                categories.extend([category] * len(these_ranges[category][0]))
+
+        te_dict[chromosome] = (starts, ends, categories)
 
     return(te_dict)
 
-def pimatrix(pi_filename, te_dict, columns):
+def pimatrix(pi_filename, te_dict, columns, jobs=1, roi_cache=None):
     """
     Reads .gff file. Returns: dict of TE x RoI %-overlaps, list of keys.
 
@@ -917,6 +1671,16 @@ def pimatrix(pi_filename, te_dict, columns):
     Compares ranges, records percent overlap of each TE against each RoI
         on the same chromosome.
 
+    Overlapping TE/RoI pairs are found per chromosome with
+    rcindex.sweepjoin(), so only pairs whose ranges intersect are compared.
+    With jobs > 1, chromosomes are joined in a process pool by
+    rcparallel.matrixhits().
+    Hits are then recorded RoI by RoI in file order, and within a RoI in
+    te_dict order, so that sums and output ordering match a full
+    RoI x TE scan exactly.
+    With roi_cache, an rcroicache.RegionCache, RoIs whose hits are cached
+    are not overlapped again.
+
     NB:
     region_keys is used instead of region_dict.keys() to enforce a consistent
         ordering across columns in output and across outputs when the tool
@@ -925,83 +1689,123 @@ def pimatrix(pi_filename, te_dict, columns):
 
     Input:
         pi_filename:  File path to RoI range data
+        te_dict:  Output of fasmatrix()
+        jobs:  Number of worker processes
+        roi_cache:  rcroicache.RegionCache, or None
     Output:
-        region_dict #TODO
-        region_keys #TODO
+        region_dict:  Maps category code to {column: %-overlap}, where
+            column indexes region_keys.  Categories are in order of first
+            overlap.
+        region_keys:  List of RoI labels, in order of first overlap
     Side effects:
     """
 
+    regions, chr_regions = piregions(pi_filename, columns)
+    return(regionmatrix(regions, chr_regions, te_dict, jobs, roi_cache))
+
+@rcs.staged('roi parse')
+def piregions(pi_filename, columns):
+    """
+    Reads .gff file.  Returns RoIs in file order, and RoIs by chromosome.
+
+    Input:
+        pi_filename:  File path to RoI range data.  One header line.
+        columns:  Column indices of [id, chromosome, start, end]
+    Output:
+        regions:  List of [RoI label, start, end], in file order
+        chr_regions:  Maps chromosome label to list of
+            (start, end, index into regions).  RoIs with start > end never
+            overlap anything, and are left out.
+    """
+
     id_index = columns[0]
     chr_index = columns[1]
     start_index = columns[2]
     end_index = columns[3]
 
-    region_dict = {}
-    region_keys = []
+    # RoI data by file order:  [region_key, pi_start, pi_end]
+    regions = []
+    # Map chromosome to list of (pi_start, pi_end, index into regions)
+    chr_regions = {}
 
-    with open(pi_filename, "r") as pi:
+    with rco.openinput(pi_filename) as pi:
         # Skip first line.
         pi.readline()
 
         for line in pi:
             line = line.strip()
-            line_list = re.split(r"\s*", line)
+            line_list = line.split()
 
             this_chr = line_list[chr_index].strip('chr')
             pi_start = int(line_list[start_index])
             pi_end = int(line_list[end_index])
-            pi_length = pi_end - pi_start
 
-            these_te_ranges = te_dict[this_chr]
-    
-            for this_class in these_te_ranges:
-                # Find matches
-                for this_subclass in these_te_ranges[this_class]:
-                    # Iterate over ranges for this_chr
-
-                    for this_range in these_te_ranges[this_class][this_subclass]:
-                        # Check overlaps
-                        overlap_length = 0
-                        this_start = this_range[0]
-                        this_end = this_range[1]
-    
-                        # Is the start of the transposable element in range?
-                        start_in_range = pi_start <= this_start <= pi_end
-                        # Is the end of the transposable element in range?
-                        end_in_range = pi_start <= this_end <= pi_end
-                        # Does the transposable element contain the RoI?
-                        te_contains_RoI = this_start <= pi_start \
-                            <= pi_end <= this_end
-                        
-                        if te_contains_RoI:
-                            overlap_length = pi_end - pi_start
-                        elif start_in_range and end_in_range:
-                            overlap_length = this_end - this_start
-                        elif start_in_range and not end_in_range:
-                            overlap_length = pi_end - this_start
-                        elif end_in_range and not start_in_range:
-                            overlap_length = this_end - pi_start
-    
-                        # Record overlaps
-                        if overlap_length > 0:
-                            region_key = line_list[id_index]
-                            if region_key not in region_keys:
-                                region_keys.append(region_key)
-                            if this_class not in region_dict:
-                                region_dict[this_class] = { \
-                                this_subclass: {region_key: 0}}
-                            elif this_subclass not in region_dict[this_class]:
-                                region_dict[this_class][this_subclass] = { \
-                                    region_key: 0}
-                            elif region_key not in region_dict[this_class][this_subclass]:
-                                region_dict[this_class][this_subclass][region_key] = 0
-                            percent_overlap = \
-                                100 * overlap_length / float(pi_length)
-                            region_dict[this_class][this_subclass][region_key] += percent_overlap
+            regions.append([line_list[id_index], pi_start, pi_end])
+
+            # A RoI with start > end never overlaps anything.
+            if pi_start <= pi_end:
+                if this_chr not in chr_regions:
+                    chr_regions[this_chr] = []
+                chr_regions[this_chr].append((pi_start, pi_end, \
+                    len(regions) - 1))
+
+    rcs.count('roi lines', len(regions))
+    return(regions, chr_regions)
 
+def regionmatrix(regions, chr_regions, te_dict, jobs=1, roi_cache=None):
+    """
+    Take piregions() output, fasmatrix() output, job count and
+    rcroicache.RegionCache or None.
+    Return pimatrix() output:  dict of TE x RoI %-overlaps, list of keys.
+    """
+
+    # Map index into regions to list of (TE order, category, overlap)
+    with rcs.stage('overlap'):
+        if roi_cache is not None:
+            hits = roi_cache.hits(regions, chr_regions, te_dict, jobs)
+        else:
+            hits = rcp.matrixhits(chr_regions, te_dict, jobs)
+
+    return(assemblematrix(regions, hits))
+
+def assemblematrix(regions, hits):
+    """
+    Take piregions() regions and rcparallel.matrixhits() output.
+    Return pimatrix() output:  dict of TE x RoI %-overlaps, list of keys.
+    """
+
+    region_dict = {}
+    region_keys = []
+    # Map region key to its index in region_keys, for O(1) registration.
+    region_columns = {}
+
+    # Record overlaps
+    with rcs.stage('aggregation'):
+        for region_index in sorted(hits):
+            region_key, pi_start, pi_end = regions[region_index]
+            pi_length = pi_end - pi_start
+
+            try:
+                column = region_columns[region_key]
+            except KeyError:
+                column = len(region_keys)
+                region_columns[region_key] = column
+                region_keys.append(region_key)
+
+            for te_order, category, overlap_length in \
+                sorted(hits[region_index]):
+                if category not in region_dict:
+                    region_dict[category] = {}
+                cells = region_dict[category]
+                percent_overlap = \
+                    100 * overlap_length / float(pi_length)
+                cells[column] = cells.get(column, 0) + percent_overlap
+
+    rcs.count('nonzero cells', sum(len(x) for x in region_dict.values()))
     return(region_dict, region_keys)
 
-def outmatrix(out_filename, region_dict, region_keys):
+def outmatrix(out_filename, region_dict, region_keys, registry, \
+    transposed=False):
     """                                                                         
     Takes output from pimatrix() to write TE x RoI %-overlaps to file.
 
@@ -1017,67 +1821,448 @@ def outmatrix(out_filename, region_dict, region_keys):
     Notes:
     For convenience, classes are written in square brackets, e.g. "[CLASS]".
     This format can be transposed using transpose().
+    Category codes in region_dict are mapped back to class and subclass
+    names through registry only here.
+
+    With transposed, RoIs are written down the left and classes across the
+    top, as transpose() would leave the file, but without writing and
+    reading the file twice.
+
+    Only nonzero cells are formatted.  A row starts as a list of "0.0"
+    fields, nonzero cells are put in place, and the row is joined once.
+    out_filename ending in '.gz' is gzipped.
     """
 
-    with open(out_filename,"w") as out:
+    columns = len(region_keys)
+    rows = _matrixrows(region_dict, registry)
+
+    with rco.openoutput(out_filename) as out:
+
+        if transposed:
+            rows = list(rows)
+            out.write("Class" + '\t' + '\t'.join(x[0] for x in rows) + '\n')
+            rco.writelines(out, _matrixcolumns(rows, region_keys))
+            return(0)
     
         # Write header line
         out.write("Class" + '\t' + '\t'.join(region_keys) + '\n')
     
         # Write data lines
-        for this_class in region_dict:
-            class_dict = {}
-            
-            # Build class data
-            for this_subclass in region_dict[this_class]:
-                for this_key in region_dict[this_class][this_subclass]:
-                    if this_key not in class_dict:
-                        class_dict[this_key] = 0
-    
-                    class_dict[this_key] += region_dict[this_class][this_subclass][this_key]
-    
-            # Write class data
-            class_string = "[" + this_class + "]"
-            for this_key in region_keys:
-                try:
-                    class_string += '\t' + str(round(class_dict[this_key], 5))
-                except KeyError:
-                    class_string += '\t' + "0.0"
-    
-            out.write(class_string + '\n')
-            
-            # Write subclass data  
-            if len(region_dict[this_class]) == 1:
-                continue
-    
-            for this_subclass in region_dict[this_class]:
-                subclass_string = this_class + "/" + this_subclass
-                for this_key in region_keys:
-                    try:
-                        subclass_string += '\t' + str(round(region_dict[this_class][this_subclass][this_key], 5)) 
-                    except KeyError:
-                        subclass_string += '\t' + "0.0"
-    
-                out.write(subclass_string + '\n')
+        for label, cells in rows:
+            fields = ["0.0"] * columns
+            for column, value in _matrixcells(cells).items():
+                fields[column] = value
+            fields.insert(0, label)
+            out.write('\t'.join(fields) + '\n')
+
+    return(0)
+
+def _matrixcolumns(rows, region_keys):
+    """
+    Take _matrixrows() output as a list, and RoI labels.  Yield lines of
+    transposed outmatrix() output, one per RoI.
+
+    Columns are taken MATRIX_CHUNK at a time:  each row's fields for the
+    chunk are built as in outmatrix(), and zip() turns them into lines.
+    """
+
+    # Each row's nonzero fields, in column order
+    cells = [sorted(_matrixcells(x[1]).items()) for x in rows]
+    positions = [0] * len(rows)
+    for low in range(0, len(region_keys), MATRIX_CHUNK):
+        high = min(low + MATRIX_CHUNK, len(region_keys))
+        chunk = []
+        for i, row_cells in enumerate(cells):
+            fields = ["0.0"] * (high - low)
+            j = positions[i]
+            while j < len(row_cells) and row_cells[j][0] < high:
+                fields[row_cells[j][0] - low] = row_cells[j][1]
+                j += 1
+            positions[i] = j
+            chunk.append(fields)
+        for column, fields in zip(range(low, high), zip(*chunk)):
+            yield region_keys[column] + '\t' + '\t'.join(fields) + '\n'
+        if not chunk:
+            for column in range(low, high):
+                yield region_keys[column] + '\t\n'
+
+def _matrixcells(cells):
+    """
+    Take {Column}>%-overlap of one row.  Return {Column}>field as written.
+    """
+
+    return(dict((x, str(round(y, 5))) for x, y in cells.items()))
+
+def _matrixrows(region_dict, registry):
+    """
+    Take pimatrix() output and CategoryRegistry.  Yield (row label, cells)
+    for each row of outmatrix() output.
+
+    Each class yields a "[Class]" row summing its subclasses, followed by
+    a "Class/Subclass" row per subclass if it has more than one.
+    """
+
+    for this_class, codes in registry.byclass(region_dict):
+        class_dict = {}
+        
+        # Build class data
+        for category in codes:
+            for column, value in region_dict[category].items():
+                class_dict[column] = class_dict.get(column, 0) + value
+
+        yield ("[" + this_class + "]", class_dict)
+
+        # Subclass data
+        if len(codes) == 1:
+            continue
+
+        for category in codes:
+            yield (this_class + "/" + registry[category][1], \
+                region_dict[category])
+
+def outsparse(out_filename, region_dict, region_keys, registry, by_region=False):
+    """
+    Takes output from pimatrix() to write nonzero TE x RoI %-overlaps to
+    file, one per line.
+
+    Output details:
+    Delimiter:  tab (i.e. '\t')
+    Header:  Class, Subclass, Region, Overlap
+    Lines:  One per subclass and RoI with a nonzero %-overlap.  Values are
+        written as in outmatrix().  Class totals are not written; they are
+        the sums of their subclasses.
+
+    Lines are ordered as outmatrix() orders rows, then by RoI in the order
+    of region_keys.  With by_region, they are ordered by RoI first, as a
+    transposed matrix would be.  Work and file size are proportional to the
+    number of nonzero cells, not to classes x RoIs.  out_filename ending in
+    '.gz' is gzipped.
+    """
+
+    # (column, row, subclass line), or (row, column, ...) without by_region
+    lines = []
+    row = 0
+    for this_class, codes in registry.byclass(region_dict):
+        for category in codes:
+            prefix = this_class + '\t' + registry[category][1] + '\t'
+            cells = region_dict[category]
+            for column in sorted(cells):
+                line = prefix + region_keys[column] + '\t' + \
+                    str(round(cells[column], 5)) + '\n'
+                if by_region:
+                    lines.append((column, row, line))
+                else:
+                    lines.append((row, column, line))
+            row += 1
+
+    if by_region:
+        lines.sort()
+
+    with rco.openoutput(out_filename) as out:
+        out.write("Class\tSubclass\tRegion\tOverlap\n")
+        rco.writelines(out, (x[2] for x in lines))
+
+    return(0)
+
+@rcs.staged('write')
+def writematrix(out_filename, region_dict, region_keys, registry, opt_dict):
+    """
+    Writes pimatrix() output with outsparse() if opt_dict['s'] is set,
+    otherwise with outmatrix(), transposed if opt_dict['t'] is set.
+    """
+
+    if opt_dict.get('s'):
+        return(outsparse(out_filename, region_dict, region_keys, registry,
+            opt_dict['t']))
+
+    return(outmatrix(out_filename, region_dict, region_keys, registry,
+        opt_dict['t']))
 
 def transpose(filename):
     """
     Rewrites filename using the transpose of tab-delimited data in filename.
+
+    Memory is bounded by TRANSPOSE_BLOCK bytes of input, however large the
+    file.  Lines are read in blocks of about that size.  Each block is
+    transposed into a temporary file beside filename, so that line i of the
+    temporary file holds column i of the block.  Line i of the output is
+    then line i of every temporary file, joined in order.
+
+    Fields are split on tabs, so labels such as "DNA/No subclass" stay
+    whole.  Every line must have at least as many fields as the first;
+    further fields are dropped.  A gzipped file is read as such, and is
+    gzipped again if its name ends in '.gz'.
     """
 
-    with open(filename, "r") as fin:
-        lines = []
-        for line in fin:
-            lines.append(re.split(r'\s*', line.strip('\n')))
-    
-    with open(filename, "w") as fout:
-        length = len(lines[0])
-        width = len(lines)
-        for i in range(length):
-            line_list = []
-            for j in range(width):
-                line_list.append(lines[j][i])
-            fout.write('\t'.join(line_list) + '\n')
+    directory = os.path.dirname(os.path.abspath(filename))
+    parts = []
+
+    try:
+        with rco.openinput(filename) as fin:
+            length = None
+            block = []
+            block_size = 0
+            for line in fin:
+                line_list = line.rstrip('\r\n').split('\t')
+                if length is None:
+                    length = len(line_list)
+                elif len(line_list) < length:
+                    raise IndexError("list index out of range")
+                block.append(line_list[:length])
+                block_size += len(line)
+                if block_size >= TRANSPOSE_BLOCK:
+                    parts.append(_transposeblock(block, directory))
+                    block = []
+                    block_size = 0
+            if block:
+                parts.append(_transposeblock(block, directory))
+
+        with rco.openoutput(filename) as fout:
+            rco.writelines(fout, ('\t'.join(x.rstrip('\n') for x in fields) + \
+                '\n' for fields in zip(*parts)))
+    finally:
+        for part in parts:
+            part.close()
 
     return(0)
 
+def _transposeblock(block, directory):
+    """
+    Take list of split lines.  Return temporary file holding its transpose,
+    one line per column, positioned at its start.
+    """
+
+    part = tempfile.TemporaryFile("w+", dir=directory)
+    rco.writelines(part, ('\t'.join(x) + '\n' for x in zip(*block)))
+    part.seek(0)
+    return(part)
+
+###############################################################################
+# Region query function chain
+
+def fasregions(fas_filename, registry, columns, cache_dir=None):
+    """
+    Reads .fas file; returns rcquery.RegionIndex for region queries.
+
+    Input:
+        fas_filename:  File path to multiclass data
+        registry:  CategoryRegistry interning TE labels, from classregistry()
+        columns:  Column indices of [class, chromosome, start, end]
+        cache_dir:  Index file directory, as for fasdensity()
+    Output:
+        index:  RegionIndex.  index.query(chromosome, start, end) returns
+            the mapping fasdensity() would return for that one RoI.
+    """
+
+    te_dict = fasmatrix(fas_filename, registry, columns, cache_dir)
+    with rcs.stage('overlap'):
+        return(rcq.RegionIndex(te_dict, registry))
+
+###############################################################################
+# Combined function chain
+
+def fascombined(fas_filename, chromosomes, registry, columns, jobs=1,
+    cache_dir=None):
+    """
+    Reads .fas file once; returns fasgenome(), fasdensity() and fasmatrix()
+    results together.
+
+    Input:
+        fas_filename:  File path to multiclass data
+        chromosomes:  A dict mapping chromosome labels to an
+            IntervalIndex of RoI ranges, as returned by pidensity()
+        registry:  CategoryRegistry interning TE labels, from classregistry()
+        columns:  Column indices of [class, chromosome, start, end]
+        jobs:  Number of worker processes for overlap density
+        cache_dir:  Index file directory, as for fasdensity()
+    Output:
+        genome_classes:  {TEClass}>{Subclass}>[Frequency, Length]
+        density_classes:  {TEClass}>{Subclass}>[Frequency, OverlapLength]
+        te_dict:  {Chromosome}>(Starts, Ends, Categories)
+
+    Each TE line is fed to all three accumulators as it is read.  The
+    whole-genome totals skip '_random' chromosomes by the chromosome column,
+    as the other two analyses do.
+    """
+
+    if rcc.HAVE_NUMPY:
+        with rcs.stage('te parse'):
+            te = rck.loadcolumns(fas_filename, columns, registry, cache_dir)
+        with rcs.stage('overlap'):
+            lengths = rcp.densitylengths(te, chromosomes, jobs)
+        with rcs.stage('aggregation'):
+            return(rcc.genomeclasses(te),
+                rcc.densityclasses(te, chromosomes, lengths),
+                rcc.matrixranges(te))
+
+    id_index = columns[0]
+    chr_index = columns[1]
+    start_index = columns[2]
+    end_index = columns[3]
+
+    genome_totals = rcl.ClassTotals(registry)
+    density_totals = rcl.ClassTotals(registry)
+    # Map chromosome to {category: [[starts], [ends]]}
+    chromosome_ranges = {}
+    lines = 0
+    skipped = 0
+    compared = 0
+
+    with rcs.stage('te parse'), rco.openinput(fas_filename) as f:
+        # Skip header line
+        f.readline()
+
+        for line in f:
+            lines += 1
+            line_list = line.split()
+
+            chromosome = line_list[chr_index].strip('chr')
+            #TODO:  HARDCODING ISSUE
+            if "_random" in chromosome:
+                skipped += 1
+                continue
+
+            this_start = int(line_list[start_index])
+            this_end = int(line_list[end_index])
+            category = registry.code(line_list[id_index])
+
+            # Whole genome
+            genome_totals.add(category, this_end - this_start)
+
+            # Overlap density
+            if chromosome in chromosomes:
+                length = chromosomes[chromosome].coverage(this_start, this_end)
+                compared += 1
+                if length > 0:
+                    density_totals.add(category, length)
+
+            # Matrix
+            if chromosome not in chromosome_ranges:
+                chromosome_ranges[chromosome] = {}
+            these_ranges = chromosome_ranges[chromosome]
+            if category not in these_ranges:
+                these_ranges[category] = [[], []]
+            these_ranges[category][0].append(this_start)
+            these_ranges[category][1].append(this_end)
+
+    rcs.count('te lines', lines)
+    rcs.count('random rows skipped', skipped)
+    rcs.count('overlap comparisons', compared)
+    return(genome_totals,
+        density_totals,
+        _matrixranges(chromosome_ranges, registry))
+
+###############################################################################
+# Batch function chain
+
+def batchfiles(pattern):
+    """
+    Take RoI file pattern.  Return sorted list of RoI file paths.
+
+    pattern is either a glob, e.g. 'peaks/*.gff', or '@' followed by the
+    path of a file listing one RoI file per line.  Blank lines and lines
+    starting with '#' in a list file are skipped.  Relative paths in a list
+    file are relative to the list file.
+    """
+
+    if pattern.startswith('@'):
+        list_dir = os.path.dirname(pattern[1:])
+        with open(pattern[1:], "r") as f:
+            filenames = [x.strip() for x in f]
+        return([os.path.join(list_dir, x) for x in filenames \
+            if x and not x.startswith('#')])
+
+    return(sorted(glob.glob(pattern)))
+
+def batchoutput(out_dir, pi_filename, extension):
+    """
+    Take output directory, RoI file path and extension.  Return output path.
+
+    Output is named after the RoI file, e.g. peaks/a.gff > out_dir/a.tbl
+    """
+
+    name = os.path.splitext(os.path.basename(pi_filename))[0]
+    return(os.path.join(out_dir, name + extension))
+
+@rcs.staged('te parse')
+def fasbatch(fas_filename, registry, columns, cache_dir=None):
+    """
+    Reads .fas file once for batch ROI analysis.  Returns TE data for
+    densitybatch().
+
+    Input:
+        fas_filename:  File path to multiclass data
+        registry:  CategoryRegistry interning TE labels, from classregistry()
+        columns:  Column indices of [class, chromosome, start, end]
+        cache_dir:  Index file directory, as for fasdensity()
+    Output:
+        te:  rccolumns.TEColumns when NumPy is available.  Otherwise a list
+            of (Chromosome, Start, End, Category) in file order, skipping
+            '_random' chromosomes.
+    """
+
+    if rcc.HAVE_NUMPY:
+        return(rck.loadcolumns(fas_filename, columns, registry, cache_dir))
+
+    id_index = columns[0]
+    chr_index = columns[1]
+    start_index = columns[2]
+    end_index = columns[3]
+
+    te = []
+    lines = 0
+
+    with rco.openinput(fas_filename) as f:
+        # Skip header line
+        f.readline()
+
+        for line in f:
+            lines += 1
+            line_list = line.split()
+
+            chromosome = line_list[chr_index].strip('chr')
+            #TODO:  HARDCODING ISSUE
+            if "_random" in chromosome:
+                continue
+
+            te.append((chromosome,
+                int(line_list[start_index]),
+                int(line_list[end_index]),
+                registry.code(line_list[id_index])))
+
+    rcs.count('te lines', lines)
+    rcs.count('random rows skipped', lines - len(te))
+    return(te)
+
+def densitybatch(te, chromosomes, registry, jobs=1):
+    """
+    Take fasbatch() output and pidensity() output.  Return fasdensity()
+    mapping {TEClass}>{Subclass}>[Frequency, OverlapLength].
+
+    Same result as fasdensity() on the same files, without reading the
+    .fas file again.
+    """
+
+    if rcc.HAVE_NUMPY:
+        with rcs.stage('overlap'):
+            lengths = rcp.densitylengths(te, chromosomes, jobs)
+        with rcs.stage('aggregation'):
+            return(rcc.densityclasses(te, chromosomes, lengths))
+
+    totals = rcl.ClassTotals(registry)
+    compared = 0
+
+    with rcs.stage('overlap'):
+        for chromosome, this_start, this_end, category in te:
+            try:
+                ranges = chromosomes[chromosome]
+            except KeyError:
+                continue
+
+            length = ranges.coverage(this_start, this_end)
+            compared += 1
+            if length > 0:
+                totals.add(category, length)
+
+    rcs.count('overlap comparisons', compared)
+    return(totals)
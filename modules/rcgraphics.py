@@ -2,13 +2,36 @@
 rcgraphics.py
 -------------
 Graphical component of RepCalc.
+
+Analyses run in a worker thread, so the window stays responsive.  The
+worker reports back through a queue, which the Tk event loop polls; Tk is
+only ever touched from the event loop's thread.  Progress is the share of
+input bytes read, from rcprogress.py, and Cancel stops the run at its next
+read or stage boundary.
 """
 import sys
 import os
+import time
+import queue
+import threading
 import tkinter as tk
+import tkinter.ttk as ttk
 import tkinter.messagebox as mb
 import tkinter.filedialog as fd
 import modules.rcfuncs as rcf
+import modules.rcprogress as rcr
+import modules.rcstats as rcs
+
+# Milliseconds between checks on a running analysis.
+POLL_INTERVAL = 100
+
+# Status shown as each stage of a run ends.
+STAGE_STATUS = {'config': 'Config read.',
+    'te parse': 'TE data read.',
+    'roi parse': 'Regions of interest read.',
+    'overlap': 'Overlaps found.',
+    'aggregation': 'Totals computed.',
+    'write': 'Output written.'}
 
 # Application inherits from tk.Frame
 class Application(tk.Frame):
@@ -212,6 +235,7 @@ class Application(tk.Frame):
         def ahandler(self=self):
             self.lengthEntry.configure(state=tk.NORMAL)
             self.transposeCB.configure(state=tk.DISABLED)
+            self.sparseCB.configure(state=tk.DISABLED)
 
             self.fasColEntry2.configure(state=tk.DISABLED)
             self.piColEntry1.configure(state=tk.DISABLED)
@@ -222,6 +246,7 @@ class Application(tk.Frame):
         def bhandler(self=self):
             self.lengthEntry.configure(state=tk.NORMAL)
             self.transposeCB.configure(state=tk.DISABLED)
+            self.sparseCB.configure(state=tk.DISABLED)
 
             self.fasColEntry2.configure(state=tk.NORMAL)
             self.piColEntry1.configure(state=tk.DISABLED)
@@ -232,6 +257,7 @@ class Application(tk.Frame):
         def chandler(self=self):
             self.lengthEntry.configure(state=tk.DISABLED)
             self.transposeCB.configure(state=tk.NORMAL)
+            self.sparseCB.configure(state=tk.NORMAL)
 
             self.fasColEntry2.configure(state=tk.NORMAL)
             self.piColEntry1.configure(state=tk.NORMAL)
@@ -297,6 +323,27 @@ class Application(tk.Frame):
             state=tk.DISABLED)
         self.transposeCB.grid(row=13, column=1)
 
+        # Sparse CB
+        self.sparseVar = tk.IntVar()
+        self.sparseVar.set(0)
+        self.sparseCB = tk.Checkbutton(self,
+            text='Sparse matrix output?',
+            variable=self.sparseVar,
+            state=tk.DISABLED)
+        self.sparseCB.grid(row=13, column=0)
+
+        # Number of worker processes
+        self.jobsLabel = tk.Label(self,
+            text='Jobs:')
+        self.jobsLabel.grid(row=13, column=2, sticky=tk.E)
+
+        self.jobsVar = tk.StringVar()
+        self.jobsVar.set('1')
+        self.jobsEntry = tk.Entry(self,
+            textvariable=self.jobsVar,
+            width=4)
+        self.jobsEntry.grid(row=13, column=3, sticky=tk.W)
+
         # Run Button
         def runhandler(event, self=self):
             return self.__runHandler(event)
@@ -312,6 +359,34 @@ class Application(tk.Frame):
             command=self.quit)
         self.quitButton.grid(row=14, column=3, sticky=tk.E+tk.W)
 
+        # Progress of a running analysis
+        self.progressBar = ttk.Progressbar(self,
+            orient=tk.HORIZONTAL,
+            mode='determinate',
+            maximum=1000)
+        self.progressBar.grid(row=15, columnspan=3, sticky=tk.E+tk.W)
+
+        # Cancel Button
+        self.cancelButton = tk.Button(self,
+            text='Cancel',
+            command=self.__cancelHandler,
+            state=tk.DISABLED)
+        self.cancelButton.grid(row=15, column=3, sticky=tk.E+tk.W)
+
+        self.statusVar = tk.StringVar()
+        self.statusVar.set('Ready.')
+        self.statusLabel = tk.Label(self,
+            textvariable=self.statusVar,
+            anchor=tk.W)
+        self.statusLabel.grid(row=16, columnspan=4, sticky=tk.E+tk.W)
+
+        # Running analysis:  worker thread, its Progress, its result queue
+        self.worker = None
+        self.progress = None
+        self.results = None
+        # Status text set by the worker thread, shown by __pollHandler
+        self.stageStatus = None
+
     def __fasHandler(self, event):
         self.fasName.set(fd.askopenfilename( defaultextension='.fas'))
 
@@ -350,10 +425,17 @@ class Application(tk.Frame):
 
     def __runHandler(self, event):
 
+        # The Run button is bound to clicks, which arrive even while it is
+        # disabled.  One analysis runs at a time.
+        if self.worker is not None:
+            return
+
         # Load control variables into locals, for future conciseness.
         anal_type = self.analType.get()
         transpose = bool(self.transposeVar.get())
-        region_length = int(self.regionLength.get())
+        sparse = bool(self.sparseVar.get())
+        # MXROI takes no length; analysisA and analysisB check it.
+        region_length = self.regionLength.get().strip()
 
         fcl1 = self.fasColLength1.get()
         fcl2 = self.fasColLength2.get()
@@ -373,16 +455,27 @@ class Application(tk.Frame):
 
         out_filename = self.outName.get()
         conf_filename = self.confName.get()
-        config_dict = rcf.getconfig(conf_filename)
-
-        a = anal_type is 'a'
-        b = anal_type is 'b'
-        c = anal_type is 'c'
 
-        opt_dict = {'a': a, 'b': b, 'c': c, 't': transpose, 'A': True, 'B': True}
+        try:
+            jobs = int(self.jobsVar.get())
+        except ValueError:
+            jobs = 0
+        if jobs < 1:
+            mb.showinfo("Run",
+                'Jobs error.  Please provide a positive integer number of jobs.')
+            return
+
+        a = anal_type == 'a'
+        b = anal_type == 'b'
+        c = anal_type == 'c'
+
+        opt_dict = {'a': a, 'b': b, 'c': c, 't': transpose, 's': sparse,
+            'A': True, 'B': True,
+            'jobs': jobs, 'cache': ''}
 
         if a:
-            # fcl2 not needed; pi_columns not needed
+            # fcl2 is disabled for WG; the 3-column form keeps WG's
+            # chromosome column 4.  pi_columns not needed
             fas_columns = [fcl1, fcl3, fcl4]
             args = [region_length, fas_filename] + fas_columns + [out_filename]
 
@@ -391,14 +484,14 @@ class Application(tk.Frame):
             fas_columns = [fcl1, fcl2, fcl3, fcl4]
             p_columns = [pcl2, pcl3, pcl4]
             args = [region_length, fas_filename] + fas_columns + \
-                [pi_filename] + pi_columns + [out_filename]
+                [pi_filename] + p_columns + [out_filename]
 
         if c:
             # All 8 columns elements must be specified.
             fas_columns = [fcl1, fcl2, fcl3, fcl4]
             p_columns = [pcl1, pcl2, pcl3, pcl4]
             args = [fas_filename] + fas_columns + \
-                [pi_filename] + pi_columns + [out_filename]
+                [pi_filename] + p_columns + [out_filename]
 
         if conf_filename:
             args.append(conf_filename)
@@ -407,15 +500,112 @@ class Application(tk.Frame):
             'b': rcf.analysisB,
             'c': rcf.analysisC,}
 
-        result = commands[anal_type](args)
+        # Progress counts bytes of the input files read.
+        total = 0
+        for filename in [fas_filename] + ([pi_filename] if not a else []):
+            try:
+                total += os.path.getsize(filename)
+            except OSError:
+                pass
+
+        self.progress = rcr.Progress(total)
+        self.results = queue.Queue()
+        self.stageStatus = 'Running...'
+        stats = rcs.RunStats(hooks=[self.__stageHook])
+
+        self.worker = threading.Thread(target=runworker,
+            args=(commands[anal_type], args, opt_dict, self.progress, stats,
+                self.results))
+        # A running analysis does not keep the program open after Quit.
+        self.worker.daemon = True
+        # Cancelling removes the output where the analysis writes it:  a name
+        # without a directory goes in the output folder.
+        if "/" not in out_filename:
+            out_filename = os.path.join(rcf.LOCAL_PATH, 'output', out_filename)
+        self.worker.out_filename = out_filename
+        self.worker.started = time.time()
+
+        self.runButton.configure(state=tk.DISABLED)
+        self.cancelButton.configure(state=tk.NORMAL)
+        self.progressBar['value'] = 0
+        self.statusVar.set(self.stageStatus)
+
+        self.worker.start()
+        self.after(POLL_INTERVAL, self.__pollHandler)
+
+    def __stageHook(self, event, data):
+        """
+        Take rcstats hook arguments.  Called in the worker thread.
+
+        Sets status text for __pollHandler, and stops a cancelled run as
+        soon as a stage ends.
+        """
+
+        if event == 'stage':
+            self.stageStatus = STAGE_STATUS.get(data['stage'], 'Running...')
+            rcr.check()
+
+    def __cancelHandler(self):
+        if self.progress is not None:
+            self.progress.cancel()
+            self.cancelButton.configure(state=tk.DISABLED)
+            self.statusVar.set('Cancelling...')
+
+    def __pollHandler(self):
+        """
+        Show progress of the running analysis, or its outcome once the
+        worker thread has posted it.
+        """
+
+        self.progressBar['value'] = int(1000 * self.progress.fraction())
+        if not self.progress.cancelled.is_set():
+            self.statusVar.set(self.stageStatus)
 
-        result_dict = {0: 'Program complete!',
-            1: 'Column indexing error.  No output written.',
-            2: 'Column value error.  Please provide positive integer values for column indices.  No output written.',
-            3: 'Length error.  No output written.  Please provide a valid length.',}
-
-        mb.showinfo("Run",
-            result_dict[result])
+        try:
+            outcome, value = self.results.get_nowait()
+        except queue.Empty:
+            self.after(POLL_INTERVAL, self.__pollHandler)
+            return
+
+        worker = self.worker
+        self.worker.join()
+        self.worker = None
+        self.progress = None
+        self.runButton.configure(state=tk.NORMAL)
+        self.cancelButton.configure(state=tk.DISABLED)
+
+        if outcome == 'result':
+            self.progressBar['value'] = 1000
+            result_dict = {0: 'Program complete!',
+                1: 'Column indexing error.  No output written.',
+                2: 'Column value error.  Please provide positive integer values for column indices.  No output written.',
+                3: 'Length error.  No output written.  Please provide a valid length.',
+                4: 'Batch error.  No region of interest files found.  No output written.',
+                5: 'Region error.  Please provide regions as Chromosome:Start-End.',
+                6: 'Bin size error.  Please provide bin widths such as 10000,100k,1M.  No output written.',
+                7: 'Sizes error.  --by-chromosome needs a chrom.sizes or .fai file in place of the length.  No output written.',}
+            # A code added to repcalc.py but not here still gets a message.
+            message = result_dict.get(value,
+                'Program ended with result %s.  See the console.' % value)
+            self.statusVar.set(message)
+            mb.showinfo("Run",
+                message)
+
+        elif outcome == 'cancelled':
+            # Remove output this run left half written.
+            try:
+                if os.path.getmtime(worker.out_filename) >= worker.started:
+                    os.remove(worker.out_filename)
+            except OSError:
+                pass
+            self.progressBar['value'] = 0
+            self.statusVar.set('Cancelled.  No output written.')
+
+        else:
+            self.progressBar['value'] = 0
+            self.statusVar.set('Error.')
+            mb.showerror("Run",
+                'Error.  No output written.\n\n' + value)
 
     def centerWindow(self):
         w = self.master.winfo_width()
@@ -428,6 +618,22 @@ class Application(tk.Frame):
         
         self.master.geometry('+%d+%d' % (x,y))
 
+def runworker(command, args, opt_dict, progress, stats, results):
+    """
+    Run command(args, opt_dict) with progress monitored and stats
+    collecting.  Put ('result', result code), ('cancelled', None) or
+    ('error', message) on results.  Runs in a worker thread.
+    """
+
+    try:
+        with rcr.monitoring(progress), rcs.collecting(stats):
+            result = command(args, opt_dict)
+        results.put(('result', result))
+    except rcr.Cancelled:
+        results.put(('cancelled', None))
+    except (Exception, SystemExit) as ex:
+        results.put(('error', str(ex) or ex.__class__.__name__))
+
 def maingui():
     """
     #TODO Document this function
@@ -0,0 +1,186 @@
+"""
+rcindex.py:  Interval indexing and overlap functions used by rcfuncs.py
+
+Manifest:
+    overlaplength(this_start, this_end, pi_start, pi_end)
+        Returns length by which a TE range overlaps a RoI range.
+    sweepjoin(left, right)
+        Yields pairs of items from two range lists whose ranges intersect.
+    mergeintervals(ranges)
+        Returns ranges sorted, with ranges sharing a position merged.
+    IntervalIndex(ranges)
+        Sorted, queryable index of the RoI ranges on one chromosome.
+"""
+
+from bisect import bisect_right
+from operator import itemgetter
+
+###############################################################################
+# Overlap functions
+
+def overlaplength(this_start, this_end, pi_start, pi_end):
+    """
+    Take TE range and RoI range.  Return length of overlap, or 0.
+
+    This is the overlap rule used throughout RepCalc.  Every other overlap
+    computation in this module must agree with it exactly.
+    """
+
+    # Is the start of the transposable element in range?
+    start_in_range = pi_start <= this_start <= pi_end
+    # Is the end of the transposable element in range?
+    end_in_range = pi_start <= this_end <= pi_end
+    # Does the transposable element contain the RoI?
+    te_contains_RoI = this_start <= pi_start <= pi_end <= this_end
+
+    if te_contains_RoI:
+        return(pi_end - pi_start)
+    elif start_in_range and end_in_range:
+        return(this_end - this_start)
+    elif start_in_range and not end_in_range:
+        return(pi_end - this_start)
+    elif end_in_range and not start_in_range:
+        return(this_end - pi_start)
+    return(0)
+
+def sweepjoin(left, right):
+    """
+    Take two lists of (low, high, item).  Yield (left item, right item) pairs.
+
+    A pair is yielded for every left and right range sharing at least one
+    position, treating both as closed ranges with low <= high.  Each side is
+    sorted by low, then merged in a single sweep.  Each side keeps a list of
+    active ranges, and a range leaves it once the sweep passes its high end.
+    Work is proportional to the sort plus the number of pairs yielded.
+
+    Pairs are yielded in sweep order.  Callers needing another order should
+    collect and sort them.
+    """
+
+    first = itemgetter(0)
+    left = sorted(left, key=first)
+    right = sorted(right, key=first)
+    left_count = len(left)
+    right_count = len(right)
+    active_left = []
+    active_right = []
+    i = 0
+    j = 0
+
+    while i < left_count or j < right_count:
+        if j == right_count or (i < left_count and left[i][0] <= right[j][0]):
+            low, high, item = left[i]
+            i += 1
+            if active_right:
+                active_right = [x for x in active_right if x[1] >= low]
+                for x in active_right:
+                    yield (item, x[2])
+            active_left.append((low, high, item))
+        else:
+            low, high, item = right[j]
+            j += 1
+            if active_left:
+                active_left = [x for x in active_left if x[1] >= low]
+                for x in active_left:
+                    yield (x[2], item)
+            active_right.append((low, high, item))
+
+def mergeintervals(ranges):
+    """
+    Take list of [start, end] ranges.  Return sorted list of (start, end),
+    with ranges sharing at least one position merged into one.
+
+    Ranges are closed, as under overlaplength(), so [0, 5] and [5, 8]
+    merge into [0, 8].  The summed overlaplength() of any TE against the
+    merged ranges is its overlap with their union, each bp counted once.
+    Ranges with start > end overlap nothing, and are dropped.
+    """
+
+    merged = []
+    for start, end in sorted((int(x[0]), int(x[1])) for x in ranges \
+        if x[0] <= x[1]):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return(merged)
+
+###############################################################################
+# Index classes
+
+class IntervalIndex(object):
+    """
+    Sorted, queryable index of [start, end] ranges on one chromosome.
+
+    Ranges with start > end can never overlap anything under overlaplength(),
+    so they are dropped on construction.
+
+    Two views of the ranges are kept:
+        1.  Ranges sorted by start, with a running maximum of their ends.
+            overlapping() uses these to visit only ranges that can overlap.
+        2.  Sorted starts and sorted ends with prefix sums.  coverage() uses
+            these to total the overlap of a well-formed query range in
+            O(log n) without visiting any ranges at all.
+    """
+
+    def __init__(self, ranges):
+        self.ranges = sorted((int(x[0]), int(x[1])) for x in ranges \
+            if x[0] <= x[1])
+        self.starts = [x[0] for x in self.ranges]
+        self.ends = sorted(x[1] for x in self.ranges)
+
+        self.max_ends = []
+        self.start_sums = [0]
+        self.end_sums = [0]
+        max_end = None
+        for (start, end), sorted_end in zip(self.ranges, self.ends):
+            if max_end is None or end > max_end:
+                max_end = end
+            self.max_ends.append(max_end)
+            self.start_sums.append(self.start_sums[-1] + start)
+            self.end_sums.append(self.end_sums[-1] + sorted_end)
+
+    def __len__(self):
+        return(len(self.ranges))
+
+    def __iter__(self):
+        return(iter(self.ranges))
+
+    def cumulative(self, position):
+        """
+        Take a position.  Return total length of all ranges left of position.
+
+        That is, the sum over all ranges of |[start, end] & (-inf, position]|.
+        """
+
+        started = bisect_right(self.starts, position)
+        ended = bisect_right(self.ends, position)
+        return((started * position - self.start_sums[started]) - \
+            (ended * position - self.end_sums[ended]))
+
+    def overlapping(self, low, high):
+        """
+        Take a range.  Yield each indexed range sharing a position with it.
+        """
+
+        i = bisect_right(self.starts, high) - 1
+        while i >= 0 and self.max_ends[i] >= low:
+            if self.ranges[i][1] >= low:
+                yield self.ranges[i]
+            i -= 1
+
+    def coverage(self, this_start, this_end):
+        """
+        Take a TE range.  Return summed overlaplength() against all ranges.
+        """
+
+        if this_start <= this_end:
+            return(self.cumulative(this_end) - self.cumulative(this_start))
+
+        # Reversed TE ranges fall outside the closed form.  Check only the
+        # ranges that contain one of its endpoints.
+        length = 0
+        for pi_start, pi_end in self.overlapping(this_end, this_start):
+            length += overlaplength(this_start, this_end, pi_start, pi_end)
+        return(length)
@@ -0,0 +1,328 @@
+"""
+rcio.py:  Opening TE and RoI input files, compressed or not, and output files
+
+Compression is recognised by the first bytes of a file, not by its name.
+gzip, bz2 and xz files are streamed through the standard library modules.
+bgzip (BGZF) files are gzip files made of independent blocks; their blocks
+are inflated in a pool of threads, as zlib releases the GIL while it works.
+
+While rcprogress is monitoring a run, bytes are counted as they are read
+from disk, before decompression.
+
+Output files are gzipped when their name ends in '.gz', and written
+through a large buffer.  Writers format whole lines with join and hand
+them to writelines(), which joins lines again into writes of about
+WRITE_CHUNK characters, so that a file of millions of short lines costs
+a few thousand writes.  The text written is the same either way; gzip
+output carries no name or time stamp, so it is the same for the same text.
+
+Manifest:
+    openinput(filename, mode)
+        Opens plain, .gz, .bgz, .bz2 or .xz file for reading.
+    compression(filename)
+        Returns 'bgzf', 'gzip', 'bz2', 'xz' or None.
+    openoutput(filename, compress)
+        Opens file for writing text, gzipped if filename ends in '.gz'.
+    writelines(out, lines)
+        Writes lines to an open file in chunks.
+    BGZFReader(raw, threads)
+        Raw binary stream of the inflated data in a BGZF file.
+    CountingReader(raw)
+        Raw binary stream passing bytes read to rcprogress.advance().
+"""
+
+import io
+import os
+import bz2
+import gzip
+import lzma
+import zlib
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import modules.rcprogress as rcr
+
+GZIP_MAGIC = b'\x1f\x8b\x08'
+BZ2_MAGIC = b'BZh'
+XZ_MAGIC = b'\xfd7zXZ\x00'
+
+# Threads inflating BGZF blocks.  None means one per CPU.
+THREADS = None
+# BGZF blocks read ahead of the reader, per thread.
+BLOCKS_AHEAD = 8
+
+# Bytes buffered by output files, and characters joined into one write by
+# writelines().
+WRITE_BUFFER = 1 << 20
+WRITE_CHUNK = 1 << 20
+# gzip level of compressed output.  6 is gzip's own default.
+GZIP_LEVEL = 6
+
+def compression(filename):
+    """
+    Take filename.  Return 'bgzf', 'gzip', 'bz2', 'xz' or None.
+    """
+
+    with open(filename, "rb") as f:
+        head = f.read(18)
+
+    if head.startswith(GZIP_MAGIC):
+        if _bgzfsize(head) is not None:
+            return('bgzf')
+        return('gzip')
+    if head.startswith(BZ2_MAGIC):
+        return('bz2')
+    if head.startswith(XZ_MAGIC):
+        return('xz')
+    return(None)
+
+def openinput(filename, mode="r"):
+    """
+    Take filename and mode, "r" or "rb".  Return open file object.
+
+    In text mode, lines are read as open(filename, "r") would read them
+    from the uncompressed file.
+    """
+
+    kind = compression(filename)
+
+    if rcr.active():
+        raw = CountingReader(open(filename, "rb", buffering=0))
+        if kind == 'bgzf':
+            binary = io.BufferedReader(BGZFReader(raw))
+        elif kind == 'gzip':
+            binary = gzip.GzipFile(fileobj=raw, mode="rb")
+        elif kind == 'bz2':
+            binary = bz2.BZ2File(raw, "rb")
+        elif kind == 'xz':
+            binary = lzma.LZMAFile(raw, "rb")
+        else:
+            binary = io.BufferedReader(raw)
+        if kind in ('gzip', 'bz2', 'xz'):
+            # These leave a file object they were given open.
+            binary = io.BufferedReader(_ClosingReader(binary, raw))
+    elif kind == 'bgzf':
+        binary = io.BufferedReader(BGZFReader(open(filename, "rb")))
+    elif kind == 'gzip':
+        binary = gzip.open(filename, "rb")
+    elif kind == 'bz2':
+        binary = bz2.open(filename, "rb")
+    elif kind == 'xz':
+        binary = lzma.open(filename, "rb")
+    else:
+        binary = open(filename, "rb")
+
+    if 'b' in mode:
+        return(binary)
+    return(io.TextIOWrapper(binary))
+
+def openoutput(filename, compress=None):
+    """
+    Take filename, and whether to gzip.  Return text file object open for
+    writing.
+
+    With compress None, output is gzipped if filename ends in '.gz'.  Text
+    is encoded as open(filename, "w") would encode it.
+    """
+
+    if compress is None:
+        compress = filename.endswith('.gz')
+    if not compress:
+        return(open(filename, "w", buffering=WRITE_BUFFER))
+
+    # No file name or mtime in the header, so output depends only on text.
+    raw = open(filename, "wb")
+    try:
+        binary = gzip.GzipFile(filename='', mode="wb", fileobj=raw,
+            compresslevel=GZIP_LEVEL, mtime=0)
+    except BaseException:
+        raw.close()
+        raise
+    return(io.TextIOWrapper(io.BufferedWriter(_ClosingWriter(binary, raw),
+        WRITE_BUFFER)))
+
+def writelines(out, lines):
+    """
+    Take open text file and iterable of lines, each ending in a newline.
+    Write them, joined into writes of about WRITE_CHUNK characters.  Return
+    number of lines written.
+    """
+
+    chunk = []
+    size = 0
+    count = 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size >= WRITE_CHUNK:
+            out.write(''.join(chunk))
+            count += len(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        out.write(''.join(chunk))
+        count += len(chunk)
+    return(count)
+
+def _bgzfsize(header):
+    """
+    Take the first bytes of a gzip member.  Return its BGZF block size, or
+    None if the member has no BGZF 'BC' field.
+
+    Only the first extra subfield is checked, as bgzip always writes 'BC'
+    first.
+    """
+
+    if len(header) < 18 or not header[3] & 4:
+        return(None)
+    xlen, si1, si2, slen, bsize = struct.unpack('<HBBHH', header[10:18])
+    if (si1, si2, slen) != (66, 67, 2) or xlen < 6:
+        return(None)
+    return(bsize + 1)
+
+def _inflate(block):
+    """
+    Take one whole BGZF block.  Return its inflated data.
+    """
+
+    xlen, = struct.unpack('<H', block[10:12])
+    data = zlib.decompress(block[12 + xlen:-8], -15)
+    crc, size = struct.unpack('<II', block[-8:])
+    if len(data) != size or zlib.crc32(data) & 0xffffffff != crc:
+        raise OSError("BGZF block failed its CRC check")
+    return(data)
+
+class CountingReader(io.RawIOBase):
+    """
+    Raw binary stream passing the number of bytes of each read to
+    rcprogress.advance(), which may raise rcprogress.Cancelled.
+    """
+
+    def __init__(self, raw):
+        io.RawIOBase.__init__(self)
+        self.raw = raw
+
+    def readable(self):
+        return(True)
+
+    def tell(self):
+        return(self.raw.tell())
+
+    def close(self):
+        if not self.closed:
+            self.raw.close()
+        io.RawIOBase.close(self)
+
+    def readinto(self, buffer):
+        count = self.raw.readinto(buffer)
+        rcr.advance(count or 0)
+        return(count)
+
+class _ClosingReader(io.RawIOBase):
+    """
+    Raw binary stream reading from a decompressing stream, and closing the
+    file object under it as well when closed.
+    """
+
+    def __init__(self, stream, raw):
+        io.RawIOBase.__init__(self)
+        self.stream = stream
+        self.raw = raw
+
+    def readable(self):
+        return(True)
+
+    def close(self):
+        if not self.closed:
+            self.stream.close()
+            self.raw.close()
+        io.RawIOBase.close(self)
+
+    def readinto(self, buffer):
+        return(self.stream.readinto(buffer))
+
+class _ClosingWriter(io.RawIOBase):
+    """
+    Raw binary stream writing to a compressing stream, and closing the file
+    object under it as well when closed.
+    """
+
+    def __init__(self, stream, raw):
+        io.RawIOBase.__init__(self)
+        self.stream = stream
+        self.raw = raw
+
+    def writable(self):
+        return(True)
+
+    def close(self):
+        if not self.closed:
+            try:
+                self.stream.close()
+            finally:
+                self.raw.close()
+        io.RawIOBase.close(self)
+
+    def write(self, buffer):
+        return(self.stream.write(buffer))
+
+class BGZFReader(io.RawIOBase):
+    """
+    Raw binary stream of the inflated data in a BGZF file.
+
+    Blocks are read in order and handed to a thread pool, up to
+    BLOCKS_AHEAD per thread ahead of the reader, so inflating runs in
+    parallel with the caller's parsing.
+    """
+
+    def __init__(self, raw, threads=None):
+        io.RawIOBase.__init__(self)
+        self.raw = raw
+        self.threads = threads or THREADS or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(self.threads)
+        self.pending = deque()
+        self.data = b''
+        self.offset = 0
+        self.done = False
+
+    def readable(self):
+        return(True)
+
+    def close(self):
+        if not self.closed:
+            self.executor.shutdown(wait=True)
+            self.raw.close()
+        io.RawIOBase.close(self)
+
+    def readinto(self, buffer):
+        while self.offset == len(self.data):
+            self._fill()
+            if not self.pending:
+                return(0)
+            self.data = self.pending.popleft().result()
+            self.offset = 0
+
+        count = min(len(buffer), len(self.data) - self.offset)
+        buffer[:count] = self.data[self.offset:self.offset + count]
+        self.offset += count
+        return(count)
+
+    def _fill(self):
+        """
+        Read blocks and queue them for inflating until enough are queued.
+        """
+
+        while not self.done and len(self.pending) < \
+            self.threads * BLOCKS_AHEAD:
+            header = self.raw.read(18)
+            if not header:
+                self.done = True
+                break
+            size = _bgzfsize(header)
+            if size is None:
+                raise OSError("Not a BGZF block at offset %d" % \
+                    (self.raw.tell() - len(header)))
+            block = header + self.raw.read(size - len(header))
+            if len(block) != size:
+                raise OSError("Truncated BGZF block")
+            self.pending.append(self.executor.submit(_inflate, block))
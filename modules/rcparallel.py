@@ -0,0 +1,193 @@
+"""
+rcparallel.py:  Per-chromosome process-pool execution for ROI and MXROI
+
+Work is split by chromosome, and chromosomes holding more than CHUNK_SIZE
+TEs are split further into sub-ranges, so one large chromosome does not
+leave the other workers idle.  Every task's result is merged back in the
+order the serial code would produce it, so output does not depend on jobs.
+
+Manifest:
+    runtasks(function, tasks, jobs)
+        Maps function over tasks, in a process pool if jobs > 1.
+    densitylengths(te, chromosomes, jobs)
+        Returns array of each TE's total overlap with RoIs.  Needs NumPy.
+    matrixhits(chr_regions, te_dict, jobs)
+        Returns mapping {RoI index}>[(TE order, Category, Overlap)].
+"""
+
+import multiprocessing
+from bisect import bisect_right
+import modules.rcindex as rci
+import modules.rccolumns as rcc
+import modules.rcstats as rcs
+import modules.rcprogress as rcr
+
+# Largest number of TEs given to one task, when running in parallel.
+CHUNK_SIZE = 1 << 18
+
+def runtasks(function, tasks, jobs):
+    """
+    Take function, list of tasks and job count.  Return list of results.
+
+    Results are in the order of tasks.  With jobs <= 1, or only one task,
+    everything runs in this process.  A cancelled run stops between tasks,
+    and the pool's workers are terminated.
+    """
+
+    results = []
+
+    if jobs <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            rcr.check()
+            results.append(function(task))
+        return(results)
+
+    pool = multiprocessing.Pool(min(jobs, len(tasks)))
+    try:
+        for result in pool.imap(function, tasks, chunksize=1):
+            rcr.check()
+            results.append(result)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return(results)
+
+def _partcount(te_count, jobs):
+    """
+    Take number of TEs on a chromosome and job count.  Return task count.
+    """
+
+    if jobs <= 1:
+        return(1)
+    return(max(1, -(-te_count // CHUNK_SIZE)))
+
+###############################################################################
+# Overlap density
+
+def _densitytask(task):
+    """
+    Take (IntervalIndex, TE starts, TE ends).  Return overlap lengths.
+    """
+
+    index, starts, ends = task
+    return(rcc.coverage(index, starts, ends))
+
+def densitylengths(te, chromosomes, jobs=1):
+    """
+    Take TEColumns, pidensity() output and job count.  Return overlap lengths.
+
+    Same result as rccolumns.densitylengths().  Each chromosome's TEs are
+    cut into sub-ranges by position.  Each sub-range is sent with only the
+    RoIs that can overlap it.
+    """
+
+    np = rcc.np
+
+    if jobs <= 1:
+        return(rcc.densitylengths(te, chromosomes))
+
+    tasks = []
+    targets = []
+
+    for chromosome, rows in te.bychromosome():
+        if "_random" in chromosome or chromosome not in chromosomes:
+            continue
+        index = chromosomes[chromosome]
+
+        rows = rows[np.argsort(te.starts[rows], kind='stable')]
+        for chunk in np.array_split(rows, _partcount(len(rows), jobs)):
+            starts = te.starts[chunk]
+            ends = te.ends[chunk]
+            low = int(min(starts.min(), ends.min()))
+            high = int(max(starts.max(), ends.max()))
+            tasks.append((rci.IntervalIndex(index.overlapping(low, high)), \
+                starts, ends))
+            targets.append(chunk)
+
+    lengths = np.zeros(len(te), dtype=np.int64)
+    for chunk, result in zip(targets, runtasks(_densitytask, tasks, jobs)):
+        lengths[chunk] = result
+        rcs.count('overlap comparisons', len(chunk))
+    return(lengths)
+
+###############################################################################
+# Matrix
+
+def _matrixtask(task):
+    """
+    Take (RoI ranges, TE ranges).  Return list of overlapping hits and
+    number of RoI/TE pairs compared.
+
+    RoI ranges are (start, end, (RoI index, start, end)).
+    TE ranges are (low, high, (TE order, start, end, category)).
+    Hits are (RoI index, TE order, category, overlap length).
+    """
+
+    region_ranges, te_ranges = task
+    hits = []
+    compared = 0
+
+    for region, te in rci.sweepjoin(region_ranges, te_ranges):
+        compared += 1
+        region_index, pi_start, pi_end = region
+        te_order, this_start, this_end, category = te
+        overlap_length = rci.overlaplength(this_start, this_end, \
+            pi_start, pi_end)
+        if overlap_length > 0:
+            hits.append((region_index, te_order, category, overlap_length))
+
+    return(hits, compared)
+
+def matrixhits(chr_regions, te_dict, jobs=1):
+    """
+    Take RoIs by chromosome, fasmatrix() output and job count.
+    Return mapping {RoI index}>[(TE order, Category, Overlap)].
+
+    chr_regions maps chromosome to a list of (start, end, RoI index).
+    TE order is a TE's position in its te_dict arrays.  Hit lists are in no
+    particular order.
+
+    With jobs > 1, each chromosome's RoIs are cut into sub-ranges by
+    position.  Each sub-range is sent with only the TEs that can overlap it.
+    Every RoI belongs to exactly one task, so its hits are complete.
+    """
+
+    tasks = []
+
+    for this_chr in chr_regions:
+        try:
+            te_starts, te_ends, te_categories = te_dict[this_chr]
+        except KeyError:
+            continue
+
+        te_ranges = sorted((min(x[1], x[2]), max(x[1], x[2]), x) \
+            for x in zip(range(len(te_starts)), te_starts.tolist(), \
+                te_ends.tolist(), te_categories.tolist()))
+        te_lows = [x[0] for x in te_ranges]
+
+        region_ranges = sorted((x[0], x[1], (x[2], x[0], x[1])) \
+            for x in chr_regions[this_chr])
+        parts = min(_partcount(len(te_ranges), jobs), len(region_ranges))
+        size = -(-len(region_ranges) // parts)
+
+        for i in range(0, len(region_ranges), size):
+            chunk = region_ranges[i:i + size]
+            if parts == 1:
+                tasks.append((chunk, te_ranges))
+                continue
+            low = chunk[0][0]
+            high = max(x[1] for x in chunk)
+            tasks.append((chunk, [x for x in \
+                te_ranges[:bisect_right(te_lows, high)] if x[1] >= low]))
+
+    hits = {}
+    for result, compared in runtasks(_matrixtask, tasks, jobs):
+        rcs.count('overlap comparisons', compared)
+        for region_index, te_order, category, overlap_length in result:
+            if region_index not in hits:
+                hits[region_index] = []
+            hits[region_index].append((te_order, category, overlap_length))
+    return(hits)
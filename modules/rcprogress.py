@@ -0,0 +1,111 @@
+"""
+rcprogress.py:  Progress and cancellation of a run
+
+While a Progress is being monitored, rcio.openinput() counts the bytes read
+from every input file, compressed or not, and checks for cancellation on
+each read.  Long loops that read no input call check() themselves.  A
+cancelled run stops with Cancelled at the next read or check, unwinding
+through the usual with statements, so open files are closed and temporary
+files removed on the way out.
+
+Progress is meant to be monitored by one worker thread and read, or
+cancelled, from another, e.g. the GUI thread.  The current Progress is a
+context variable, so each thread, and each asyncio task, monitors its own
+run, and cancelling one run does not stop another.  A thread started
+during a run does not inherit its Progress.
+
+Manifest:
+    Cancelled
+        Raised in a run that was cancelled.
+    Progress(total)
+        Bytes read out of total, and a cancel flag.
+    monitoring(progress)
+        Context manager making progress current.
+    advance(count)
+        Adds bytes read to the current Progress, then check().
+    check()
+        Raises Cancelled if the current Progress was cancelled.
+    active()
+        Returns whether a Progress is being monitored.
+"""
+
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Progress monitored in this context, if any
+_current = contextvars.ContextVar('rcprogress_current', default=None)
+
+class Cancelled(Exception):
+    """
+    Raised in a run that was cancelled.
+    """
+
+class Progress(object):
+    """
+    Bytes read out of total, and a cancel flag.
+
+    total is the size of the input files to be read, e.g. the sum of their
+    os.path.getsize().  Index files loaded in place of TE data count as
+    the size of the TE data file.
+    """
+
+    def __init__(self, total=0):
+        self.total = total
+        self.done = 0
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        """
+        Ask the run to stop.  Return nothing.
+        """
+
+        self.cancelled.set()
+
+    def fraction(self):
+        """
+        Return fraction of total read, from 0.0 to 1.0.
+        """
+
+        if not self.total:
+            return(0.0)
+        return(min(1.0, float(self.done) / self.total))
+
+@contextmanager
+def monitoring(progress):
+    """
+    Take Progress.  Make it current for the body of the with statement.
+    """
+
+    token = _current.set(progress)
+    try:
+        yield progress
+    finally:
+        _current.reset(token)
+
+def advance(count):
+    """
+    Take number of bytes read.  Add to current Progress, then check().
+    """
+
+    progress = _current.get()
+    if progress is not None:
+        progress.done += count
+        if progress.cancelled.is_set():
+            raise Cancelled()
+
+def check():
+    """
+    Raise Cancelled if the current Progress was cancelled.
+    """
+
+    progress = _current.get()
+    if progress is not None and progress.cancelled.is_set():
+        raise Cancelled()
+
+def active():
+    """
+    Return whether a Progress is being monitored.
+    """
+
+    return(_current.get() is not None)
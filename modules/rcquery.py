@@ -0,0 +1,194 @@
+"""
+rcquery.py:  Indexed TE density queries on arbitrary regions
+
+A RegionIndex holds, for every chromosome and TE category, the sorted
+starts and sorted ends of its TEs with their prefix sums.  A region is then
+answered with a handful of binary searches per category, without visiting
+any TE.  Answers match fasdensity() run with the region as its only RoI.
+
+Manifest:
+    parseregion(string)
+        Parses 'chr7:5,000,000-6,200,000'; returns (Chromosome, Start, End).
+    RegionIndex(te_dict, registry)
+        Per-chromosome, per-category prefix sums of TE ranges.
+"""
+
+import re
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+import modules.rcindex as rci
+import modules.rcclasses as rcl
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+REGION_PATTERN = re.compile(r'^([^:\s]+):([-+]?[\d,]+)-([-+]?[\d,]+)$')
+
+def parseregion(string):
+    """
+    Take region string 'Chromosome:Start-End'.  Return (Chromosome, Start, End).
+
+    Commas in positions are ignored.  Raises ValueError on anything else.
+    """
+
+    match = REGION_PATTERN.match(string.strip())
+    if not match:
+        raise ValueError("Not a region:  %r" % string)
+    chromosome, start, end = match.groups()
+    return((chromosome, int(start.replace(',', '')), \
+        int(end.replace(',', ''))))
+
+class RegionIndex(object):
+    """
+    Per-chromosome, per-category prefix sums of TE ranges.
+
+    Built from fasmatrix() output, so chromosome labels are stripped of
+    'chr' and '_random' chromosomes are already left out.
+
+    For each category, TEs with start < end are kept as sorted starts,
+    sorted ends and prefix sums of both, as in rcindex.IntervalIndex.  For
+    a region [low, high] with low < high, the TEs overlapping it by more
+    than 0 bp are those starting before high less those ending at or before
+    low, and their total overlap is the difference of two cumulative sums.
+    TEs with start == end never overlap by more than 0 bp, and are dropped.
+    TEs with start > end are kept apart and checked one by one with
+    rcindex.overlaplength().
+    """
+
+    def __init__(self, te_dict, registry):
+        self.registry = registry
+        # Map chromosome to {category: (starts, ends, start_sums, end_sums)}
+        self.tables = {}
+        # Map chromosome to list of (start, end, category) with start > end
+        self.reversed = {}
+
+        for chromosome, (starts, ends, categories) in te_dict.items():
+            if np is not None and isinstance(starts, np.ndarray):
+                tables, reversed_tes = _arraytables(starts, ends, categories)
+            else:
+                tables, reversed_tes = _listtables(starts, ends, categories)
+            self.tables[chromosome] = tables
+            if reversed_tes:
+                self.reversed[chromosome] = reversed_tes
+
+    def totals(self, chromosome, low, high):
+        """
+        Take region.  Return {Category}>[Frequency, OverlapLength].
+
+        Categories are in code order, which is their order of first
+        appearance in the TE file.
+        """
+
+        chromosome = chromosome.strip('chr')
+        totals = {}
+        # fasdensity() never matches a RoI with start > end, and a region
+        # of no length overlaps no TE by more than 0 bp.
+        if low >= high:
+            return(totals)
+
+        tables = self.tables.get(chromosome, {})
+        for category in sorted(tables):
+            starts, ends, start_sums, end_sums = tables[category]
+            count = bisect_left(starts, high) - bisect_right(ends, low)
+            if count > 0:
+                length = _cumulative(tables[category], high) - \
+                    _cumulative(tables[category], low)
+                totals[category] = [int(count), int(length)]
+
+        for this_start, this_end, category in self.reversed.get(chromosome, []):
+            length = rci.overlaplength(this_start, this_end, low, high)
+            if length > 0:
+                if category in totals:
+                    totals[category][0] += 1
+                    totals[category][1] += length
+                else:
+                    totals[category] = [1, length]
+
+        return(dict((x, totals[x]) for x in sorted(totals)))
+
+    def query(self, chromosome, low, high):
+        """
+        Take region.  Return rcclasses.ClassTotals, read as a mapping
+        {TEClass}>{Subclass}>[Frequency, OverlapLength].
+
+        Numbers are those of fasdensity() with [low, high] as the only RoI.
+        """
+
+        classes = rcl.ClassTotals(self.registry)
+        for category, total in self.totals(chromosome, low, high).items():
+            classes.add(category, total[1], total[0])
+        return(classes)
+
+def _cumulative(table, position):
+    """
+    Take one category's table and a position.  Return total length of its
+    TE ranges left of position, as in IntervalIndex.cumulative().
+    """
+
+    starts, ends, start_sums, end_sums = table
+    started = bisect_right(starts, position)
+    ended = bisect_right(ends, position)
+    return((started * position - start_sums[started]) - \
+        (ended * position - end_sums[ended]))
+
+def _listtables(starts, ends, categories):
+    """
+    Take one chromosome's TE starts, ends and categories as sequences.
+    Return (tables, reversed TEs), built with lists.
+    """
+
+    groups = {}
+    reversed_tes = []
+    for this_start, this_end, category in zip(starts, ends, categories):
+        if this_start < this_end:
+            if category not in groups:
+                groups[category] = ([], [])
+            groups[category][0].append(this_start)
+            groups[category][1].append(this_end)
+        elif this_start > this_end:
+            reversed_tes.append((this_start, this_end, category))
+
+    tables = {}
+    for category, (these_starts, these_ends) in groups.items():
+        these_starts.sort()
+        these_ends.sort()
+        tables[category] = (these_starts, these_ends,
+            [0] + list(accumulate(these_starts)),
+            [0] + list(accumulate(these_ends)))
+    return(tables, reversed_tes)
+
+def _arraytables(starts, ends, categories):
+    """
+    Take one chromosome's TE starts, ends and categories as NumPy arrays.
+    Return (tables, reversed TEs), built with array sorts.
+    """
+
+    flipped = np.flatnonzero(starts > ends)
+    reversed_tes = list(zip(starts[flipped].tolist(), ends[flipped].tolist(), \
+        categories[flipped].tolist()))
+
+    kept = starts < ends
+    starts = starts[kept]
+    ends = ends[kept]
+    categories = categories[kept]
+
+    start_order = np.lexsort((starts, categories))
+    end_order = np.lexsort((ends, categories))
+    sorted_categories = categories[start_order]
+    sorted_starts = starts[start_order]
+    sorted_ends = ends[end_order]
+
+    present, bounds = np.unique(sorted_categories, return_index=True)
+    bounds = np.append(bounds, len(sorted_categories)).tolist()
+
+    tables = {}
+    for i, category in enumerate(present.tolist()):
+        low, high = bounds[i], bounds[i + 1]
+        these_starts = sorted_starts[low:high]
+        these_ends = sorted_ends[low:high]
+        tables[category] = (these_starts, these_ends,
+            np.concatenate(([0], np.cumsum(these_starts))),
+            np.concatenate(([0], np.cumsum(these_ends))))
+    return(tables, reversed_tes)
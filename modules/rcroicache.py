@@ -0,0 +1,209 @@
+"""
+rcroicache.py:  Per-region MXROI results kept between runs
+
+MXROI output is assembled from the TE hits of each RoI:  (TE order,
+category, overlap length) for every TE overlapping it.  A RegionCache keeps
+each RoI's hits in a file beside the output, keyed by RoI label,
+chromosome, start and end.  The whole file is tied to a fingerprint of the
+TE data and the config, so hits are reused only while both are unchanged.
+When the RoI file changes, only new or moved RoIs are overlapped with the
+TE data, and the matrix is assembled from cached and new hits together.
+Output is identical to a run without the cache.
+
+Watch mode reruns MXROI each time the RoI file changes, with TE data kept
+in memory and hits kept in a RegionCache.
+
+Cache files are JSON, named after the output file with SUFFIX added, and
+written under a temporary name and renamed into place as rccache.py does.
+
+Manifest:
+    RegionCache(path, key)
+        Per-region hits of one MXROI output, read from and written to path.
+    cachekey(fas_filename, columns, config)
+        Returns dict identifying TE data and config, which hits depend on.
+    cachepath(out_filename, cache_dir)
+        Returns path of the region cache file for an output file.
+    watch(filename, run, interval)
+        Calls run() whenever filename changes, until interrupted.
+"""
+
+import os
+import sys
+import json
+import time
+import modules.rccache as rck
+import modules.rccolumns as rcc
+import modules.rcparallel as rcp
+import modules.rcstats as rcs
+
+FORMAT = 1
+SUFFIX = '.rcroi'
+
+# Seconds between checks of a watched file
+WATCH_INTERVAL = 1.0
+
+class RegionCache(object):
+    """
+    Per-region hits of one MXROI output, read from and written to path.
+
+    key is cachekey() output.  A cache file written under another key is
+    ignored, and replaced when hits() next saves.
+    """
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        # Map (label, chromosome, start, end) to [(TE order, category,
+        # overlap)], or None until read from path
+        self.entries = None
+
+    def load(self):
+        """
+        Read cached hits from path, if current.  Return number of RoIs read.
+        """
+
+        self.entries = {}
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return(0)
+        if data.get('format') != FORMAT or data.get('key') != self.key:
+            return(0)
+
+        for label, chromosome, start, end, hits in data['regions']:
+            self.entries[(label, chromosome, start, end)] = \
+                [tuple(x) for x in hits]
+        return(len(self.entries))
+
+    def save(self):
+        """
+        Write cached hits to path.  Return nothing.
+        """
+
+        regions = [list(x) + [[list(y) for y in self.entries[x]]] \
+            for x in self.entries]
+        directory = os.path.dirname(self.path) or '.'
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        temp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        try:
+            with open(temp_path, "w") as f:
+                json.dump({'format': FORMAT, 'key': self.key, \
+                    'regions': regions}, f)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def hits(self, regions, chr_regions, te_dict, jobs=1):
+        """
+        Take piregions() output, fasmatrix() output and job count.  Return
+        rcparallel.matrixhits() output for every RoI.
+
+        RoIs found in the cache are not overlapped again.  The rest are
+        overlapped with rcparallel.matrixhits(), and the cache is saved
+        holding exactly the RoIs given.
+        """
+
+        if self.entries is None:
+            self.load()
+
+        keys = {}
+        missing = {}
+        for chromosome, ranges in chr_regions.items():
+            for start, end, region_index in ranges:
+                key = (regions[region_index][0], chromosome, start, end)
+                keys[region_index] = key
+                if key not in self.entries:
+                    if chromosome not in missing:
+                        missing[chromosome] = []
+                    missing[chromosome].append((start, end, region_index))
+
+        computed = rcp.matrixhits(missing, te_dict, jobs)
+        missed = sum(len(x) for x in missing.values())
+        rcs.count('roi cache hits', len(keys) - missed)
+        rcs.count('roi cache misses', missed)
+
+        entries = {}
+        hits = {}
+        for region_index, key in keys.items():
+            if key in entries:
+                found = entries[key]
+            elif key in self.entries:
+                found = self.entries[key]
+            else:
+                found = computed.get(region_index, [])
+            entries[key] = found
+            if found:
+                hits[region_index] = found
+
+        self.entries = entries
+        try:
+            self.save()
+        except OSError as ex:
+            print("Could not write region cache %s:  %s" % (self.path, \
+                ex.strerror))
+        return(hits)
+
+def cachekey(fas_filename, columns, config):
+    """
+    Take TE data file, its columns and ConfigResolver.  Return dict that a
+    region cache must match:  the TE file's rccache.sourcekey(), which
+    changes with its size, mtime or content, the config's fingerprint, and
+    the loader.  The NumPy and line-by-line loaders number categories
+    differently, so their hits cannot be mixed.
+    """
+
+    return({'te': rck.sourcekey(fas_filename, columns),
+        'config': config.fingerprint(),
+        'loader': 'numpy' if rcc.HAVE_NUMPY else 'text'})
+
+def cachepath(out_filename, cache_dir=None):
+    """
+    Take output file and cache directory.  Return region cache path.
+
+    With cache_dir None or '', the cache is kept beside the output file.
+    """
+
+    if not cache_dir:
+        return(out_filename + SUFFIX)
+    return(os.path.join(cache_dir, os.path.basename(out_filename) + SUFFIX))
+
+def watch(filename, run, interval=WATCH_INTERVAL):
+    """
+    Take file to watch, function of no arguments and seconds between
+    checks.  Call run() each time filename changes, until interrupted.
+    Return nothing.
+
+    A change is a new size or mtime.  run() is called once the file has
+    kept the same size and mtime for one interval, so that a file still
+    being written is not read half-way.
+    """
+
+    def state():
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return(None)
+        return((stat.st_size, stat.st_mtime_ns))
+
+    last = state()
+    print("Watching " + filename + " for changes.  Press Ctrl-C to stop.")
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(interval)
+            current = state()
+            if current is None or current == last:
+                continue
+            time.sleep(interval)
+            if state() != current:
+                continue
+            last = current
+            run()
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        print("Stopped watching " + filename + ".")
@@ -0,0 +1,323 @@
+"""
+rcserver.py:  Resident analysis server
+
+Loads TE data files once at startup and answers ROI, MXROI, WG and region
+queries on them over a local TCP or Unix socket, so that each request pays
+only for its own RoIs.  Run from the RepCalc directory:
+
+    python3 -m modules.rcserver --te hg38=hg38.fas --config hg38=my.conf \
+        --port 8765
+
+--te may be given once per data set.  TE columns default to 0 1 2 3, and
+may be given with --columns NAME=0,1,2,3.  --socket PATH listens on a Unix
+socket instead of TCP.  Once listening, the server prints one line,
+"Listening on ...", to standard output.
+
+Protocol:  newline-delimited JSON, one object per line each way.  Requests
+on one connection are answered concurrently, each as soon as it is done,
+so every response carries the request's "id".
+    {"id": 1, "op": "density", "te": "hg38", "length": 5000000,
+        "regions": [["peak0", "chr1", 1000, 2000], ...]}
+    {"id": 2, "op": "matrix", "te": "hg38", "regions": [...],
+        "sparse": false}
+    {"id": 3, "op": "query", "te": "hg38", "region": "chr7:5,000,000-6,200,000"}
+    {"id": 4, "op": "genome", "te": "hg38", "length": 3100000000}
+    {"id": 5, "op": "datasets"}
+Responses are {"id": 1, "ok": true, "result": ...} or {"id": 1, "ok":
+false, "error": "..."}.  density, query and genome results hold "length"
+and "rows" of [class, subclass, number of elements, length in bp,
+percentage or null].  matrix results hold "regions" and "rows" of [row
+label, [%-overlap per region]], or with "sparse", "cells" of [class,
+subclass, region, %-overlap].  Numbers are as the command line analyses
+compute them, unrounded.
+
+Analyses run in a pool of threads, --workers of them.  The event loop only
+reads and writes sockets, so slow requests do not hold up others.  TE data
+is shared by all threads and never modified after loading.
+
+Manifest:
+    main(argv)
+        Command line entry point.
+    serve(server, host, port, path)
+        Listens for connections to server until interrupted.
+    Server(datasets, workers)
+        Answers requests on loaded data sets.
+    tablejson(table)
+        Returns rcapi.ClassTable as a dict ready for JSON.
+    RequestError
+        Raised for a bad request; its message is sent back.
+"""
+
+import os
+import sys
+import json
+import signal
+import asyncio
+import argparse
+import concurrent.futures
+import modules.rcapi as rca
+import modules.rcfuncs as rcf
+import modules.rcquery as rcq
+
+DEFAULT_PORT = 8765
+
+# Longest request line accepted, in bytes
+MAX_REQUEST = 1 << 26
+
+class RequestError(Exception):
+    """
+    Raised for a bad request; its message is sent back.
+    """
+
+class Server(object):
+    """
+    Answers requests on loaded data sets.
+
+    datasets maps data set name to rcapi.TEData.  Each TEData's region
+    index is built here, before any request, so threads only read it.
+    """
+
+    def __init__(self, datasets, workers=None):
+        self.datasets = datasets
+        for data in datasets.values():
+            data.regionindex()
+        self.executor = concurrent.futures.ThreadPoolExecutor(workers or \
+            os.cpu_count() or 1)
+        self.served = 0
+        self.failed = 0
+
+    async def handle(self, reader, writer):
+        """
+        Take stream reader and writer of one connection.  Answer requests
+        until the client closes it.
+        """
+
+        pending = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Longer than MAX_REQUEST.  The stream cannot recover.
+                    self.reply(writer, {'id': None, 'ok': False,
+                        'error': 'Request too long.'})
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.ensure_future(self.respond(line, writer))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+
+            if pending:
+                await asyncio.wait(pending)
+            await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            # Client gone, or server stopping.
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, line, writer):
+        """
+        Take request line and stream writer.  Write the response.
+        """
+
+        loop = asyncio.get_event_loop()
+        response = await loop.run_in_executor(self.executor, self.answer, \
+            line)
+        self.reply(writer, response)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    def reply(self, writer, response):
+        """
+        Take stream writer and response dict.  Write response as one line.
+        """
+
+        if response['ok']:
+            self.served += 1
+        else:
+            self.failed += 1
+        writer.write(json.dumps(response).encode() + b'\n')
+
+    def answer(self, line):
+        """
+        Take request line.  Return response dict.  Runs in a worker thread.
+        """
+
+        request_id = None
+        try:
+            try:
+                request = json.loads(line.decode())
+            except ValueError:
+                raise RequestError("Request is not JSON.")
+            if not isinstance(request, dict):
+                raise RequestError("Request is not a JSON object.")
+            request_id = request.get('id')
+            result = self.run(request)
+        except RequestError as ex:
+            return({'id': request_id, 'ok': False, 'error': str(ex)})
+        except (LookupError, TypeError, ValueError) as ex:
+            return({'id': request_id, 'ok': False,
+                'error': "%s:  %s" % (ex.__class__.__name__, ex)})
+        return({'id': request_id, 'ok': True, 'result': result})
+
+    def run(self, request):
+        """
+        Take request dict.  Return result, ready for JSON.
+        """
+
+        op = request.get('op')
+        if op == 'datasets':
+            return(dict((name, {'tes': len(data)}) \
+                for name, data in self.datasets.items()))
+        if op not in ('density', 'matrix', 'query', 'genome'):
+            raise RequestError("Unknown op:  %r" % op)
+
+        try:
+            data = self.datasets[request.get('te')]
+        except (KeyError, TypeError):
+            raise RequestError("Unknown data set:  %r" % request.get('te'))
+
+        length = request.get('length')
+        if length is not None and (not isinstance(length, int) or \
+            length <= 0):
+            raise RequestError("length must be a positive integer.")
+
+        if op == 'genome':
+            return(tablejson(data.genome(length)))
+
+        if op == 'query':
+            try:
+                region = rcq.parseregion(request['region'])
+            except (KeyError, AttributeError, ValueError):
+                raise RequestError("region must be Chromosome:Start-End.")
+            return(tablejson(data.query(region[0], region[1], region[2], \
+                length)))
+
+        regions = request.get('regions')
+        if not isinstance(regions, list) or \
+            not all(isinstance(x, list) and len(x) == 4 for x in regions):
+            raise RequestError("regions must be a list of " + \
+                "[label, chromosome, start, end].")
+        rois = rca.Regions(regions)
+
+        if op == 'density':
+            return(tablejson(data.density(rois, length)))
+
+        matrix = data.matrix(rois)
+        if request.get('sparse'):
+            return({'regions': matrix.regions,
+                'cells': [list(x) for x in matrix.cells()]})
+        return({'regions': matrix.regions,
+            'rows': [list(x) for x in matrix.rows()]})
+
+def tablejson(table):
+    """
+    Take rcapi.ClassTable.  Return it as a dict ready for JSON.
+    """
+
+    return({'length': table.length,
+        'rows': [list(x) for x in table.rows()]})
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python3 -m modules.rcserver',
+        description='Serve RepCalc analyses on resident TE data.')
+    parser.add_argument('--te', action='append', required=True,
+        metavar='NAME=FILE', help='TE data file to load; may be repeated')
+    parser.add_argument('--columns', action='append', default=[],
+        metavar='NAME=C,C,C,C',
+        help='TE columns of class, chromosome, start, end (default 0,1,2,3)')
+    parser.add_argument('--config', action='append', default=[],
+        metavar='NAME=FILE', help='config file for a data set')
+    parser.add_argument('--cache-dir', default=None,
+        help='keep TE index files in this directory (default: off)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--socket', default=None,
+        help='listen on this Unix socket instead of TCP')
+    parser.add_argument('--workers', type=int, default=None,
+        help='analysis threads (default: number of CPUs)')
+    args = parser.parse_args(argv)
+
+    try:
+        te_files = _pairs(args.te)
+        columns = dict((x, [int(y) for y in value.split(',')]) \
+            for x, value in _pairs(args.columns).items())
+        configs = _pairs(args.config)
+    except ValueError as ex:
+        parser.error(str(ex))
+    for name in list(columns) + list(configs):
+        if name not in te_files:
+            parser.error("no --te for data set %r" % name)
+    if any(len(x) != 4 for x in columns.values()):
+        parser.error("--columns takes 4 column indices")
+
+    datasets = {}
+    for name, fas_filename in te_files.items():
+        print("Loading %s from %s..." % (name, fas_filename), file=sys.stderr)
+        config = None
+        if name in configs:
+            config = rcf.getconfig(configs[name])
+        datasets[name] = rca.readte(fas_filename, config, \
+            columns.get(name, [0, 1, 2, 3]), args.cache_dir)
+
+    server = Server(datasets, args.workers)
+    try:
+        asyncio.run(serve(server, args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
+    return(0)
+
+async def serve(server, host, port, path=None):
+    """
+    Take Server, and host and port or Unix socket path.  Listen for
+    connections until interrupted.
+    """
+
+    if path is not None:
+        listener = await asyncio.start_unix_server(server.handle, path, \
+            limit=MAX_REQUEST)
+        address = path
+    else:
+        listener = await asyncio.start_server(server.handle, host, port, \
+            limit=MAX_REQUEST)
+        address = '%s:%d' % listener.sockets[0].getsockname()[:2]
+
+    # Stop on SIGTERM as on an interrupt, removing the socket file.
+    try:
+        asyncio.get_event_loop().add_signal_handler(signal.SIGTERM, \
+            asyncio.current_task().cancel)
+    except (NotImplementedError, AttributeError):
+        pass
+
+    print("Listening on " + address)
+    sys.stdout.flush()
+    try:
+        async with listener:
+            await listener.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+def _pairs(values):
+    """
+    Take list of 'NAME=VALUE' strings.  Return {Name}>Value.
+    """
+
+    pairs = {}
+    for value in values:
+        name, sep, rest = value.partition('=')
+        if not sep or not name or not rest:
+            raise ValueError("expected NAME=VALUE, not %r" % value)
+        pairs[name] = rest
+    return(pairs)
+
+if __name__ == '__main__':
+    sys.exit(main())
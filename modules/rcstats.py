@@ -0,0 +1,325 @@
+"""
+rcstats.py:  Per-stage timing and counters for a run
+
+Analyses mark their stages with stage() and add to counters with count().
+Both do nothing unless a RunStats is collecting, so an uninstrumented run
+pays only a function call per stage and per counter update.
+
+Stages:
+    config:  reading the config file
+    te parse:  reading TE data, or loading its index
+    roi parse:  reading RoI data and building RoI indexes
+    overlap:  finding overlaps of TEs and RoIs
+    aggregation:  totalling overlaps per class and subclass, or per RoI
+    write:  writing output
+Without NumPy, TE lines are parsed, overlapped and totalled in a single
+pass, which is recorded as te parse.  Stages do not nest.  A stage entered
+more than once, e.g. once per RoI file in batch mode, is accumulated.
+
+Counters:
+    te lines:  TE lines parsed
+    te index rows:  TE rows loaded from an index file instead
+    roi lines:  RoI lines parsed
+    roi files:  RoI files read in batch mode
+    random rows skipped:  TE rows on '_random' chromosomes
+    overlap comparisons:  TEs looked up in a RoI index (WG/ROI), or
+        TE/RoI pairs whose ranges were compared (MXROI)
+    nonzero cells:  nonzero TE x RoI cells of MXROI output
+    config cache hits, config cache misses:  ConfigResolver lookups
+
+Use from Python:
+    stats = rcstats.RunStats(hooks=[callback])
+    with rcstats.collecting(stats):
+        rcfuncs.analysisB(args, opt_dict)
+    report = stats.report()
+callback(event, data) is called with ('stage', {stage measurements}) each
+time a stage ends, and with ('report', report) when collecting ends.
+
+The current RunStats is a context variable, so each thread, and each
+asyncio task, collects into its own.  Concurrent runs, e.g. in a pool of
+worker threads, neither see nor add to each other's stats.  A thread
+started during a run does not inherit its RunStats.
+
+Manifest:
+    RunStats(trace, hooks)
+        Stage measurements and counters of one run; report() returns dict.
+    collecting(stats)
+        Context manager making stats the current RunStats.
+    stage(name)
+        Context manager timing a stage of the current run.
+    staged(name)
+        Decorator running a whole function as one stage.
+    count(name, value)
+        Adds value to a counter of the current run.
+    source(function)
+        Registers function returning counters, read when the run ends.
+    active()
+        Returns whether a RunStats is collecting.
+    printreport(report, out)
+        Prints RunStats.report() as a table.
+"""
+
+import sys
+import time
+import contextvars
+import functools
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+REPORT_FORMAT = 1
+
+# RunStats collecting in this context, if any
+_current = contextvars.ContextVar('rcstats_current', default=None)
+
+class RunStats(object):
+    """
+    Stage measurements and counters of one run.
+
+    With trace, tracemalloc records the peak memory allocated through
+    Python in each stage.  This slows pure-Python parsing noticeably.  Peak
+    resident memory, which includes everything, is always recorded.
+    """
+
+    def __init__(self, trace=False, hooks=None):
+        self.trace = trace
+        self.hooks = list(hooks or [])
+        self.stages = OrderedDict()
+        self.counters = OrderedDict()
+        self.sources = []
+        self.result = None
+        self.started = None
+        self.seconds = None
+
+    def begin(self):
+        """
+        Start timing the run.  Return nothing.
+        """
+
+        self.started = time.perf_counter()
+        if self.trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def finish(self):
+        """
+        Stop timing the run, read counter sources and call hooks.
+        Return report().
+        """
+
+        self.seconds = time.perf_counter() - self.started
+        for function in self.sources:
+            for name, value in function().items():
+                self.add(name, value)
+        self.sources = []
+        if self.trace and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+        report = self.report()
+        for hook in self.hooks:
+            hook('report', report)
+        return(report)
+
+    def add(self, name, value):
+        """
+        Take counter name and value.  Add value to counter.  Return nothing.
+        """
+
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self, name, seconds, rss_before, traced):
+        """
+        Take stage name, seconds, peak resident memory when the stage began
+        and traced peak or None.  Accumulate stage.  Return its measurements
+        for this call.
+        """
+
+        peak = _peakrss(False)
+        growth = None
+        if peak is not None and rss_before is not None:
+            growth = peak - rss_before
+
+        measured = {'stage': name,
+            'seconds': seconds,
+            'peak rss': peak,
+            'rss growth': growth,
+            'traced peak': traced}
+
+        if name not in self.stages:
+            self.stages[name] = {'seconds': 0.0,
+                'calls': 0,
+                'peak rss': None,
+                'rss growth': None,
+                'traced peak': None}
+        totals = self.stages[name]
+        totals['seconds'] += seconds
+        totals['calls'] += 1
+        for key in ['peak rss', 'rss growth', 'traced peak']:
+            if measured[key] is not None:
+                totals[key] = max(totals[key] or 0, measured[key])
+
+        for hook in self.hooks:
+            hook('stage', measured)
+        return(measured)
+
+    def report(self):
+        """
+        Return dict of the run:  result, seconds, peak resident memory of
+        this process and of its children, stages and counters.  Memory is
+        in bytes, or None where it cannot be measured.
+        """
+
+        return(OrderedDict([
+            ('format', REPORT_FORMAT),
+            ('result', self.result),
+            ('seconds', self.seconds),
+            ('peak rss', _peakrss(False)),
+            ('children peak rss', _peakrss(True)),
+            ('traced', self.trace),
+            ('stages', OrderedDict((x, dict(self.stages[x])) \
+                for x in self.stages)),
+            ('counters', OrderedDict(self.counters))]))
+
+@contextmanager
+def collecting(stats):
+    """
+    Take RunStats.  Make it current for the body of the with statement,
+    then finish it.
+    """
+
+    token = _current.set(stats)
+    stats.begin()
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+        stats.finish()
+
+@contextmanager
+def _stage(stats, name):
+    """
+    Take RunStats and stage name.  Time the body of the with statement.
+    """
+
+    rss_before = _peakrss(False)
+    reset = stats.trace and hasattr(tracemalloc, 'reset_peak')
+    if reset:
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        traced = None
+        if stats.trace and tracemalloc.is_tracing():
+            # Before Python 3.9, the peak is since tracing began.
+            traced = tracemalloc.get_traced_memory()[1]
+        stats.record(name, seconds, rss_before, traced)
+
+class _NoStage(object):
+    """
+    Context manager doing nothing, for stages of uncollected runs.
+    """
+
+    def __enter__(self):
+        return(None)
+
+    def __exit__(self, *args):
+        return(False)
+
+_NO_STAGE = _NoStage()
+
+def stage(name):
+    """
+    Take stage name.  Return context manager timing the body of a with
+    statement as that stage of the current run.
+    """
+
+    stats = _current.get()
+    if stats is None:
+        return(_NO_STAGE)
+    return(_stage(stats, name))
+
+def staged(name):
+    """
+    Take stage name.  Return decorator running a function as that stage.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return(function(*args, **kwargs))
+        return(wrapper)
+    return(decorator)
+
+def count(name, value=1):
+    """
+    Take counter name and value.  Add value to counter of the current run.
+    """
+
+    stats = _current.get()
+    if stats is not None:
+        stats.add(name, value)
+
+def source(function):
+    """
+    Take function returning {Counter}>Value.  Add its values to the current
+    run's counters when the run ends.
+    """
+
+    stats = _current.get()
+    if stats is not None:
+        stats.sources.append(function)
+
+def active():
+    """
+    Return whether a RunStats is collecting, so that counts costing more
+    than an addition can be skipped.
+    """
+
+    return(_current.get() is not None)
+
+def printreport(report, out=None):
+    """
+    Take RunStats.report() and file, by default standard error.  Print
+    stages and counters as a table.  Return nothing.
+    """
+
+    out = out or sys.stderr
+
+    def megabytes(value):
+        if value is None:
+            return('-')
+        return('%.1f' % (value / 1048576.0))
+
+    out.write("%-12s %10s %6s %12s %12s\n" % \
+        ('stage', 'seconds', 'calls', 'peak rss MB', 'traced MB'))
+    for name, stage in report['stages'].items():
+        out.write("%-12s %10.3f %6d %12s %12s\n" % (name, stage['seconds'], \
+            stage['calls'], megabytes(stage['peak rss']), \
+            megabytes(stage['traced peak'])))
+    out.write("%-12s %10.3f %6s %12s\n" % ('total', report['seconds'], '', \
+        megabytes(report['peak rss'])))
+
+    for name, value in report['counters'].items():
+        out.write("%-24s %d\n" % (name, value))
+
+def _peakrss(children):
+    """
+    Take whether to ask for child processes.  Return peak resident memory
+    in bytes, or None.
+    """
+
+    if resource is None:
+        return(None)
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    if sys.platform != 'darwin':
+        peak *= 1024
+    return(peak)
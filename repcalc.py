@@ -6,7 +6,9 @@ Contact:  bae53@msstate.edu
 
 import re
 import sys
+import json
 import modules.rcfuncs as rcf
+import modules.rcstats as rcs
 
 if __name__ == '__main__':
     # %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
@@ -32,7 +34,7 @@ if __name__ == '__main__':
         options = sys.argv[1].strip('-')
 
         opt_dict = {}
-        for i in 'abcABt':
+        for i in 'abcqwABst':
             opt_dict[i] = i in options
 
         # 'a','b', and 'c' switch analysis type.
@@ -46,14 +48,26 @@ if __name__ == '__main__':
         # If A is given, custom RoI column numbers are expected.
         # Otherwise, these values default to [0, 1, 2, 3].
 
+        # 'q' answers TE density queries on regions given as
+        # Chromosome:Start-End, from an index of the TE data.
+
+        # 'w' writes windowed TE density along the genome, in bins of one
+        # or more widths given as e.g. 10k,100k,1M, as bedGraph-style tables.
+
+        # 's' writes MXROI output in sparse long format:  one line per
+        # nonzero (class, subclass, region, overlap).
+
         # 't' handles binary case indicating 
         # whether or not to transpose matrix output data.
         # Default is ??? #TODO
 
         # Handle mutually exclusive options:
-        # One is required, and only one is allowed.
+        # One is required, and only one is allowed, unless all three are
+        # given.  '-abc' runs all three analyses on one pass over the TE data.
         optslist = [opt_dict['a'], opt_dict['b'], opt_dict['c']]
-        test = len([x for x in optslist if x]) is 1
+        test = len([x for x in optslist if x]) in (1, 3)
+        if opt_dict['q'] or opt_dict['w']:
+            test = not any(optslist) and not (opt_dict['q'] and opt_dict['w'])
         if not test:
             print("Options error - multiple analyses specified.")
             sys.exit(1)
@@ -61,17 +75,145 @@ if __name__ == '__main__':
         # Toss out first two command line arguments.
         args = sys.argv[2:]
 
+        # '--jobs N' sets the number of worker processes for ROI and MXROI.
+        # It may appear anywhere after the options argument.
+        opt_dict['jobs'] = 1
+        if '--jobs' in args:
+            i = args.index('--jobs')
+            try:
+                opt_dict['jobs'] = int(args[i + 1])
+            except (IndexError, ValueError):
+                opt_dict['jobs'] = 0
+            args = args[:i] + args[i + 2:]
+            if opt_dict['jobs'] < 1:
+                print("Jobs error.  Please provide a positive integer number of jobs.")
+                sys.exit(1)
+
+        # Parsed TE data is kept in an index file beside the TE data, or in
+        # the directory given by '--cache-dir DIR'.  '--no-cache' turns this off.
+        opt_dict['cache'] = ''
+        if '--cache-dir' in args:
+            i = args.index('--cache-dir')
+            if i + 1 == len(args):
+                print("Cache error.  Please provide a directory after --cache-dir.")
+                sys.exit(1)
+            opt_dict['cache'] = args[i + 1]
+            args = args[:i] + args[i + 2:]
+        if '--no-cache' in args:
+            opt_dict['cache'] = None
+            args.remove('--no-cache')
+
+        # '--batch' runs ROI or MXROI on many RoI files against one TE file.
+        # The RoI argument is then a glob or '@' and a list file, and the
+        # output argument is a directory.
+        opt_dict['batch'] = '--batch' in args
+        if opt_dict['batch']:
+            args.remove('--batch')
+
+        # '--incremental' keeps each RoI's MXROI hits beside the output,
+        # so a rerun overlaps only new or changed RoIs.  '--watch' reruns
+        # MXROI whenever the RoI file changes, keeping the TE data loaded.
+        opt_dict['incremental'] = '--incremental' in args
+        if opt_dict['incremental']:
+            args.remove('--incremental')
+        opt_dict['watch'] = '--watch' in args
+        if opt_dict['watch']:
+            args.remove('--watch')
+            if not opt_dict['c'] or opt_dict['batch'] or all(optslist):
+                print("Watch error.  --watch applies to MXROI on a single region of interest file.")
+                sys.exit(1)
+
+        # '--merge' merges overlapping RoIs before ROI, so each bp of a
+        # RoI is counted once.  With a length of 'auto', ROI takes the
+        # length of the merged RoIs.
+        opt_dict['merge'] = '--merge' in args
+        if opt_dict['merge']:
+            args.remove('--merge')
+
+        # '--union' counts bp covered by overlapping TEs once, merging TE
+        # ranges per chromosome, and adds a coverage depth histogram.
+        opt_dict['union'] = '--union' in args
+        if opt_dict['union']:
+            args.remove('--union')
+            if not (opt_dict['a'] or opt_dict['b']) or all(optslist) or \
+                opt_dict['batch']:
+                print("Union error.  --union applies to WG, or to ROI on a single region of interest file.")
+                sys.exit(1)
+
+        # '--by-chromosome' adds a block per chromosome to WG output.  The
+        # length must then be a chrom.sizes or .fai file.
+        opt_dict['by_chromosome'] = '--by-chromosome' in args
+        if opt_dict['by_chromosome']:
+            args.remove('--by-chromosome')
+            if not opt_dict['a'] or all(optslist):
+                print("Sizes error.  --by-chromosome applies to WG.")
+                sys.exit(1)
+
+        # '--chromosome-column N' reads the chromosome of each TE from
+        # column N in WG, in place of column 4.
+        opt_dict['chromosome_column'] = 4
+        if '--chromosome-column' in args:
+            i = args.index('--chromosome-column')
+            try:
+                opt_dict['chromosome_column'] = int(args[i + 1])
+            except (IndexError, ValueError):
+                opt_dict['chromosome_column'] = -1
+            args = args[:i] + args[i + 2:]
+            if not opt_dict['a'] or all(optslist):
+                print("Column error.  --chromosome-column applies to WG.")
+                sys.exit(1)
+            if opt_dict['chromosome_column'] < 0:
+                print("Column value error.  Please provide a positive integer value after --chromosome-column.")
+                sys.exit(1)
+
+        # '--stats FILE' writes per-stage timing, memory and counters as
+        # JSON.  '--profile' also traces Python memory per stage, and prints
+        # a summary of stages.
+        stats_filename = None
+        if '--stats' in args:
+            i = args.index('--stats')
+            if i + 1 == len(args):
+                print("Stats error.  Please provide a file path after --stats.")
+                sys.exit(1)
+            stats_filename = args[i + 1]
+            args = args[:i] + args[i + 2:]
+        profile = '--profile' in args
+        if profile:
+            args.remove('--profile')
+
         commands = {'a': rcf.analysisA,
             'b': rcf.analysisB,
-            'c': rcf.analysisC,}
-
-        for letter in 'abc':
-            if opt_dict[letter]:
-                result = commands[letter](args, opt_dict)
+            'c': rcf.analysisC,
+            'q': rcf.analysisQ,
+            'w': rcf.analysisW,}
+
+        stats = rcs.RunStats(trace=profile)
+        with rcs.collecting(stats):
+            if all(optslist):
+                result = rcf.analysisAll(args, opt_dict)
+            else:
+                for letter in 'abcqw':
+                    if opt_dict[letter]:
+                        result = commands[letter](args, opt_dict)
+            stats.result = result
+
+        if stats_filename is not None:
+            report = stats.report()
+            report['command'] = sys.argv[1:]
+            with open(stats_filename, 'w') as f:
+                json.dump(report, f, indent=2)
+                f.write('\n')
+        if profile:
+            rcs.printreport(stats.report())
 
         result_dict = {0: 'Program complete.',
             1: 'Column indexing error.  No output written.',
             2: 'Column value error.  Please provide positive integer values for column indices.  No output written.',
-            3: 'Length error.  No output written.  Please provide a valid length.',}
+            3: 'Length error.  No output written.  Please provide a valid length.',
+            4: 'Batch error.  No region of interest files found.  No output written.',
+            5: 'Region error.  Please provide regions as Chromosome:Start-End.',
+            6: 'Bin size error.  Please provide bin widths such as 10000,100k,1M.  No output written.',
+            7: 'Sizes error.  --by-chromosome needs a chrom.sizes or .fai file in place of the length.  No output written.',
+            8: 'Options error.  --batch, --incremental, --watch, --union and --by-chromosome do not apply to -abc.  No output written.',}
 
         print(result_dict[result])
@@ -0,0 +1,114 @@
+"""
+rctest.py:  Shared fixtures for the RepCalc tests
+
+The tests use unittest and run from the RepCalc directory with either
+    python3 -m pytest tests
+    python3 -m unittest discover tests
+
+Input fixtures in tests/data are a slice of the tiny synthetic data set of
+benchmarks/generate.py:  every TE of a few chromosomes, one '_random'
+contig among them, and the RoIs on those chromosomes.  Golden outputs in
+tests/golden were written by the original RepCalc release from the same
+inputs, and analyses must reproduce them byte for byte.
+
+Manifest:
+    DATA, GOLDEN
+        Fixture directories.
+    TE, ROI, CONFIG, GENOME_LENGTH, ROI_LENGTH
+        Fixture files, and lengths the golden outputs were written with.
+    options(letters, **settings)
+        Returns opt_dict as repcalc.py builds it.
+    golden(name, te_filename)
+        Returns golden output text, as written for te_filename.
+    readtext(filename)
+        Returns contents of an output file.
+    loaders()
+        Yields (name, context manager) for each TE loader available.
+    purepython()
+        Context manager running analyses without NumPy.
+"""
+
+import os
+import sys
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import modules.rccolumns as rcc
+import modules.rcbins as rcb
+import modules.rccoverage as rcu
+
+DATA = os.path.join(ROOT, 'tests', 'data')
+GOLDEN = os.path.join(ROOT, 'tests', 'golden')
+
+TE = os.path.join(DATA, 'te.tsv')
+ROI = os.path.join(DATA, 'roi.gff')
+CONFIG = os.path.join(DATA, 'config.conf')
+
+# Lengths the golden outputs were written with.  GENOME_LENGTH is that of
+# the whole tiny data set.
+GENOME_LENGTH = 11429522
+ROI_LENGTH = 50000
+
+# TE file name written into golden .tbl headers
+GOLDEN_TE = 'tests/data/te.tsv'
+
+HAVE_NUMPY = rcc.HAVE_NUMPY
+
+def options(letters, **settings):
+    """
+    Take option letters and other opt_dict entries.  Return opt_dict as
+    repcalc.py builds it, with TE index files off.
+    """
+
+    opt_dict = dict((x, x in letters) for x in 'abcqwABst')
+    opt_dict.update({'jobs': 1, 'cache': None, 'batch': False,
+        'incremental': False, 'watch': False, 'merge': False,
+        'union': False, 'by_chromosome': False, 'chromosome_column': 4})
+    opt_dict.update(settings)
+    return(opt_dict)
+
+def golden(name, te_filename=TE):
+    """
+    Take golden output name and TE file an analysis read.  Return golden
+    text, with its filename header lines naming te_filename.
+    """
+
+    with open(os.path.join(GOLDEN, name), 'r') as f:
+        text = f.read()
+    return(text.replace('filename: ' + GOLDEN_TE, 'filename: ' + te_filename))
+
+def readtext(filename):
+    """
+    Take output file.  Return its contents.
+    """
+
+    with open(filename, 'r') as f:
+        return(f.read())
+
+@contextlib.contextmanager
+def purepython():
+    """
+    Run analyses inside the block as without NumPy.
+    """
+
+    saved = (rcc.HAVE_NUMPY, rcb.np, rcu.np)
+    rcc.HAVE_NUMPY = False
+    rcb.np = None
+    rcu.np = None
+    try:
+        yield
+    finally:
+        rcc.HAVE_NUMPY, rcb.np, rcu.np = saved
+
+def loaders():
+    """
+    Yield (name, context manager) for the line-by-line loader, and for the
+    NumPy loader if NumPy is installed.
+    """
+
+    yield ('text', purepython)
+    if HAVE_NUMPY:
+        yield ('numpy', contextlib.nullcontext)
@@ -0,0 +1,115 @@
+"""
+test_batch.py:  ROI and MXROI on many RoI files with --batch
+
+Each batch output must be what a run on its RoI file alone writes.
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import contextlib
+
+import rctest
+import modules.rcfuncs as rcf
+import modules.rcstats as rcs
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='repcalc-test-')
+        self.roi_dir = os.path.join(self.directory, 'peaks')
+        os.makedirs(self.roi_dir)
+        self.out_dir = os.path.join(self.directory, 'out')
+
+        # The whole fixture, every other RoI, and the last ten RoIs
+        with open(rctest.ROI, 'r') as f:
+            header = f.readline()
+            lines = f.readlines()
+        self.rois = []
+        for name, subset in [('a', lines), ('b', lines[::2]),
+                ('c', lines[-10:])]:
+            path = os.path.join(self.roi_dir, name + '.gff')
+            with open(path, 'w') as f:
+                f.write(header + ''.join(subset))
+            self.rois.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def runB(self, length, roi, out, **settings):
+        return(rcf.analysisB([length, rctest.TE, '0', '1', '2', '3', roi,
+            '0', '3', '4', out, rctest.CONFIG], rctest.options('bAB',
+            **settings)))
+
+    def runC(self, roi, out, **settings):
+        return(rcf.analysisC([rctest.TE, '0', '1', '2', '3', roi, '8', '0',
+            '3', '4', out, rctest.CONFIG], rctest.options('cAB', **settings)))
+
+    def single(self, run, roi, *args):
+        out = os.path.join(self.directory, 'single')
+        self.assertEqual(run(*(args + (roi, out))), 0)
+        return(rctest.readtext(out))
+
+    def test_roi(self):
+        for length in [str(rctest.ROI_LENGTH), 'auto']:
+            for name, loader in rctest.loaders():
+                with self.subTest(length=length, loader=name), loader():
+                    shutil.rmtree(self.out_dir, ignore_errors=True)
+                    self.assertEqual(self.runB(length,
+                        os.path.join(self.roi_dir, '*.gff'), self.out_dir,
+                        batch=True), 0)
+                    self.assertEqual(sorted(os.listdir(self.out_dir)),
+                        ['a.tbl', 'b.tbl', 'c.tbl'])
+                    for roi in self.rois:
+                        self.assertEqual(rctest.readtext(rcf.batchoutput(
+                            self.out_dir, roi, '.tbl')),
+                            self.single(self.runB, roi, length))
+                    if length != 'auto':
+                        self.assertEqual(rctest.readtext(os.path.join(
+                            self.out_dir, 'a.tbl')), rctest.golden('roi.tbl'))
+
+    def test_mxroi(self):
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                shutil.rmtree(self.out_dir, ignore_errors=True)
+                self.assertEqual(self.runC(os.path.join(self.roi_dir,
+                    '*.gff'), self.out_dir, batch=True), 0)
+                for roi in self.rois:
+                    self.assertEqual(rctest.readtext(rcf.batchoutput(
+                        self.out_dir, roi, '.txt')),
+                        self.single(self.runC, roi))
+                self.assertEqual(rctest.readtext(os.path.join(self.out_dir,
+                    'a.txt')), rctest.golden('mxroi.txt'))
+
+    def test_quiet(self):
+        # RoI files read are counted, not printed.
+        stdout = io.StringIO()
+        stats = rcs.RunStats()
+        with contextlib.redirect_stdout(stdout), rcs.collecting(stats):
+            self.assertEqual(self.runC(os.path.join(self.roi_dir, '*.gff'),
+                self.out_dir, batch=True), 0)
+        self.assertNotIn('Processing', stdout.getvalue())
+        self.assertEqual(stats.counters['roi files'], 3)
+
+    def test_list_file(self):
+        # Paths relative to the list file; comments and blank lines skipped
+        listing = os.path.join(self.directory, 'peaks.txt')
+        with open(listing, 'w') as f:
+            f.write('# replicates\npeaks/c.gff\n\npeaks/a.gff\n')
+        self.assertEqual(rcf.batchfiles('@' + listing),
+            [self.rois[2], self.rois[0]])
+        self.assertEqual(self.runB(str(rctest.ROI_LENGTH), '@' + listing,
+            self.out_dir, batch=True), 0)
+        self.assertEqual(sorted(os.listdir(self.out_dir)), ['a.tbl', 'c.tbl'])
+
+    def test_no_files(self):
+        pattern = os.path.join(self.roi_dir, '*.bed')
+        self.assertEqual(self.runB(str(rctest.ROI_LENGTH), pattern,
+            self.out_dir, batch=True), 4)
+        self.assertEqual(self.runC(pattern, self.out_dir, batch=True), 4)
+        self.assertFalse(os.path.exists(self.out_dir))
+
+if __name__ == '__main__':
+    unittest.main()
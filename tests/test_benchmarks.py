@@ -0,0 +1,127 @@
+"""
+test_benchmarks.py:  Benchmark data sets, scenarios and reports
+
+The tiny data set must be written the same for the same seed; the fixtures
+in tests/data are a slice of it.  Every scenario must run on it, and
+reports must compare.
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+import rctest
+import benchmarks.generate as bg
+import benchmarks.scenarios as bs
+import benchmarks.compare as bc
+
+# Chromosomes of the tiny data set kept in the fixtures
+FIXTURE_CHROMOSOMES = ['chr1', 'chr1_KI270706v1_random', 'chr19', 'chr20',
+    'chr21', 'chr22', 'chrY']
+
+def lines(filename, column):
+    """
+    Take data file and its chromosome column.  Return lines after the
+    header, of the fixture chromosomes.
+    """
+
+    with open(filename, 'r') as f:
+        f.readline()
+        return([x for x in f if x.split('\t')[column] in FIXTURE_CHROMOSOMES])
+
+class DatasetTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp(prefix='repcalc-test-')
+        cls.data = os.path.join(cls.directory, 'tiny-1')
+        cls.manifest = bg.dataset(cls.data, 'tiny', 1)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def test_fixtures(self):
+        data = bg.load(self.data)
+        self.assertEqual(lines(data['paths']['te'], 1), lines(rctest.TE, 1))
+        self.assertEqual(lines(data['paths']['gff'], 0),
+            lines(rctest.ROI, 0))
+        self.assertEqual(rctest.readtext(data['paths']['config']),
+            rctest.readtext(rctest.CONFIG))
+
+    def test_manifest(self):
+        data = bg.load(self.data)
+        self.assertEqual(data['genome length'], rctest.GENOME_LENGTH)
+        with open(data['paths']['te'], 'r') as f:
+            self.assertEqual(len(f.readlines()) - 1, data['tes'])
+        with open(data['paths']['bed'], 'r') as f:
+            f.readline()
+            bed = [x.split('\t') for x in f]
+        self.assertEqual(len(bed), data['rois'])
+        self.assertEqual(sum(int(x[2]) - int(x[1]) for x in bed),
+            data['roi length'])
+        for key, path in data['paths'].items():
+            self.assertEqual(os.path.getsize(path), data['bytes'][key])
+
+    def test_reuse(self):
+        # The same size and seed reuse the files; another seed rewrites them.
+        te = os.path.join(self.data, 'te.tsv')
+        mtime = os.path.getmtime(te)
+        self.assertEqual(bg.dataset(self.data, 'tiny', 1), self.manifest)
+        self.assertEqual(os.path.getmtime(te), mtime)
+
+        other = os.path.join(self.directory, 'other')
+        shutil.copytree(self.data, other)
+        self.assertEqual(bg.dataset(other, 'tiny', 2)['seed'], 2)
+        self.assertNotEqual(rctest.readtext(os.path.join(other, 'te.tsv')),
+            rctest.readtext(te))
+
+    def test_scenarios(self):
+        for name in bs.SCENARIOS:
+            with self.subTest(scenario=name):
+                measured = bs.runscenario(name, self.data, {})
+                self.assertEqual(measured['result'], 0)
+                self.assertGreater(measured['seconds'], 0)
+
+    def test_report(self):
+        report = os.path.join(self.directory, 'report.json')
+        process = subprocess.run([sys.executable, '-m', 'benchmarks.run',
+            '--data', self.data, '--scenario', 'getconfig', '--scenario',
+            'analysisB', '--repeat', '2', '--out', report], cwd=rctest.ROOT,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True)
+        self.assertEqual(process.returncode, 0, process.stderr)
+        with open(report, 'r') as f:
+            base = json.load(f)
+        self.assertEqual(sorted(base['scenarios']), ['analysisB',
+            'getconfig'])
+        for summary in base['scenarios'].values():
+            self.assertEqual(summary['status'], 'ok')
+            self.assertEqual(len(summary['runs']), 2)
+
+        self.assertEqual(bc.differences(base, base), [])
+        self.assertEqual([x[3] for x in bc.compare(base, base)], [1.0, 1.0])
+
+        # Twice as slow, on another seed
+        new = json.loads(json.dumps(base))
+        new['dataset']['seed'] = 2
+        for summary in new['scenarios'].values():
+            summary['median seconds'] *= 2
+        self.assertEqual(bc.differences(base, new),
+            ['data set seed differs:  1, 2'])
+        self.assertEqual([x[3] for x in bc.compare(base, new)], [2.0, 2.0])
+        with open(os.path.join(self.directory, 'new.json'), 'w') as f:
+            json.dump(new, f)
+        process = subprocess.run([sys.executable, '-m', 'benchmarks.compare',
+            report, os.path.join(self.directory, 'new.json'), '--fail-above',
+            '1.5'], cwd=rctest.ROOT, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, universal_newlines=True)
+        self.assertEqual(process.returncode, 1, process.stderr)
+        self.assertIn('2.000x', process.stdout)
+
+if __name__ == '__main__':
+    unittest.main()
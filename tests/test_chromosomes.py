@@ -0,0 +1,200 @@
+"""
+test_chromosomes.py:  WG with chrom.sizes/.fai lengths and --by-chromosome
+
+Sizes files are read as their lines give, and each per-chromosome block
+must be what WG writes for that chromosome's TEs alone.
+"""
+
+import os
+import re
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+import rctest
+import modules.rcfuncs as rcf
+
+# Lengths of the fixture chromosomes, with a '_random' contig and a
+# chromosome without TEs
+SIZES = [('chr1', 5000000), ('chr19', 3000000),
+    ('chr1_KI270706v1_random', 175000), ('chr20', 1500000),
+    ('chr21', 1000000), ('chr22', 1000000), ('chrY', 929522),
+    ('chrM', 16569)]
+
+class SizesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='repcalc-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return(path)
+
+    def test_getsizes(self):
+        sizes = self.write('genome.chrom.sizes',
+            ''.join('%s\t%d\n' % x for x in SIZES))
+        self.assertEqual(list(rcf.getsizes(sizes).items()), SIZES)
+
+        # .fai has three more columns; comments and blank lines are skipped.
+        fai = self.write('genome.fa.fai', '# samtools faidx\n\n' + \
+            ''.join('%s\t%d\t%d\t60\t61\n' % (x, y, 6 + y) for x, y in SIZES))
+        self.assertEqual(list(rcf.getsizes(fai).items()), SIZES)
+
+        length = sum(y for x, y in SIZES if '_random' not in x)
+        self.assertEqual(rcf.genomelength(fai), (length, rcf.getsizes(fai)))
+        self.assertEqual(rcf.genomelength('1000'), (1000, None))
+
+    def test_errors(self):
+        for text in ['chr1\n', 'chr1\t5Mb\n', '# nothing\n']:
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    rcf.getsizes(self.write('bad.sizes', text))
+        with self.assertRaises(OSError):
+            rcf.genomelength(os.path.join(self.directory, 'missing.sizes'))
+
+class ChromosomeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='repcalc-test-')
+        self.out = os.path.join(self.directory, 'wg.tbl')
+        self.sizes = os.path.join(self.directory, 'genome.chrom.sizes')
+        with open(self.sizes, 'w') as f:
+            f.write(''.join('%s\t%d\n' % x for x in SIZES))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def runA(self, length, te=rctest.TE, columns=['0', '2', '3'],
+        **settings):
+        self.assertEqual(rcf.analysisA([length, te] + columns + [self.out,
+            rctest.CONFIG], rctest.options('aA', **settings)), 0)
+        return(rctest.readtext(self.out))
+
+    def blocks(self, text):
+        """
+        Take .tbl text.  Return its blocks, without the blank lines between.
+        """
+
+        return(re.split(r'(?<=\n)\n(?====+\nfilename)', text))
+
+    def alone(self, chromosome, length):
+        """
+        Take chromosome and its length.  Return WG output for the fixture
+        TEs on that chromosome alone, with a chromosome: header line.
+        """
+
+        te = os.path.join(self.directory, chromosome + '.tsv')
+        with open(rctest.TE, 'r') as f, open(te, 'w') as out:
+            out.write(f.readline())
+            for line in f:
+                if line.split('\t')[1] == chromosome:
+                    out.write(line)
+        text = self.runA(str(length), te)
+        return(text.replace('filename: ' + te + '\n', 'filename: ' + \
+            rctest.TE + '\nchromosome: ' + chromosome + '\n'))
+
+    def test_sizes_length(self):
+        # The genome block is the golden output for the summed length.
+        with open(self.sizes, 'w') as f:
+            f.write('chr1\t%d\nchr1_KI270706v1_random\t175000\n' % \
+                rctest.GENOME_LENGTH)
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                self.assertEqual(self.runA(self.sizes),
+                    rctest.golden('wg.tbl'))
+
+    def test_by_chromosome(self):
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                blocks = self.blocks(self.runA(self.sizes,
+                    by_chromosome=True))
+                whole = self.runA(str(sum(y for x, y in SIZES \
+                    if '_random' not in x)))
+                self.assertEqual(blocks[0], whole)
+                # Sizes order; no block for '_random' or chrM, without TEs
+                self.assertEqual([re.search(r'chromosome: (\w+)', x).group(1) \
+                    for x in blocks[1:]], ['chr1', 'chr19', 'chr20', 'chr21',
+                    'chr22', 'chrY'])
+                for block, (chromosome, length) in zip(blocks[1:], [x \
+                        for x in SIZES if x[0] not in \
+                        ['chr1_KI270706v1_random', 'chrM']]):
+                    self.assertEqual(block, self.alone(chromosome, length))
+
+    def test_chromosomesections(self):
+        # Names match with or without 'chr'; chromosomes without a length
+        # are left out.
+        sizes = {'1': 100, 'chr2': 200, '3': 300}
+        sections = rcf.chromosomesections(sizes, {'chr3': 'c', 'chr1': 'a',
+            'chrUn': 'u', 'chr2': 'b'})
+        self.assertEqual(sections, [('chr1', 'a', 100), ('chr2', 'b', 200),
+            ('chr3', 'c', 300)])
+
+    def test_chromosome_column(self):
+        # Chromosome read from column 1, with column 4 dropped
+        te = os.path.join(self.directory, 'te4.tsv')
+        with open(rctest.TE, 'r') as f, open(te, 'w') as out:
+            for line in f:
+                out.write('\t'.join(line.split('\t')[:4]) + '\n')
+        expected = self.runA(self.sizes, by_chromosome=True)
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                text = self.runA(self.sizes, te, by_chromosome=True,
+                    chromosome_column=1)
+                self.assertEqual(text, expected.replace(rctest.TE, te))
+
+    def test_columns(self):
+        # -A takes class, start and end; an output named by digits is not
+        # read as a fourth column.
+        self.assertEqual(rcf.analysisA([str(rctest.GENOME_LENGTH),
+            rctest.TE, '0', '2', 'x', self.out], rctest.options('aA')), 2)
+        os.makedirs(os.path.join(self.directory, '2024'))
+        out = os.path.join(self.directory, '2024', '2024')
+        self.assertEqual(rcf.analysisA([str(rctest.GENOME_LENGTH),
+            rctest.TE, '0', '2', '3', out, rctest.CONFIG],
+            rctest.options('aA')), 0)
+        self.assertEqual(rctest.readtext(out), rctest.golden('wg.tbl'))
+
+    def test_no_sizes(self):
+        self.assertEqual(rcf.analysisA([str(rctest.GENOME_LENGTH),
+            rctest.TE, '0', '2', '3', self.out, rctest.CONFIG],
+            rctest.options('aA', by_chromosome=True)), 7)
+        self.assertFalse(os.path.exists(self.out))
+
+    def repcalc(self, *args):
+        return(subprocess.run([sys.executable, os.path.join(rctest.ROOT,
+            'repcalc.py')] + list(args) + ['--no-cache'], cwd=rctest.ROOT,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True))
+
+    def test_command_line(self):
+        expected = self.runA(self.sizes, by_chromosome=True)
+        for args in [['-aA', self.sizes, rctest.TE, '0', '2', '3', self.out,
+                rctest.CONFIG, '--by-chromosome'],
+                ['-aA', self.sizes, rctest.TE, '0', '2', '3', self.out,
+                rctest.CONFIG, '--chromosome-column', '1', '--by-chromosome']]:
+            with self.subTest(args=args):
+                os.remove(self.out)
+                process = self.repcalc(*args)
+                self.assertEqual(process.returncode, 0, process.stderr)
+                self.assertEqual(rctest.readtext(self.out), expected)
+
+        # --chromosome-column takes a column number, and only with WG
+        for args in [['-aA', self.sizes, rctest.TE, '0', '2', '3', self.out,
+                '--chromosome-column', 'x'],
+                ['-bAB', str(rctest.ROI_LENGTH), rctest.TE, '0', '1', '2',
+                '3', rctest.ROI, '0', '3', '4', self.out,
+                '--chromosome-column', '1']]:
+            with self.subTest(args=args):
+                process = self.repcalc(*args)
+                self.assertEqual(process.returncode, 1)
+                self.assertIn('--chromosome-column', process.stdout)
+
+if __name__ == '__main__':
+    unittest.main()
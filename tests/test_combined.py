@@ -0,0 +1,86 @@
+"""
+test_combined.py:  WG, ROI and MXROI together with -abc
+
+-abc must write what -a, -b and -c write separately, with WG taking the
+genome length and ROI the RoI length.
+"""
+
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+import rctest
+import modules.rcfuncs as rcf
+
+def percentages(text):
+    """
+    Take .tbl text.  Return the percentages on its lines, as floats.
+    """
+
+    return([float(x) for x in re.findall(r'\t([\d.]+) ?%$', text, re.M)])
+
+class CombinedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='repcalc-test-')
+        self.prefix = os.path.join(self.directory, 'out')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def combined(self, *args):
+        return(rcf.analysisAll(list(args) + [rctest.TE, '0', '1', '2', '3',
+            rctest.ROI, '8', '0', '3', '4', self.prefix, rctest.CONFIG],
+            rctest.options('abcAB')))
+
+    def test_outputs(self):
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                self.assertEqual(self.combined(str(rctest.GENOME_LENGTH),
+                    str(rctest.ROI_LENGTH)), 0)
+                wg = rctest.readtext(self.prefix + '.wg.tbl')
+                self.assertEqual(wg, rctest.golden('wg.tbl'))
+                self.assertEqual(rctest.readtext(self.prefix + '.roi.tbl'),
+                    rctest.golden('roi.tbl'))
+                self.assertEqual(rctest.readtext(self.prefix + '.mxroi.txt'),
+                    rctest.golden('mxroi.txt'))
+                self.assertTrue(percentages(wg))
+                self.assertLessEqual(max(percentages(wg)), 100)
+
+    def test_sizes_and_auto(self):
+        sizes = os.path.join(self.directory, 'genome.chrom.sizes')
+        with open(sizes, 'w') as f:
+            f.write('chr1\t%d\nchr1_KI270706v1_random\t175000\n' % \
+                rctest.GENOME_LENGTH)
+        self.assertEqual(self.combined(sizes, 'auto'), 0)
+        wg = rctest.readtext(self.prefix + '.wg.tbl')
+        self.assertEqual(wg, rctest.golden('wg.tbl'))
+        roi = rctest.readtext(self.prefix + '.roi.tbl')
+        length = int(re.search(r'total length: (\d+)', roi).group(1))
+        self.assertLess(length, rctest.GENOME_LENGTH)
+        self.assertLessEqual(max(percentages(wg)), 100)
+
+    def test_length_errors(self):
+        # The RoI length is required, and must not exceed the genome's.
+        self.assertEqual(rcf.analysisAll([str(rctest.GENOME_LENGTH),
+            rctest.TE, rctest.ROI, self.prefix], rctest.options('abc')), 3)
+        self.assertEqual(self.combined('1000', str(rctest.ROI_LENGTH)), 3)
+        self.assertFalse(os.path.exists(self.prefix + '.wg.tbl'))
+
+    def test_options(self):
+        # Batch, incremental and watch runs, union coverage and
+        # per-chromosome blocks are not for -abc.
+        for option in ['batch', 'incremental', 'watch', 'union',
+                'by_chromosome']:
+            with self.subTest(option=option):
+                self.assertEqual(rcf.analysisAll([str(rctest.GENOME_LENGTH),
+                    str(rctest.ROI_LENGTH), rctest.TE, '0', '1', '2', '3',
+                    rctest.ROI, '8', '0', '3', '4', self.prefix,
+                    rctest.CONFIG], rctest.options('abcAB', **{option: True})),
+                    8)
+        self.assertEqual(os.listdir(self.directory), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+test_config.py:  Compiled config and its cache
+
+Replacements of the fixture config are checked against tests/golden/
+config_labels.tsv, written by the original configreplace(), however often
+a label is resolved and whether or not the config is compiled.
+"""
+
+import os
+import unittest
+
+import rctest
+import modules.rcfuncs as rcf
+import modules.rcstats as rcs
+
+def labels():
+    """
+    Return list of (label, replacement) in the golden label table.
+    """
+
+    with open(os.path.join(rctest.GOLDEN, 'config_labels.tsv'), 'r') as f:
+        return([tuple(x.rstrip('\n').split('\t')) for x in f])
+
+def configlines():
+    with open(rctest.CONFIG, 'r') as f:
+        return(f.read().splitlines())
+
+class ResolveTest(unittest.TestCase):
+
+    def test_replacements(self):
+        config = rcf.getconfig(rctest.CONFIG)
+        expected = labels()
+        for label, replacement in expected * 3:
+            self.assertEqual(rcf.configreplace(label, config), replacement,
+                label)
+        # Each label resolved once, then read from the cache
+        self.assertEqual(config.stats(), {'labels': len(expected),
+            'hits': 2 * len(expected), 'misses': len(expected)})
+
+        # A plain dict of the same replacements, uncached
+        plain = dict(config)
+        for label, replacement in expected:
+            self.assertEqual(rcf.configreplace(label, plain), replacement,
+                label)
+
+    def test_fasclass(self):
+        config = rcf.getconfig(rctest.CONFIG)
+        self.assertEqual(rcf.fasclass('RC?/Helitron?', config),
+            ('RC', 'No subclass'))
+        self.assertEqual(rcf.fasclass('Synthetic2/Sub2?', config),
+            ('Other2', 'Sub2'))
+        self.assertEqual(rcf.fasclass('LINE/L1', rcf.ConfigResolver()),
+            ('LINE', 'L1'))
+
+    def test_counters(self):
+        stats = rcs.RunStats()
+        with rcs.collecting(stats):
+            config = rcf.getconfig(rctest.CONFIG)
+            for label, replacement in labels() * 2:
+                config.resolve(label)
+        stats.finish()
+        self.assertEqual(stats.counters['config cache misses'],
+            len(labels()))
+        self.assertEqual(stats.counters['config cache hits'], len(labels()))
+
+class FingerprintTest(unittest.TestCase):
+
+    def test_equal(self):
+        # The same replacements, however written, have one fingerprint.
+        lines = configlines()
+        fingerprint = rcf.getconfig(rctest.CONFIG).fingerprint()
+        rules = [x for x in lines if x.strip() and x[0] not in '#;']
+        for other in [lines, rules, rules[::-1],
+                ['; comment'] + [x + '   ' for x in rules]]:
+            self.assertEqual(rcf.parseconfig(other).fingerprint(), fingerprint)
+        self.assertEqual(rcf.parseconfig([]).fingerprint(),
+            rcf.ConfigResolver().fingerprint())
+
+    def test_changed(self):
+        lines = configlines()
+        fingerprints = set([rcf.parseconfig(lines).fingerprint(),
+            rcf.parseconfig(lines + ['Synthetic100 = Unclassified']
+            ).fingerprint(), rcf.parseconfig(lines[:-1]).fingerprint(),
+            rcf.parseconfig([x.replace('RC/Helitron = RC',
+            'RC/Helitron = DNA') for x in lines]).fingerprint(),
+            rcf.ConfigResolver().fingerprint()])
+        self.assertEqual(len(fingerprints), 5)
+
+    def test_cache_ignored(self):
+        # Resolving labels does not change the fingerprint.
+        config = rcf.getconfig(rctest.CONFIG)
+        fingerprint = config.fingerprint()
+        for label, replacement in labels():
+            config.resolve(label)
+        self.assertEqual(config.fingerprint(), fingerprint)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+"""
+test_golden.py:  WG, ROI and MXROI output against the original release
+
+Each analysis is run on the fixtures in tests/data, with every TE loader
+available, and its output compared byte for byte with tests/golden.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+import rctest
+import modules.rcfuncs as rcf
+
+class GoldenTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='repcalc-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def path(self, name):
+        return(os.path.join(self.directory, name))
+
+    def runA(self, **settings):
+        out = self.path('wg.tbl')
+        result = rcf.analysisA([str(rctest.GENOME_LENGTH), rctest.TE,
+            '0', '2', '3', out, rctest.CONFIG], rctest.options('aA',
+            **settings))
+        self.assertEqual(result, 0)
+        return(rctest.readtext(out))
+
+    def runB(self, **settings):
+        out = self.path('roi.tbl')
+        result = rcf.analysisB([str(rctest.ROI_LENGTH), rctest.TE,
+            '0', '1', '2', '3', rctest.ROI, '0', '3', '4', out,
+            rctest.CONFIG], rctest.options('bAB', **settings))
+        self.assertEqual(result, 0)
+        return(rctest.readtext(out))
+
+    def runC(self, letters='cAB', **settings):
+        out = self.path('mxroi.txt')
+        result = rcf.analysisC([rctest.TE, '0', '1', '2', '3', rctest.ROI,
+            '8', '0', '3', '4', out, rctest.CONFIG],
+            rctest.options(letters, **settings))
+        self.assertEqual(result, 0)
+        return(rctest.readtext(out))
+
+    def test_wg(self):
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                self.assertEqual(self.runA(), rctest.golden('wg.tbl'))
+
+    def test_wg_default_columns(self):
+        # Without -A, WG reads class, start and end from columns 0, 2, 3
+        # and the chromosome from column 4.
+        out = self.path('wg.tbl')
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                self.assertEqual(rcf.analysisA([str(rctest.GENOME_LENGTH),
+                    rctest.TE, out, rctest.CONFIG], rctest.options('a')), 0)
+                self.assertEqual(rctest.readtext(out), rctest.golden('wg.tbl'))
+
+    def test_wg_small_percentages(self):
+        # Over a long genome every percentage rounds to 0.0.  Main classes
+        # print "< 0.0005", remaining classes "0.0", as the original did.
+        out = self.path('wg.tbl')
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                self.assertEqual(rcf.analysisA(['1000000000000', rctest.TE,
+                    '0', '2', '3', out, rctest.CONFIG],
+                    rctest.options('aA')), 0)
+                self.assertEqual(rctest.readtext(out),
+                    rctest.golden('wg_large.tbl'))
+
+    def test_roi(self):
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                self.assertEqual(self.runB(), rctest.golden('roi.tbl'))
+
+    def test_mxroi(self):
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                self.assertEqual(self.runC(), rctest.golden('mxroi.txt'))
+
+    def test_mxroi_transposed(self):
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                self.assertEqual(self.runC('cABt'),
+                    rctest.golden('mxroi_t.txt'))
+
+    def test_jobs(self):
+        # Output is the same for any number of jobs.
+        self.assertEqual(self.runB(jobs=3), rctest.golden('roi.tbl'))
+        self.assertEqual(self.runC(jobs=3), rctest.golden('mxroi.txt'))
+
+    def test_command_line(self):
+        out = self.path('mxroi.txt')
+        process = subprocess.run([sys.executable, '-W', 'error',
+            os.path.join(rctest.ROOT, 'repcalc.py'), '-cABt', rctest.TE,
+            '0', '1', '2', '3', rctest.ROI, '8', '0', '3', '4', out,
+            rctest.CONFIG, '--no-cache'], cwd=rctest.ROOT,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True)
+        self.assertEqual(process.returncode, 0, process.stderr)
+        self.assertEqual(process.stderr, '')
+        self.assertIn('Program complete.', process.stdout)
+        self.assertEqual(rctest.readtext(out), rctest.golden('mxroi_t.txt'))
+
+if __name__ == '__main__':
+    unittest.main()
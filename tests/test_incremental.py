@@ -0,0 +1,127 @@
+"""
+test_incremental.py:  MXROI with --incremental
+
+Output must be identical to a run without --incremental, however the RoI
+file changed since the hits were kept, and kept hits must be discarded when
+the TE data or the config changes.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import rctest
+import modules.rcfuncs as rcf
+import modules.rcstats as rcs
+import modules.rcroicache as rcv
+
+class IncrementalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='repcalc-test-')
+        self.roi = os.path.join(self.directory, 'roi.gff')
+        self.config = os.path.join(self.directory, 'config.conf')
+        self.te = os.path.join(self.directory, 'te.tsv')
+        self.out = os.path.join(self.directory, 'mxroi.txt')
+        shutil.copyfile(rctest.ROI, self.roi)
+        shutil.copyfile(rctest.CONFIG, self.config)
+        shutil.copyfile(rctest.TE, self.te)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def runC(self, out=None, **settings):
+        """
+        Take output file and options.  Run MXROI.  Return (output text,
+        counters).
+        """
+
+        out = out or self.out
+        stats = rcs.RunStats()
+        with rcs.collecting(stats):
+            self.assertEqual(rcf.analysisC([self.te, '0', '1', '2', '3',
+                self.roi, '8', '0', '3', '4', out, self.config],
+                rctest.options('cAB', **settings)), 0)
+        return((rctest.readtext(out), stats.counters))
+
+    def expected(self):
+        return(self.runC(os.path.join(self.directory, 'plain.txt'))[0])
+
+    def editroi(self):
+        """
+        Move the first RoI, drop the second and add one.  Return nothing.
+        """
+
+        with open(self.roi, 'r') as f:
+            lines = f.readlines()
+        fields = lines[1].split('\t')
+        fields[3] = str(int(fields[3]) - 500)
+        lines[1] = '\t'.join(fields)
+        del lines[2]
+        lines.append('chr19\tbenchmark\tregion\t100000\t180000\t.\t+\t.\t' \
+            'ID=added\n')
+        with open(self.roi, 'w') as f:
+            f.write(''.join(lines))
+
+    def test_reuse(self):
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                if os.path.exists(self.out + rcv.SUFFIX):
+                    os.remove(self.out + rcv.SUFFIX)
+                text, counters = self.runC(incremental=True)
+                self.assertEqual(text, rctest.golden('mxroi.txt', self.te))
+                self.assertEqual(counters['roi cache misses'], 39)
+                self.assertTrue(os.path.exists(self.out + rcv.SUFFIX))
+
+                text, counters = self.runC(incremental=True)
+                self.assertEqual(text, rctest.golden('mxroi.txt', self.te))
+                self.assertEqual(counters['roi cache hits'], 39)
+                self.assertEqual(counters['roi cache misses'], 0)
+
+    def test_changed_roi(self):
+        self.runC(incremental=True)
+        self.editroi()
+        text, counters = self.runC(incremental=True)
+        self.assertEqual(text, self.expected())
+        self.assertNotEqual(text, rctest.golden('mxroi.txt', self.te))
+        # Only the moved and the added RoI are overlapped.
+        self.assertEqual(counters['roi cache misses'], 2)
+        self.assertEqual(counters['roi cache hits'], 37)
+
+    def test_cache_dir(self):
+        cache = os.path.join(self.directory, 'cache')
+        self.runC(incremental=True, cache=cache)
+        self.assertIn('mxroi.txt' + rcv.SUFFIX, os.listdir(cache))
+        text, counters = self.runC(incremental=True, cache=cache)
+        self.assertEqual(counters['roi cache misses'], 0)
+
+    def test_changed_config(self):
+        self.runC(incremental=True)
+        with open(self.config, 'a') as f:
+            f.write('Synthetic100 = Unclassified\n')
+        text, counters = self.runC(incremental=True)
+        self.assertEqual(counters['roi cache misses'], 39)
+        self.assertEqual(text, self.expected())
+
+    def test_changed_te(self):
+        self.runC(incremental=True)
+        with open(self.te, 'a') as f:
+            f.write('DNA/hAT\tchr19\t100100\t100200\tchr19\n')
+        text, counters = self.runC(incremental=True)
+        self.assertEqual(counters['roi cache misses'], 39)
+        self.assertEqual(text, self.expected())
+
+    def test_loader(self):
+        # The loaders number categories differently, so neither reuses
+        # the other's hits.
+        if not rctest.HAVE_NUMPY:
+            self.skipTest('NumPy is not installed')
+        self.runC(incremental=True)
+        with rctest.purepython():
+            text, counters = self.runC(incremental=True)
+        self.assertEqual(counters['roi cache misses'], 39)
+        self.assertEqual(text, rctest.golden('mxroi.txt', self.te))
+
+if __name__ == '__main__':
+    unittest.main()
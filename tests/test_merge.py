@@ -0,0 +1,113 @@
+"""
+test_merge.py:  ROI with --merge and a length of 'auto'
+
+Duplicate and nested RoIs, merged, must give the output of the RoIs alone,
+and 'auto' must count each bp of the RoIs once.
+"""
+
+import os
+import re
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+import rctest
+import modules.rcfuncs as rcf
+import modules.rcstats as rcs
+
+# Total length of the fixture RoIs, none of which overlap
+ROI_TOTAL = 37668
+
+class MergeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='repcalc-test-')
+        self.out = os.path.join(self.directory, 'roi.tbl')
+
+        # Every RoI twice, and a RoI nested in each of the first ten
+        with open(rctest.ROI, 'r') as f:
+            header = f.readline()
+            lines = f.readlines()
+        nested = []
+        for line in lines[:10]:
+            fields = line.split('\t')
+            fields[3] = str(int(fields[3]) + 10)
+            fields[4] = str(int(fields[4]) - 10)
+            nested.append('\t'.join(fields))
+        self.roi = os.path.join(self.directory, 'peaks.gff')
+        with open(self.roi, 'w') as f:
+            f.write(header + ''.join(lines + nested + lines[::-1]))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def runB(self, length, roi, **settings):
+        """
+        Take length argument, RoI file and options.  Run ROI.  Return
+        (result, output text, counters).
+        """
+
+        stats = rcs.RunStats()
+        with rcs.collecting(stats):
+            result = rcf.analysisB([length, rctest.TE, '0', '1', '2', '3',
+                roi, '0', '3', '4', self.out, rctest.CONFIG],
+                rctest.options('bAB', **settings))
+        return((result, rctest.readtext(self.out), stats.counters))
+
+    def test_merged(self):
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                result, text, counters = self.runB(str(rctest.ROI_LENGTH),
+                    self.roi, merge=True)
+                self.assertEqual(result, 0)
+                self.assertEqual(text, rctest.golden('roi.tbl'))
+                self.assertEqual(counters['rois merged'], 49)
+
+    def test_unmerged(self):
+        # Without --merge, a TE's bp count once per RoI overlapping them.
+        result, text, counters = self.runB(str(rctest.ROI_LENGTH), self.roi)
+        self.assertEqual(result, 0)
+        self.assertNotEqual(text, rctest.golden('roi.tbl'))
+        self.assertNotIn('rois merged', counters)
+        total = re.compile(r'Total interspersed repeats:\t(\d+)bp')
+        self.assertGreater(int(total.search(text).group(1)),
+            int(total.search(rctest.golden('roi.tbl')).group(1)))
+
+    def test_auto(self):
+        for merge in [False, True]:
+            chromosomes = rcf.pidensity(self.roi, [0, 3, 4], merge)
+            self.assertEqual(rcf.roilength(chromosomes), ROI_TOTAL)
+
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                expected = self.runB(str(ROI_TOTAL), rctest.ROI)[1]
+                self.assertIn('total length: %d\n' % ROI_TOTAL, expected)
+                self.assertEqual(self.runB('auto', rctest.ROI)[1], expected)
+                self.assertEqual(self.runB('auto', self.roi, merge=True)[1],
+                    expected)
+
+    def test_no_length(self):
+        # 'auto' with no RoI bp, or a length that is not a number
+        empty = os.path.join(self.directory, 'empty.gff')
+        with open(empty, 'w') as f:
+            f.write('##gff-version 3\n')
+        for length, roi in [('auto', empty), ('50kb', rctest.ROI)]:
+            self.assertEqual(rcf.analysisB([length, rctest.TE, '0', '1',
+                '2', '3', roi, '0', '3', '4', self.out, rctest.CONFIG],
+                rctest.options('bAB')), 3)
+        self.assertFalse(os.path.exists(self.out))
+
+    def test_command_line(self):
+        process = subprocess.run([sys.executable, os.path.join(rctest.ROOT,
+            'repcalc.py'), '-bAB', 'auto', rctest.TE, '0', '1', '2', '3',
+            self.roi, '0', '3', '4', self.out, rctest.CONFIG, '--merge',
+            '--no-cache'], cwd=rctest.ROOT, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, universal_newlines=True)
+        self.assertEqual(process.returncode, 0, process.stderr)
+        self.assertIn('total length: %d\n' % ROI_TOTAL,
+            rctest.readtext(self.out))
+
+if __name__ == '__main__':
+    unittest.main()
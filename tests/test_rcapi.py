@@ -0,0 +1,128 @@
+"""
+test_rcapi.py:  In-memory API on records
+
+Records read from the fixtures must give the golden WG, ROI and MXROI
+output when written, with every TE loader available.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import rctest
+import modules.rcapi as rca
+import modules.rcfuncs as rcf
+
+def records():
+    """
+    Return (TE records, RoI records) of the fixtures.
+    """
+
+    with open(rctest.TE, 'r') as f:
+        f.readline()
+        tes = [(x[0], x[1], int(x[2]), int(x[3])) for x in \
+            (line.split() for line in f)]
+    with open(rctest.ROI, 'r') as f:
+        f.readline()
+        rois = [(x[8], x[0], int(x[3]), int(x[4])) for x in \
+            (line.split('\t') for line in f)]
+    return((tes, [(x[0].strip(), x[1], x[2], x[3]) for x in rois]))
+
+class APITest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tes, cls.rois = records()
+        with open(rctest.CONFIG, 'r') as f:
+            cls.config = rca.compileconfig(f.read())
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='repcalc-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def written(self, result, *args, **settings):
+        out = os.path.join(self.directory, 'out')
+        self.assertEqual(result.write(out, *args, **settings), 0)
+        return(rctest.readtext(out))
+
+    def test_outputs(self):
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                tes = rca.TEData(self.tes, self.config)
+                rois = rca.Regions(self.rois)
+                self.assertEqual(self.written(tes.genome(
+                    rctest.GENOME_LENGTH), rctest.GOLDEN_TE),
+                    rctest.golden('wg.tbl', rctest.GOLDEN_TE))
+                self.assertEqual(self.written(tes.density(rois,
+                    rctest.ROI_LENGTH), rctest.GOLDEN_TE),
+                    rctest.golden('roi.tbl', rctest.GOLDEN_TE))
+                matrix = tes.matrix(rois)
+                self.assertEqual(self.written(matrix),
+                    rctest.golden('mxroi.txt'))
+                self.assertEqual(self.written(matrix, transposed=True),
+                    rctest.golden('mxroi_t.txt'))
+
+    def test_rows(self):
+        # Table rows, and matrix values rounded, are those of the outputs.
+        table = rca.genome(self.tes, self.config, rctest.GENOME_LENGTH)
+        classes = rcf.fasgenome(rctest.TE, rcf.getconfig(rctest.CONFIG),
+            [0, 4, 2, 3])
+        self.assertEqual(table.classes(), classes.classes())
+        for row in table.rows():
+            self.assertEqual([row.frequency, row.length],
+                list(classes[row.superclass][row.subclass]))
+            self.assertEqual(row.percent,
+                100.0 * row.length / rctest.GENOME_LENGTH)
+
+        labels, values = rca.matrix(self.tes, self.rois,
+            self.config).array()
+        lines = [x.split('\t') for x in \
+            rctest.golden('mxroi.txt').splitlines()]
+        self.assertEqual(labels, [x[0] for x in lines[1:]])
+        self.assertEqual([[str(round(float(x), 5)) for x in row] \
+            for row in values], [x[1:] for x in lines[1:]])
+
+    def test_inputs(self):
+        # Sequences in a dict, and a file read by readte(), as records
+        expected = rca.density(self.tes, self.rois, self.config).classes()
+        columns = dict(zip(['classes', 'chromosomes', 'starts', 'ends'],
+            zip(*self.tes)))
+        rois = dict(zip(['labels', 'chromosomes', 'starts', 'ends'],
+            zip(*self.rois)))
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                self.assertEqual(rca.density(columns, rois,
+                    self.config).classes(), expected)
+                self.assertEqual(rca.readte(rctest.TE, self.config).density(
+                    self.rois).classes(), expected)
+        with self.assertRaises(ValueError):
+            rca.TEData([('LINE/L1', 'chr1', 1)])
+
+    def test_query(self):
+        # A query is ROI with the region as the only RoI.
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                tes = rca.TEData(self.tes, self.config)
+                for roi in self.rois[:5] + [('all', 'chr1', 0, 5000000)]:
+                    self.assertEqual(tes.query(*roi[1:]).classes(),
+                        tes.density([roi]).classes())
+
+    def test_merge(self):
+        rois = rca.Regions(self.rois + self.rois[:10])
+        expected = rca.density(self.tes, self.rois, self.config).classes()
+        self.assertEqual(rois.length(), rca.Regions(self.rois).length())
+        tes = rca.TEData(self.tes, self.config)
+        self.assertEqual(tes.density(rois, merge=True).classes(), expected)
+        self.assertNotEqual(tes.density(rois).classes(), expected)
+
+    def test_no_length(self):
+        table = rca.genome(self.tes)
+        self.assertIsNone(table.rows()[0].percent)
+        with self.assertRaises(ValueError):
+            table.write(os.path.join(self.directory, 'out'))
+
+if __name__ == '__main__':
+    unittest.main()
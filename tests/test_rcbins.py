@@ -0,0 +1,157 @@
+"""
+test_rcbins.py:  Windowed TE density with -w
+
+Bins are checked against the bp each TE shares with each bin, counted one
+TE and one bin at a time, with and without NumPy, and -w output against
+the same for the fixtures.
+"""
+
+import os
+import glob
+import random
+import shutil
+import tempfile
+import unittest
+
+import rctest
+import modules.rcfuncs as rcf
+import modules.rcbins as rcb
+
+def bruteforce(tes, size, count):
+    """
+    Take list of (start, end, category), bin width and number of bins.
+    Return {Category}>[bp per bin].
+    """
+
+    bins = {}
+    for start, end, category in tes:
+        row = bins.setdefault(category, [0] * count)
+        for i in range(count):
+            shared = min(end, (i + 1) * size) - max(start, i * size, 0)
+            if shared > 0:
+                row[i] += shared
+    return(bins)
+
+class ParseTest(unittest.TestCase):
+
+    def test_parsesizes(self):
+        self.assertEqual(rcb.parsesizes('1M,10k, 100kb,10000,2500bp'),
+            [2500, 10000, 100000, 1000000])
+        for string in ['', '0', '10x', '-5', '1.5M']:
+            with self.subTest(string=string):
+                with self.assertRaises(ValueError):
+                    rcb.parsesizes(string)
+
+    def test_sizelabel(self):
+        self.assertEqual([rcb.sizelabel(x) for x in [2500, 10000, 3000000]],
+            ['2500bp', '10kb', '3Mb'])
+
+class BinsTest(unittest.TestCase):
+
+    def test_chromosomebins(self):
+        rng = random.Random(10)
+        sizes = [7, 14, 21, 50]
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                for trial in range(30):
+                    tes = []
+                    for i in range(rng.randrange(0, 60)):
+                        start = rng.randrange(-5, 500)
+                        tes.append((start, start + rng.randrange(-5, 90),
+                            rng.choice([3, 1, 4])))
+                    codes, bins, end = rcb.chromosomebins(*([list(x) \
+                        for x in zip(*tes)] or [[], [], []]) + [sizes])
+                    kept = [x for x in tes if x[1] > x[0]]
+                    self.assertEqual(end, max([x[1] for x in kept] or [0]))
+                    # Codes in order of first appearance
+                    self.assertEqual(codes, list(dict.fromkeys(x[2] \
+                        for x in kept)))
+                    for size in sizes:
+                        count = -(-end // size)
+                        expected = bruteforce(kept, size, count)
+                        rows = [list(x) for x in bins[size]]
+                        self.assertEqual(dict(zip(codes, rows)), expected,
+                            (tes, size))
+
+class OutputTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='repcalc-test-')
+        self.prefix = os.path.join(self.directory, 'out')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def expected(self, sizes):
+        """
+        Take bin widths.  Return {Filename}>lines of the fixtures' bins,
+        counted by bruteforce(), without headers.
+        """
+
+        config = rcf.getconfig(rctest.CONFIG)
+        # Map chromosome to list of (start, end, (Class, Subclass))
+        tes = {}
+        with open(rctest.TE, 'r') as f:
+            f.readline()
+            for line in f:
+                line_list = line.split()
+                if '_random' in line_list[1]:
+                    continue
+                tes.setdefault(line_list[1], []).append((int(line_list[2]),
+                    int(line_list[3]), rcf.fasclass(line_list[0], config)))
+
+        # Map (width, Class) to {Chromosome}>{Subclass}>[bp per bin]
+        bins = {}
+        ends = {}
+        for chromosome, these_tes in tes.items():
+            kept = [x for x in these_tes if x[1] > x[0]]
+            ends[chromosome] = max(x[1] for x in kept)
+            for size in sizes:
+                count = -(-ends[chromosome] // size)
+                for category, row in bruteforce(kept, size, count).items():
+                    bins.setdefault((size, category[0]), {}).setdefault(
+                        chromosome, {})[category[1]] = row
+        return((bins, ends))
+
+    def test_output(self):
+        sizes = [100000, 1000000]
+        bins, ends = self.expected(sizes)
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                self.assertEqual(rcf.analysisW(['100k,1M', rctest.TE,
+                    self.prefix, rctest.CONFIG], rctest.options('w')), 0)
+                filenames = glob.glob(self.prefix + '.*.bedGraph')
+                self.assertEqual(len(filenames), len(bins))
+                for (size, this_class), chromosomes in bins.items():
+                    filename = '.'.join([self.prefix, rcb.sizelabel(size),
+                        this_class, 'bedGraph'])
+                    lines = rctest.readtext(filename).splitlines()
+                    header = lines[0].split('\t')
+                    self.assertEqual(header[:4], ['#chrom', 'start', 'end',
+                        this_class])
+                    self.assertEqual(sorted(header[4:]), sorted(set(x \
+                        for rows in chromosomes.values() for x in rows)))
+                    expected = []
+                    for chromosome, rows in chromosomes.items():
+                        count = -(-ends[chromosome] // size)
+                        table = [rows.get(x, [0] * count) for x in header[4:]]
+                        for i, values in enumerate(zip(*table)):
+                            if not sum(values):
+                                continue
+                            start = i * size
+                            end = min(start + size, ends[chromosome])
+                            expected.append('\t'.join([chromosome,
+                                str(start), str(end)] + ['%.6g' % \
+                                (100.0 * x / (end - start)) for x in \
+                                [sum(values)] + list(values)]))
+                    self.assertEqual(lines[1:], expected, filename)
+
+    def test_errors(self):
+        self.assertEqual(rcf.analysisW(['10x', rctest.TE, self.prefix],
+            rctest.options('w')), 6)
+        self.assertEqual(rcf.analysisW(['1M', rctest.TE, '0', 'x', '2', '3',
+            self.prefix], rctest.options('wA')), 2)
+        self.assertEqual(os.listdir(self.directory), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+"""
+test_rccache.py:  TE index files, their key and invalidation
+
+An index is used only while its source is unchanged, and an analysis reads
+the same from it as from the source.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import rctest
+import modules.rccache as rck
+import modules.rccolumns as rcc
+import modules.rcfuncs as rcf
+
+COLUMNS = [0, 1, 2, 3]
+
+@unittest.skipUnless(rctest.HAVE_NUMPY, 'NumPy is not installed')
+class IndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='repcalc-test-')
+        self.fas = os.path.join(self.directory, 'te.tsv')
+        shutil.copyfile(rctest.TE, self.fas)
+        self.cache = os.path.join(self.directory, 'cache')
+        self.registry = rcf.classregistry(rcf.getconfig(rctest.CONFIG))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def load(self, cache_dir, columns=COLUMNS):
+        """
+        Take cache directory and columns.  Return (TEColumns, whether the
+        TE data file was parsed).
+        """
+
+        with mock.patch.object(rcc, 'readcolumns',
+                wraps=rcc.readcolumns) as read, \
+                mock.patch.object(rcc, 'loadcolumns',
+                wraps=rcc.loadcolumns) as load:
+            te = rck.loadcolumns(self.fas, columns, self.registry, cache_dir)
+        return((te, read.called or load.called))
+
+    def assertSameColumns(self, te, other):
+        for name in ['starts', 'ends', 'chromosomes', 'categories']:
+            self.assertEqual(getattr(te, name).tolist(),
+                getattr(other, name).tolist())
+        self.assertEqual(te.chromosome_labels, other.chromosome_labels)
+
+    def test_cachepath(self):
+        self.assertEqual(rck.cachepath(self.fas, COLUMNS, ''),
+            os.path.join(self.directory, 'te.tsv.0-1-2-3.rcidx'))
+        # In a cache directory, same-named sources do not collide.
+        path = rck.cachepath(self.fas, COLUMNS, self.cache)
+        self.assertEqual(os.path.dirname(path), self.cache)
+        self.assertTrue(os.path.basename(path).startswith('te.tsv.0-1-2-3.'))
+        self.assertNotEqual(path, rck.cachepath(rctest.TE, COLUMNS,
+            self.cache))
+        self.assertNotEqual(path, rck.cachepath(self.fas, [0, 4, 2, 3],
+            self.cache))
+
+    def test_reuse(self):
+        parsed, read = self.load(None)
+        self.assertTrue(read)
+
+        written, read = self.load(self.cache)
+        self.assertTrue(read)
+        self.assertTrue(os.path.exists(rck.cachepath(self.fas, COLUMNS,
+            self.cache)))
+
+        loaded, read = self.load(self.cache)
+        self.assertFalse(read)
+        self.assertSameColumns(written, parsed)
+        self.assertSameColumns(loaded, parsed)
+
+    def test_beside_source(self):
+        self.load('')
+        loaded, read = self.load('')
+        self.assertFalse(read)
+        self.assertTrue(os.path.exists(rck.cachepath(self.fas, COLUMNS, '')))
+
+    def test_columns(self):
+        # Another column mapping has its own index.
+        self.load(self.cache)
+        te, read = self.load(self.cache, [0, 4, 2, 3])
+        self.assertTrue(read)
+
+    def test_changed_source(self):
+        before, read = self.load(self.cache)
+        stat = os.stat(self.fas)
+        key = rck.sourcekey(self.fas, COLUMNS)
+
+        # Same size and mtime, different contents:  the sample hash differs.
+        with open(self.fas, 'r+b') as f:
+            f.seek(-2, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-2, os.SEEK_END)
+            f.write(b'8' if last != b'8' else b'9')
+        os.utime(self.fas, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        changed = rck.sourcekey(self.fas, COLUMNS)
+        self.assertEqual((changed['size'], changed['mtime']),
+            (key['size'], key['mtime']))
+        self.assertNotEqual(changed['sample'], key['sample'])
+        path = rck.cachepath(self.fas, COLUMNS, self.cache)
+        self.assertIsNone(rck.readindex(path, changed))
+
+        te, read = self.load(self.cache)
+        self.assertTrue(read)
+        te, read = self.load(self.cache)
+        self.assertFalse(read)
+
+        # Appended lines change size and mtime.
+        with open(self.fas, 'a') as f:
+            f.write('DNA/hAT\tchr1\t1\t20\n')
+        te, read = self.load(self.cache)
+        self.assertTrue(read)
+        self.assertEqual(len(te), len(before) + 1)
+
+    def test_bad_index(self):
+        self.load(self.cache)
+        path = rck.cachepath(self.fas, COLUMNS, self.cache)
+        key = rck.sourcekey(self.fas, COLUMNS)
+        self.assertIsNotNone(rck.readindex(path, key))
+
+        stale = dict(key, version=rck.VERSION + 1)
+        self.assertIsNone(rck.readindex(path, stale))
+        with open(path, 'r+b') as f:
+            f.write(b'XXXX')
+        self.assertIsNone(rck.readindex(path, key))
+        self.assertIsNone(rck.readindex(path + '.missing', key))
+
+    def test_analysis(self):
+        # ROI output is the same whether TE data is parsed or indexed.
+        out = os.path.join(self.directory, 'roi.tbl')
+        for trial in range(2):
+            self.assertEqual(rcf.analysisB([str(rctest.ROI_LENGTH), self.fas,
+                '0', '1', '2', '3', rctest.ROI, '0', '3', '4', out,
+                rctest.CONFIG], rctest.options('bAB', cache=self.cache)), 0)
+            self.assertEqual(rctest.readtext(out),
+                rctest.golden('roi.tbl', self.fas))
+        self.assertEqual(len(os.listdir(self.cache)), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+"""
+test_rcclasses.py:  Category codes and class totals
+
+ClassTotals is checked against the nested {TEClass}>{Subclass}>[Frequency,
+Length] dicts the analyses built before it, however its totals are added.
+"""
+
+import random
+import unittest
+
+import rctest
+import modules.rcclasses as rcl
+
+CATEGORIES = [('LINE', 'L1'), ('SINE', 'Alu'), ('LINE', 'L2'),
+    ('DNA', 'No subclass'), ('SINE', 'MIR'), ('LTR', 'ERVL')]
+
+def nested(tes):
+    """
+    Take list of ((class, subclass), length).  Return nested dicts of
+    totals, built as fasgenome() built them.
+    """
+
+    classes = {}
+    for (superclass, subclass), length in tes:
+        if superclass not in classes:
+            classes[superclass] = {}
+        if subclass not in classes[superclass]:
+            classes[superclass][subclass] = [0, 0]
+        classes[superclass][subclass][0] += 1
+        classes[superclass][subclass][1] += length
+    return(classes)
+
+def items(mapping):
+    """
+    Take {TEClass}>{Subclass}>[Frequency, Length].  Return it as a list,
+    in iteration order.
+    """
+
+    return([(x, list(mapping[x].items())) for x in mapping])
+
+def randomtes(rng, count):
+    return([(rng.choice(CATEGORIES), rng.randrange(-10, 5000)) \
+        for x in range(count)])
+
+class RegistryTest(unittest.TestCase):
+
+    def test_codes(self):
+        calls = []
+
+        def classify(label):
+            calls.append(label)
+            return(tuple(label.split('/')))
+
+        registry = rcl.CategoryRegistry(classify)
+        self.assertEqual([registry.code(x) for x in ['LINE/L1', 'SINE/Alu',
+            'LINE/L1', 'LINE/L2', 'SINE/Alu']], [0, 1, 0, 2, 1])
+        self.assertEqual(calls, ['LINE/L1', 'SINE/Alu', 'LINE/L2'])
+        self.assertEqual(registry.intern(('SINE', 'Alu')), 1)
+        self.assertEqual(registry[2], ('LINE', 'L2'))
+        self.assertEqual(len(registry), 3)
+        self.assertEqual(registry.byclass([2, 1, 0]),
+            [('LINE', [2, 0]), ('SINE', [1])])
+
+class ClassTotalsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = rcl.CategoryRegistry()
+        for category in CATEGORIES:
+            self.registry.intern(category)
+
+    def totals(self, tes):
+        totals = rcl.ClassTotals(self.registry)
+        for category, length in tes:
+            totals.add(self.registry.intern(category), length)
+        return(totals)
+
+    def test_mapping(self):
+        rng = random.Random(11)
+        for trial in range(20):
+            tes = randomtes(rng, rng.randrange(1, 50))
+            totals = self.totals(tes)
+            expected = nested(tes)
+            self.assertEqual(items(totals), items(expected))
+            self.assertEqual(items(totals.classes()), items(expected))
+            self.assertEqual(len(totals), len(expected))
+
+        # Lists handed out are copies.
+        totals = self.totals([(('LINE', 'L1'), 100)])
+        totals['LINE']['L1'][0] += 5
+        self.assertEqual(totals.total(0), [1, 100])
+        self.assertEqual(totals.total(5), [0, 0])
+        self.assertEqual(totals.total(50), [0, 0])
+        with self.assertRaises(KeyError):
+            totals['SINE']
+
+    def test_addmany(self):
+        rng = random.Random(12)
+        tes = randomtes(rng, 200)
+        totals = rcl.ClassTotals(self.registry)
+        totals.addmany([self.registry.intern(x[0]) for x in tes],
+            [x[1] for x in tes])
+        self.assertEqual(items(totals), items(nested(tes)))
+        totals.addmany([], [])
+        self.assertEqual(items(totals), items(nested(tes)))
+
+    def test_merge(self):
+        # Partial totals merged in file order are the totals of the whole,
+        # in the same order.
+        rng = random.Random(13)
+        for trial in range(20):
+            tes = randomtes(rng, rng.randrange(1, 80))
+            cuts = sorted(rng.randrange(len(tes) + 1) for x in range(3))
+            parts = [tes[x:y] for x, y in zip([0] + cuts, cuts + [len(tes)])]
+            totals = rcl.ClassTotals(self.registry)
+            for part in parts:
+                totals.merge(self.totals(part))
+            self.assertEqual(items(totals), items(nested(tes)))
+
+            # In any other order, the same totals
+            merged = rcl.ClassTotals(self.registry)
+            for part in parts[::-1]:
+                merged.merge(self.totals(part))
+            self.assertEqual(merged.classes(), nested(tes))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+"""
+test_rccolumns.py:  NumPy TE tokenizer against the line-by-line parsers
+
+readcolumns() must read what splitting each line on white space reads, and
+reject what the line-by-line parsers reject.
+"""
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import rctest
+import modules.rccolumns as rcc
+import modules.rcfuncs as rcf
+
+COLUMNS = [0, 1, 2, 3]
+
+def splitcolumns(fas_filename, columns):
+    """
+    Take .fas file and column indices.  Return (starts, ends, chromosomes,
+    classes) lists, read by splitting each line on white space.
+    """
+
+    id_index, chr_index, start_index, end_index = columns
+    parsed = ([], [], [], [])
+    with open(fas_filename, 'r') as f:
+        f.readline()
+        for line in f:
+            line_list = line.split()
+            parsed[0].append(int(line_list[start_index]))
+            parsed[1].append(int(line_list[end_index]))
+            parsed[2].append(line_list[chr_index])
+            parsed[3].append(line_list[id_index])
+    return(parsed)
+
+@unittest.skipUnless(rctest.HAVE_NUMPY, 'NumPy is not installed')
+class TokenizerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='repcalc-test-')
+        self.fas = os.path.join(self.directory, 'te.fas')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write(self, text):
+        with open(self.fas, 'w') as f:
+            f.write('class\tchr\tstart\tend\n' + text)
+
+    def readcolumns(self, columns=COLUMNS):
+        parts, chromosome_labels, class_labels = rcc.readcolumns(self.fas,
+            columns)
+        return((parts['starts'].tolist(), parts['ends'].tolist(),
+            [chromosome_labels[x] for x in parts['chromosomes']],
+            [class_labels[x] for x in parts['classes']]))
+
+    def test_random_whitespace(self):
+        rng = random.Random(5)
+        spaces = [' ', '\t', '  ', ' \t', '\t\t']
+        for trial in range(20):
+            # Class, chromosome, start and end in any order, then one more
+            columns = rng.sample(range(4), 4)
+            lines = []
+            for i in range(rng.randrange(1, 200)):
+                fields = [None] * 4 + ['extra']
+                fields[columns[0]] = rng.choice(['DNA/hAT', 'SINE/Alu'])
+                fields[columns[1]] = rng.choice(['chr1', 'chrX_random'])
+                fields[columns[2]] = rng.choice(['', '+', '-', '0']) + \
+                    str(rng.randrange(10 ** rng.randrange(1, 19)))
+                fields[columns[3]] = str(rng.randrange(10 ** 9))
+                line = rng.choice(['', ' ', '\t']) + \
+                    ''.join(x + rng.choice(spaces) for x in fields[:-1]) + \
+                    fields[-1] + rng.choice(['', ' ', '\r'])
+                lines.append(line)
+            self.write('\n'.join(lines) + rng.choice(['', '\n']))
+            self.assertEqual(self.readcolumns(columns),
+                splitcolumns(self.fas, columns))
+
+    def test_long_integers(self):
+        # 19 or more digits, leading zeros included, still read exactly.
+        self.write('DNA\tchr1\t%s\t%d\nDNA\tchr1\t-%s\t%d\n' % \
+            ('0' * 30 + '7', rcc.INT64_MAX, '0' * 20 + '12', rcc.INT64_MIN))
+        self.assertEqual(self.readcolumns()[:2],
+            ([7, -12], [rcc.INT64_MAX, rcc.INT64_MIN]))
+
+    def test_overflow(self):
+        for value in [rcc.INT64_MAX + 1, rcc.INT64_MIN - 1, 10 ** 25]:
+            self.write('DNA\tchr1\t1\t%d\n' % value)
+            with self.assertRaises(OverflowError):
+                self.readcolumns()
+
+    def test_invalid(self):
+        for token in ['12a', '-', '1.5', '+-3']:
+            self.write('DNA\tchr1\t1\t%s\n' % token)
+            with self.assertRaises(ValueError):
+                self.readcolumns()
+
+    def test_short_lines(self):
+        # Blank lines, first, middle or last, and lines missing a column
+        for text in ['\nDNA\tchr1\t1\t2\n', 'DNA\tchr1\t1\t2\n\n',
+                'DNA\tchr1\t1\t2\n \t\nDNA\tchr1\t3\t4\n',
+                'DNA\tchr1\t1\t2\n  ', 'DNA\tchr1\t1\n']:
+            self.write(text)
+            with self.assertRaises(IndexError):
+                self.readcolumns()
+
+class LoaderParityTest(unittest.TestCase):
+    """
+    Both TE loaders fail alike on the same bad input.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='repcalc-test-')
+        self.fas = os.path.join(self.directory, 'te.fas')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def check(self, text, error, load):
+        with open(self.fas, 'w') as f:
+            f.write('class\tchr\tstart\tend\n' + text)
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                with self.assertRaises(error):
+                    load()
+
+    def test_blank_line(self):
+        self.check('DNA/hAT\tchr1\t1\t20\n\nDNA/hAT\tchr1\t30\t40\n',
+            IndexError, lambda: rcf.fasgenome(self.fas,
+                rcf.getconfig(rctest.CONFIG), COLUMNS))
+
+    def test_overflow(self):
+        self.check('DNA/hAT\tchr1\t1\t%d\n' % (rcc.INT64_MAX + 1),
+            OverflowError, lambda: rcf.fasmatrix(self.fas,
+                rcf.classregistry(rcf.getconfig(rctest.CONFIG)), COLUMNS))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,208 @@
+"""
+test_rccoverage.py:  Union coverage and depth histograms for --union
+
+Merged ranges and depths are checked against sets of covered positions,
+with and without NumPy, and --union output against the same for the
+fixtures.
+"""
+
+import os
+import re
+import random
+import shutil
+import tempfile
+import unittest
+
+import rctest
+import modules.rcfuncs as rcf
+import modules.rccoverage as rcu
+
+def positions(starts, ends):
+    """
+    Take range starts and ends.  Return set of the bp they cover.
+    """
+
+    covered = set()
+    for start, end in zip(starts, ends):
+        covered.update(range(start, end))
+    return(covered)
+
+def depths(starts, ends, mask=None):
+    """
+    Take range starts and ends, and optionally a set of bp to count within.
+    Return {Depth}>bp covered by exactly Depth ranges.
+    """
+
+    counts = {}
+    for start, end in zip(starts, ends):
+        for x in range(start, end):
+            if mask is None or x in mask:
+                counts[x] = counts.get(x, 0) + 1
+    histogram = {}
+    for depth in counts.values():
+        histogram[depth] = histogram.get(depth, 0) + 1
+    return(histogram)
+
+def randomranges(rng, count, span=400, width=40):
+    """
+    Take random.Random, number of ranges, coordinate span and greatest
+    width.  Return (starts, ends), a few of them empty or reversed.
+    """
+
+    starts = [rng.randrange(span) for x in range(count)]
+    ends = [x + rng.randrange(-3, width) for x in starts]
+    return(starts, ends)
+
+def sweeps():
+    """
+    Yield (name, context manager) for the list and NumPy sweeps.
+    """
+
+    for name, loader in rctest.loaders():
+        yield ('list' if name == 'text' else name, loader)
+
+class SweepTest(unittest.TestCase):
+
+    def test_mergeranges(self):
+        rng = random.Random(6)
+        for name, sweep in sweeps():
+            with self.subTest(sweep=name), sweep():
+                for trial in range(30):
+                    starts, ends = randomranges(rng, rng.randrange(0, 60))
+                    merged = [list(x) for x in rcu.mergeranges(starts, ends)]
+                    self.assertEqual(positions(*merged),
+                        positions(starts, ends))
+                    # Sorted and disjoint, touching ranges merged
+                    for i in range(len(merged[0]) - 1):
+                        self.assertLess(merged[1][i], merged[0][i + 1])
+                    self.assertTrue(all(x < y for x, y in zip(*merged)))
+
+    def test_intersectranges(self):
+        rng = random.Random(7)
+        for name, sweep in sweeps():
+            with self.subTest(sweep=name), sweep():
+                for trial in range(30):
+                    merged = rcu.mergeranges(*randomranges(rng, 40))
+                    mask = rcu.mergeranges(*randomranges(rng, 10, width=80))
+                    clipped = [list(x) for x in rcu.intersectranges(
+                        merged[0], merged[1], *mask)]
+                    self.assertEqual(positions(*clipped),
+                        positions(*merged) & positions(*mask))
+
+    def test_depthhistogram(self):
+        rng = random.Random(8)
+        for name, sweep in sweeps():
+            with self.subTest(sweep=name), sweep():
+                for trial in range(30):
+                    starts, ends = randomranges(rng, rng.randrange(1, 60))
+                    self.assertEqual(rcu.depthhistogram(starts, ends),
+                        depths(starts, ends))
+                    mask = rcu.mergeranges(*randomranges(rng, 8, width=80))
+                    self.assertEqual(rcu.depthhistogram(starts, ends, mask),
+                        depths(starts, ends, positions(*mask)))
+
+class UnionOutputTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # TE and RoI ranges of the fixtures, '_random' chromosomes left out
+        cls.te = {}
+        with open(rctest.TE, 'r') as f:
+            f.readline()
+            for line in f:
+                line_list = line.split()
+                if '_random' in line_list[1]:
+                    continue
+                ranges = cls.te.setdefault(line_list[1].strip('chr'), ([], []))
+                ranges[0].append(int(line_list[2]))
+                ranges[1].append(int(line_list[3]))
+        cls.roi = {}
+        with open(rctest.ROI, 'r') as f:
+            f.readline()
+            for line in f:
+                line_list = line.split()
+                chromosome = line_list[0].strip('chr')
+                cls.roi.setdefault(chromosome, set()).update(
+                    range(int(line_list[3]), int(line_list[4])))
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='repcalc-test-')
+        self.out = os.path.join(self.directory, 'out.tbl')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def depthsection(self, text):
+        """
+        Take --union .tbl text.  Return {Depth}>bp of its Coverage depth
+        section, with the last depth standing for itself and above.
+        """
+
+        section = text.split('Coverage depth:\n')[1]
+        return(dict((int(x), int(y)) for x, y in \
+            re.findall(r'^ +(\d+)\+? TEs?\t(\d+) bp', section, re.M)))
+
+    def expected(self, masks=None):
+        """
+        Take {Chromosome}>set of bp to count within, or None.  Return
+        depthsection() of the fixture TEs.
+        """
+
+        histogram = {}
+        for chromosome, (starts, ends) in self.te.items():
+            mask = None
+            if masks is not None:
+                if chromosome not in masks:
+                    continue
+                mask = masks[chromosome]
+            for depth, length in depths(starts, ends, mask).items():
+                depth = min(depth, 3)
+                histogram[depth] = histogram.get(depth, 0) + length
+        return(histogram)
+
+    def lengths(self, text):
+        """
+        Take .tbl text.  Return [(label, bp)] of its class and subclass
+        lines.
+        """
+
+        return(re.findall(r'^ *([\w-]+):?\t+\d+\t(\d+) ?bp', text, re.M))
+
+    def check(self, run, golden, masks=None):
+        outputs = []
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                self.assertEqual(run(), 0)
+                outputs.append(rctest.readtext(self.out))
+        text = outputs[0]
+        self.assertEqual(len(set(outputs)), 1)
+        self.assertIn('lengths: union coverage\n', text)
+        self.assertEqual(self.depthsection(text), self.expected(masks))
+
+        # Union lengths never exceed summed lengths, nor percentages 100.
+        union = self.lengths(text)
+        summed = self.lengths(rctest.golden(golden))
+        self.assertEqual([x[0] for x in union], [x[0] for x in summed])
+        for (label, length), (other, total) in zip(union, summed):
+            self.assertLessEqual(int(length), int(total), label)
+        percentages = [float(x) for x in \
+            re.findall(r'\t([\d.]+) ?%$', text, re.M)]
+        self.assertLessEqual(max(percentages), 100)
+        return(text)
+
+    def test_wg(self):
+        text = self.check(lambda: rcf.analysisA([str(rctest.GENOME_LENGTH),
+            rctest.TE, '0', '2', '3', self.out, rctest.CONFIG],
+            rctest.options('aA', union=True)), 'wg.tbl')
+        # All depths together are the bp covered by any TE.
+        covered = sum(len(positions(*x)) for x in self.te.values())
+        self.assertEqual(sum(self.depthsection(text).values()), covered)
+
+    def test_roi(self):
+        self.check(lambda: rcf.analysisB([str(rctest.ROI_LENGTH), rctest.TE,
+            '0', '1', '2', '3', rctest.ROI, '0', '3', '4', self.out,
+            rctest.CONFIG], rctest.options('bAB', union=True)), 'roi.tbl',
+            self.roi)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+test_rcindex.py:  Interval index, sweep join and RoI merging
+
+Every result is checked against overlaplength() applied to each pair of
+ranges, the rule RepCalc's overlap computations must agree with.
+"""
+
+import random
+import unittest
+
+import rctest
+import modules.rcindex as rci
+
+def randomranges(rng, count, span=1000, width=60):
+    """
+    Take random.Random, number of ranges, coordinate span and greatest
+    width.  Return list of [start, end], a few of them reversed.
+    """
+
+    ranges = []
+    for i in range(count):
+        start = rng.randrange(span)
+        end = start + rng.randrange(width)
+        if rng.random() < 0.05:
+            start, end = end, start
+        ranges.append([start, end])
+    return(ranges)
+
+class OverlapLengthTest(unittest.TestCase):
+
+    def test_cases(self):
+        # TE inside, TE containing, and TE across either end of a RoI
+        self.assertEqual(rci.overlaplength(10, 20, 0, 100), 10)
+        self.assertEqual(rci.overlaplength(0, 100, 10, 20), 10)
+        self.assertEqual(rci.overlaplength(0, 15, 10, 20), 5)
+        self.assertEqual(rci.overlaplength(15, 30, 10, 20), 5)
+        self.assertEqual(rci.overlaplength(30, 40, 10, 20), 0)
+        # Touching ranges share one position, of length 0.
+        self.assertEqual(rci.overlaplength(20, 30, 10, 20), 0)
+
+class IntervalIndexTest(unittest.TestCase):
+
+    def test_coverage(self):
+        rng = random.Random(1)
+        for trial in range(20):
+            rois = randomranges(rng, rng.randrange(1, 40))
+            index = rci.IntervalIndex(rois)
+            for start, end in randomranges(rng, 50):
+                expected = sum(rci.overlaplength(start, end, x[0], x[1]) \
+                    for x in rois if x[0] <= x[1])
+                self.assertEqual(index.coverage(start, end), expected,
+                    (rois, start, end))
+
+    def test_overlapping(self):
+        rng = random.Random(2)
+        rois = randomranges(rng, 100)
+        index = rci.IntervalIndex(rois)
+        for low, high in randomranges(rng, 100):
+            if low > high:
+                continue
+            expected = sorted((x[0], x[1]) for x in rois \
+                if x[0] <= x[1] and x[0] <= high and x[1] >= low)
+            self.assertEqual(sorted(index.overlapping(low, high)), expected)
+
+    def test_reversed_dropped(self):
+        index = rci.IntervalIndex([[5, 1], [1, 5], [7, 7]])
+        self.assertEqual(list(index), [(1, 5), (7, 7)])
+        self.assertEqual(len(index), 2)
+
+class SweepJoinTest(unittest.TestCase):
+
+    def test_pairs(self):
+        rng = random.Random(3)
+        for trial in range(20):
+            left = [(x[0], x[1], i) for i, x in \
+                enumerate(randomranges(rng, 60)) if x[0] <= x[1]]
+            right = [(x[0], x[1], i) for i, x in \
+                enumerate(randomranges(rng, 60)) if x[0] <= x[1]]
+            expected = sorted((x[2], y[2]) for x in left for y in right \
+                if x[0] <= y[1] and y[0] <= x[1])
+            self.assertEqual(sorted(rci.sweepjoin(left, right)), expected)
+
+    def test_empty(self):
+        self.assertEqual(list(rci.sweepjoin([], [(0, 5, 'a')])), [])
+        self.assertEqual(list(rci.sweepjoin([(0, 5, 'a')], [])), [])
+
+class MergeIntervalsTest(unittest.TestCase):
+
+    def test_merged(self):
+        self.assertEqual(rci.mergeintervals([[5, 8], [0, 5], [10, 12],
+            [11, 11], [20, 15]]), [(0, 8), (10, 12)])
+
+    def test_union(self):
+        # The summed overlap of a TE with merged RoIs is its overlap with
+        # their union, each position counted once.
+        rng = random.Random(4)
+        for trial in range(20):
+            rois = randomranges(rng, 30, span=300)
+            merged = rci.mergeintervals(rois)
+            for (a, b), (c, d) in zip(merged, merged[1:]):
+                self.assertLess(b, c)
+            covered = set()
+            for start, end in rois:
+                covered.update(range(start, end + 1))
+            self.assertEqual(set(x for start, end in merged \
+                for x in range(start, end + 1)), covered)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,245 @@
+"""
+test_rcio.py:  Compressed input and buffered output
+
+Every compressed input must read as the uncompressed file does, and output
+must be the same text however it is chunked, buffered or compressed.
+"""
+
+import os
+import bz2
+import gzip
+import lzma
+import zlib
+import shutil
+import struct
+import tempfile
+import unittest
+
+import rctest
+import modules.rcio as rco
+import modules.rcfuncs as rcf
+import modules.rcprogress as rcr
+
+def bgzf(data, block_size=65280):
+    """
+    Take bytes and uncompressed size of each block.  Return them as a BGZF
+    file, ending in the empty EOF block as bgzip writes.
+    """
+
+    blocks = []
+    for offset in list(range(0, len(data), block_size)) + [len(data)]:
+        chunk = data[offset:offset + block_size]
+        deflate = zlib.compressobj(6, zlib.DEFLATED, -15)
+        payload = deflate.compress(chunk) + deflate.flush()
+        blocks.append(b'\x1f\x8b\x08\x04' + b'\x00' * 4 + b'\x00\xff' + \
+            struct.pack('<HBBHH', 6, 66, 67, 2, len(payload) + 25) + \
+            payload + struct.pack('<II', zlib.crc32(chunk) & 0xffffffff,
+            len(chunk)))
+    return(b''.join(blocks))
+
+COMPRESSORS = {
+    'gzip': gzip.compress,
+    'bgzf': bgzf,
+    'bz2': bz2.compress,
+    'xz': lzma.compress}
+
+class InputTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='repcalc-test-')
+        with open(rctest.TE, 'rb') as f:
+            self.data = f.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return(path)
+
+    def compressed(self, kind, data=None, name='te'):
+        return(self.write(name + '.' + kind,
+            COMPRESSORS[kind](self.data if data is None else data)))
+
+    def read(self, path, mode):
+        with rco.openinput(path, mode) as f:
+            return(f.read())
+
+    def test_compression(self):
+        self.assertIsNone(rco.compression(rctest.TE))
+        for kind in COMPRESSORS:
+            self.assertEqual(rco.compression(self.compressed(kind)), kind)
+
+    def test_read(self):
+        text = self.data.decode()
+        for kind in COMPRESSORS:
+            path = self.compressed(kind)
+            with self.subTest(kind=kind):
+                self.assertEqual(self.read(path, 'rb'), self.data)
+                self.assertEqual(self.read(path, 'r'), text)
+                with rco.openinput(path) as f:
+                    self.assertEqual(f.readline(), text.split('\n')[0] + '\n')
+                    self.assertEqual(list(f), text.splitlines(True)[1:])
+
+    def test_progress(self):
+        # Bytes are counted as read from disk, before decompression.
+        for kind in [None] + list(COMPRESSORS):
+            if kind is None:
+                path = rctest.TE
+            else:
+                path = self.compressed(kind)
+            with self.subTest(kind=kind):
+                progress = rcr.Progress(os.path.getsize(path))
+                with rcr.monitoring(progress):
+                    self.assertEqual(self.read(path, 'rb'), self.data)
+                self.assertEqual(progress.done, os.path.getsize(path))
+                self.assertEqual(progress.fraction(), 1.0)
+
+    def test_bgzf_blocks(self):
+        # Blocks split lines anywhere, and more are read ahead than
+        # there are threads.
+        saved = rco.THREADS
+        rco.THREADS = 2
+        try:
+            for block_size in [1, 7, 1000]:
+                path = self.write('small.bgz', bgzf(self.data[:20000],
+                    block_size))
+                self.assertEqual(self.read(path, 'r'),
+                    self.data[:20000].decode())
+        finally:
+            rco.THREADS = saved
+
+    def test_bgzf_errors(self):
+        data = bytearray(bgzf(self.data))
+        # Flip a bit of the first block's CRC.
+        first = struct.unpack('<H', bytes(data[16:18]))[0] + 1
+        data[first - 8] ^= 1
+        path = self.write('bad.bgz', bytes(data))
+        with self.assertRaises(OSError):
+            self.read(path, 'rb')
+
+        path = self.write('short.bgz', bgzf(self.data)[:-40])
+        with self.assertRaises(OSError):
+            self.read(path, 'rb')
+
+    def test_analysis(self):
+        # ROI output is the same from compressed TE and RoI files.
+        with open(rctest.ROI, 'rb') as f:
+            roi_data = f.read()
+        out = os.path.join(self.directory, 'roi.tbl')
+        for kind in COMPRESSORS:
+            te = self.compressed(kind)
+            roi = self.compressed(kind, roi_data, 'roi')
+            for name, loader in rctest.loaders():
+                with self.subTest(kind=kind, loader=name), loader():
+                    self.assertEqual(rcf.analysisB([str(rctest.ROI_LENGTH),
+                        te, '0', '1', '2', '3', roi, '0', '3', '4', out,
+                        rctest.CONFIG], rctest.options('bAB')), 0)
+                    self.assertEqual(rctest.readtext(out),
+                        rctest.golden('roi.tbl', te))
+
+class OutputTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='repcalc-test-')
+        self.saved = (rco.WRITE_CHUNK, rcf.MATRIX_CHUNK, rcf.TRANSPOSE_BLOCK)
+
+    def tearDown(self):
+        rco.WRITE_CHUNK, rcf.MATRIX_CHUNK, rcf.TRANSPOSE_BLOCK = self.saved
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def path(self, name):
+        return(os.path.join(self.directory, name))
+
+    def gunzip(self, path):
+        with gzip.open(path, 'rt') as f:
+            return(f.read())
+
+    def runC(self, out, letters='cAB'):
+        self.assertEqual(rcf.analysisC([rctest.TE, '0', '1', '2', '3',
+            rctest.ROI, '8', '0', '3', '4', out, rctest.CONFIG],
+            rctest.options(letters)), 0)
+
+    def test_writelines(self):
+        writes = []
+
+        class Out(object):
+            def write(self, text):
+                writes.append(text)
+
+        lines = ['line %d\n' % x for x in range(1000)]
+        rco.WRITE_CHUNK = 100
+        self.assertEqual(rco.writelines(Out(), iter(lines)), len(lines))
+        self.assertEqual(''.join(writes), ''.join(lines))
+        self.assertTrue(all(len(x) >= 100 for x in writes[:-1]))
+        self.assertLess(len(writes), 100)
+        self.assertEqual(rco.writelines(Out(), []), 0)
+
+    def test_gzip_output(self):
+        text = ''.join('%d\tr\u00e9gion\n' % x for x in range(50000))
+        for name in ['a.txt.gz', 'b.txt.gz']:
+            with rco.openoutput(self.path(name)) as out:
+                out.write(text)
+        with open(self.path('a.txt.gz'), 'rb') as f:
+            data = f.read()
+        # No file name and no time stamp, so equal text gives equal files.
+        self.assertEqual(data[3] & 8, 0)
+        self.assertEqual(data[4:8], b'\x00' * 4)
+        with open(self.path('b.txt.gz'), 'rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(self.gunzip(self.path('a.txt.gz')), text)
+
+        with rco.openoutput(self.path('c.txt'), compress=True) as out:
+            out.write(text)
+        self.assertEqual(self.gunzip(self.path('c.txt')), text)
+        with rco.openoutput(self.path('d.txt')) as out:
+            out.write(text)
+        self.assertEqual(rctest.readtext(self.path('d.txt')), text)
+
+    def test_analyses(self):
+        # WG, and MXROI dense, transposed and sparse, gzipped or in small
+        # chunks, are the same text as written plainly.
+        self.assertEqual(rcf.analysisA([str(rctest.GENOME_LENGTH), rctest.TE,
+            '0', '2', '3', self.path('wg.tbl.gz'), rctest.CONFIG],
+            rctest.options('aA')), 0)
+        self.assertEqual(self.gunzip(self.path('wg.tbl.gz')),
+            rctest.golden('wg.tbl'))
+
+        for letters, golden in [('cAB', 'mxroi.txt'),
+                ('cABt', 'mxroi_t.txt'), ('cABs', None), ('cABst', None)]:
+            with self.subTest(options=letters):
+                rco.WRITE_CHUNK, rcf.MATRIX_CHUNK = self.saved[:2]
+                self.runC(self.path('plain.txt'), letters)
+                plain = rctest.readtext(self.path('plain.txt'))
+                if golden:
+                    self.assertEqual(plain, rctest.golden(golden))
+                self.runC(self.path('out.txt.gz'), letters)
+                self.assertEqual(self.gunzip(self.path('out.txt.gz')), plain)
+                rco.WRITE_CHUNK = 50
+                rcf.MATRIX_CHUNK = 3
+                self.runC(self.path('small.txt'), letters)
+                self.assertEqual(rctest.readtext(self.path('small.txt')),
+                    plain)
+
+    def test_transpose(self):
+        # Any block size, plain or gzipped
+        for name in ['m.txt', 'm.txt.gz']:
+            for block in [1, 100, 1 << 26]:
+                with self.subTest(name=name, block=block):
+                    with rco.openoutput(self.path(name)) as out:
+                        out.write(rctest.golden('mxroi.txt'))
+                    rcf.TRANSPOSE_BLOCK = block
+                    self.assertEqual(rcf.transpose(self.path(name)), 0)
+                    with rco.openinput(self.path(name)) as f:
+                        self.assertEqual(f.read(),
+                            rctest.golden('mxroi_t.txt'))
+                    self.assertEqual(rco.compression(self.path(name)),
+                        'gzip' if name.endswith('.gz') else None)
+                    self.assertEqual(sorted(os.listdir(self.directory)),
+                        [name])
+                    os.remove(self.path(name))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+"""
+test_rcquery.py:  Indexed region queries with -q
+
+Region totals are checked against overlaplength() applied to every TE, and
+queries on the fixtures against fasdensity() with the region as the only
+RoI, as the index promises.
+"""
+
+import io
+import os
+import random
+import shutil
+import tempfile
+import unittest
+import contextlib
+
+import rctest
+import modules.rcfuncs as rcf
+import modules.rcindex as rci
+import modules.rcquery as rcq
+
+# Regions of the fixtures:  across RoIs, a whole chromosome, one RoI, and
+# none of length or on an unknown chromosome
+REGIONS = ['chr1:1-2,000,000', 'chr19:0-3000000', 'chr1:56222-56595',
+    'chr20:500000-1200000', 'chr1:5000-5000', 'chrM:0-16569']
+
+def bruteforce(tes, low, high):
+    """
+    Take list of (start, end, category) and region.  Return
+    {Category}>[Frequency, OverlapLength] of TEs overlapping it by more
+    than 0 bp.
+    """
+
+    totals = {}
+    for start, end, category in tes:
+        length = rci.overlaplength(start, end, low, high)
+        if length > 0:
+            total = totals.setdefault(category, [0, 0])
+            total[0] += 1
+            total[1] += length
+    return(dict((x, totals[x]) for x in sorted(totals)))
+
+class ParseRegionTest(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(rcq.parseregion('chr7:5,000,000-6,200,000'),
+            ('chr7', 5000000, 6200000))
+        self.assertEqual(rcq.parseregion(' 2:10-20\n'), ('2', 10, 20))
+        for string in ['chr7', 'chr7:5-', 'chr7:a-b', 'chr 7:1-2']:
+            with self.subTest(string=string):
+                with self.assertRaises(ValueError):
+                    rcq.parseregion(string)
+
+class RegionIndexTest(unittest.TestCase):
+
+    def test_totals(self):
+        rng = random.Random(9)
+        for trial in range(20):
+            tes = []
+            for i in range(rng.randrange(1, 80)):
+                start = rng.randrange(1000)
+                end = start + rng.randrange(-5, 80)
+                tes.append((start, end, rng.randrange(4)))
+            te_dict = {'1': [list(x) for x in zip(*tes)]}
+            indexes = [rcq.RegionIndex(te_dict, None)]
+            if rctest.HAVE_NUMPY:
+                import numpy as np
+                indexes.append(rcq.RegionIndex({'1': [np.array(x) for x in \
+                    te_dict['1']]}, None))
+            for index in indexes:
+                for i in range(30):
+                    low = rng.randrange(-50, 1100)
+                    high = low + rng.randrange(-10, 300)
+                    expected = bruteforce(tes, low, high) if low < high else {}
+                    self.assertEqual(index.totals('chr1', low, high),
+                        expected, (tes, low, high))
+                self.assertEqual(index.totals('chr2', 0, 1000), {})
+
+class QueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='repcalc-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def density(self, region):
+        """
+        Take region string.  Return fasdensity() of the fixtures with the
+        region as the only RoI, as nested lists.
+        """
+
+        chromosome, start, end = rcq.parseregion(region)
+        roi = os.path.join(self.directory, 'region.gff')
+        with open(roi, 'w') as f:
+            f.write('##gff-version 3\n%s\t.\tregion\t%d\t%d\n' % \
+                (chromosome, start, end))
+        with rctest.purepython():
+            classes = rcf.fasdensity(rctest.TE, rcf.pidensity(roi, [0, 3, 4]),
+                rcf.getconfig(rctest.CONFIG), [0, 1, 2, 3])
+        return(rows(classes))
+
+    def test_query(self):
+        expected = [self.density(x) for x in REGIONS]
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                index = rcf.fasregions(rctest.TE,
+                    rcf.classregistry(rcf.getconfig(rctest.CONFIG)),
+                    [0, 1, 2, 3])
+                self.assertEqual([rows(index.query(*rcq.parseregion(x))) \
+                    for x in REGIONS], expected)
+        self.assertTrue(expected[0])
+        self.assertEqual(expected[-2:], [[], []])
+
+    def test_analysis(self):
+        # One line per region, class and subclass found
+        expected = sorted('\t'.join([region, superclass, subclass,
+            str(frequency), str(length)]) + '\n' for region in REGIONS \
+            for superclass, subclass, frequency, length in \
+            self.density(region))
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                stdout = io.StringIO()
+                with contextlib.redirect_stdout(stdout):
+                    self.assertEqual(rcf.analysisQ([rctest.TE, '0', '1', '2',
+                        '3'] + REGIONS + [rctest.CONFIG],
+                        rctest.options('qA')), 0)
+                self.assertEqual(sorted(stdout.getvalue().splitlines(True)),
+                    expected)
+
+    def test_errors(self):
+        for args in [[rctest.TE], [rctest.TE, 'chr1:1-', rctest.CONFIG]]:
+            with self.subTest(args=args):
+                self.assertEqual(rcf.analysisQ(args, rctest.options('q')), 5)
+        self.assertEqual(rcf.analysisQ([rctest.TE, '0', 'x', '2', '3',
+            REGIONS[0]], rctest.options('qA')), 2)
+
+def rows(classes):
+    """
+    Take mapping {TEClass}>{Subclass}>[Frequency, Length].  Return sorted
+    list of [TEClass, Subclass, Frequency, Length].
+    """
+
+    return(sorted([x, y] + list(classes[x][y]) for x in classes \
+        for y in classes[x]))
+
+if __name__ == '__main__':
+    unittest.main()
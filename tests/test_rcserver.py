@@ -0,0 +1,133 @@
+"""
+test_rcserver.py:  Resident analysis server and its client
+
+A server is started on the fixtures, over a Unix socket and over TCP.  Its
+answers must be those of rca.py on the same records, and matrix output
+through the client that of MXROI.
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+import rctest
+import modules.rcapi as rca
+import modules.rcfuncs as rcf
+import modules.rcclient as rcclient
+import modules.rcserver as rcserver
+
+def startserver(*args):
+    """
+    Take rcserver.py arguments after the fixture data set.  Return (server
+    process, address it listens on).
+    """
+
+    process = subprocess.Popen([sys.executable, '-m', 'modules.rcserver',
+        '--te', 'fx=' + rctest.TE, '--config', 'fx=' + rctest.CONFIG,
+        '--workers', '2'] + list(args), cwd=rctest.ROOT,
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        universal_newlines=True)
+    line = process.stdout.readline()
+    if not line.startswith('Listening on '):
+        process.kill()
+        raise RuntimeError("Server did not start:  %r" % line)
+    return((process, line[len('Listening on '):].strip()))
+
+def stopserver(process):
+    process.terminate()
+    process.wait(10)
+    process.stdout.close()
+
+class ServerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp(prefix='repcalc-test-')
+        cls.path = os.path.join(cls.directory, 'rc.sock')
+        cls.process = startserver('--socket', cls.path)[0]
+        cls.tes = rca.readte(rctest.TE, rcf.getconfig(rctest.CONFIG))
+        cls.rois = rcclient.readregions(rctest.ROI, [8, 0, 3, 4])
+
+    @classmethod
+    def tearDownClass(cls):
+        stopserver(cls.process)
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def client(self):
+        return(rcclient.Client(path=self.path, timeout=30))
+
+    def expected(self, result):
+        """
+        Take rcapi result.  Return it as the server sends it.
+        """
+
+        if isinstance(result, rca.ClassTable):
+            result = rcserver.tablejson(result)
+        return(json.loads(json.dumps(result)))
+
+    def test_requests(self):
+        with self.client() as client:
+            self.assertEqual(client.request('datasets'),
+                {'fx': {'tes': len(self.tes)}})
+            self.assertEqual(client.request('genome', te='fx',
+                length=rctest.GENOME_LENGTH),
+                self.expected(self.tes.genome(rctest.GENOME_LENGTH)))
+            self.assertEqual(client.request('density', te='fx',
+                regions=self.rois, length=rctest.ROI_LENGTH),
+                self.expected(self.tes.density(self.rois,
+                rctest.ROI_LENGTH)))
+            self.assertEqual(client.request('query', te='fx',
+                region='chr1:1-2,000,000'),
+                self.expected(self.tes.query('chr1', 1, 2000000)))
+
+            matrix = self.tes.matrix(self.rois)
+            self.assertEqual(client.request('matrix', te='fx',
+                regions=self.rois), self.expected({'regions':
+                matrix.regions, 'rows': matrix.rows()}))
+            self.assertEqual(client.request('matrix', te='fx',
+                regions=self.rois, sparse=True)['cells'],
+                self.expected(matrix.cells()))
+
+    def test_errors(self):
+        # An error answers the one request; the connection stays usable.
+        with self.client() as client:
+            for op, fields in [('nothing', {}), ('genome', {'te': 'hg38'}),
+                    ('genome', {'te': 'fx', 'length': -1}),
+                    ('query', {'te': 'fx', 'region': 'chr1'}),
+                    ('density', {'te': 'fx', 'regions': [['a', 'chr1']]})]:
+                with self.subTest(op=op, fields=fields):
+                    with self.assertRaises(rcclient.ServerError):
+                        client.request(op, **fields)
+            self.assertIn('fx', client.request('datasets'))
+
+    def test_tcp(self):
+        process, address = startserver('--port', '0')
+        try:
+            host, port = address.rsplit(':', 1)
+            with rcclient.Client(host, int(port), timeout=30) as client:
+                self.assertEqual(client.request('genome', te='fx'),
+                    self.expected(self.tes.genome()))
+        finally:
+            stopserver(process)
+
+    def test_client(self):
+        # Matrix values rounded as MXROI writes them
+        process = subprocess.run([sys.executable, '-m', 'modules.rcclient',
+            '--socket', self.path, '--columns', '8,0,3,4', 'matrix', 'fx',
+            rctest.ROI], cwd=rctest.ROOT, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, universal_newlines=True, timeout=60)
+        self.assertEqual(process.returncode, 0, process.stderr)
+        lines = [x.split('\t') for x in process.stdout.splitlines()]
+        self.assertEqual('\n'.join('\t'.join([x[0]] + \
+            [str(round(float(y), 5)) for y in x[1:]]) \
+            for x in lines[1:]) + '\n',
+            rctest.golden('mxroi.txt').split('\n', 1)[1])
+        self.assertEqual(lines[0],
+            rctest.golden('mxroi.txt').split('\n')[0].split('\t'))
+
+if __name__ == '__main__':
+    unittest.main()
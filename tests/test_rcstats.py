@@ -0,0 +1,102 @@
+"""
+test_rcstats.py:  Run stats and progress of concurrent runs
+
+Each thread collects its own RunStats and monitors its own Progress, so
+runs in a pool of worker threads must not see each other's.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import rctest
+import modules.rcfuncs as rcf
+import modules.rcstats as rcs
+import modules.rcprogress as rcr
+
+class ConcurrentRunsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='repcalc-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def runB(self, name):
+        """
+        Take output name.  Run ROI analysis, collecting stats and
+        monitoring progress.  Return (result, report, Progress).
+        """
+
+        stats = rcs.RunStats()
+        progress = rcr.Progress()
+        with rcr.monitoring(progress), rcs.collecting(stats):
+            stats.result = rcf.analysisB([str(rctest.ROI_LENGTH),
+                rctest.TE, '0', '1', '2', '3', rctest.ROI, '0', '3', '4',
+                os.path.join(self.directory, name), rctest.CONFIG],
+                rctest.options('bAB'))
+        return((stats.result, stats.report(), progress))
+
+    def test_threads(self):
+        expected = self.runB('alone.tbl')
+        results = {}
+        barrier = threading.Barrier(4)
+
+        def worker(index):
+            barrier.wait()
+            results[index] = self.runB('roi%d.tbl' % index)
+
+        threads = [threading.Thread(target=worker, args=(x,)) \
+            for x in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for index in range(4):
+            result, report, progress = results[index]
+            self.assertEqual(result, 0)
+            self.assertEqual(report['counters'], expected[1]['counters'])
+            self.assertEqual(progress.done, expected[2].done)
+            self.assertEqual(rctest.readtext(os.path.join(self.directory,
+                'roi%d.tbl' % index)), rctest.golden('roi.tbl'))
+
+    def test_other_thread(self):
+        # A run in one thread is not active in another.
+        seen = []
+        thread = threading.Thread(target=lambda: seen.append(
+            (rcs.active(), rcr.active())))
+        with rcr.monitoring(rcr.Progress()), \
+                rcs.collecting(rcs.RunStats()) as stats:
+            thread.start()
+            thread.join()
+            rcs.count('te lines', 5)
+            self.assertTrue(rcs.active() and rcr.active())
+        self.assertEqual(seen, [(False, False)])
+        self.assertEqual(stats.counters['te lines'], 5)
+        self.assertFalse(rcs.active() or rcr.active())
+
+    def test_cancel(self):
+        # Cancelling one run does not stop another.
+        cancelled = rcr.Progress()
+        cancelled.cancel()
+        errors = []
+
+        def worker():
+            with rcr.monitoring(cancelled):
+                try:
+                    rcr.check()
+                except rcr.Cancelled:
+                    errors.append('cancelled')
+
+        with rcr.monitoring(rcr.Progress()):
+            thread = threading.Thread(target=worker)
+            thread.start()
+            thread.join()
+            rcr.check()
+        self.assertEqual(errors, ['cancelled'])
+
+if __name__ == '__main__':
+    unittest.main()
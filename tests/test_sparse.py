@@ -0,0 +1,93 @@
+"""
+test_sparse.py:  MXROI sparse long-format output with -s
+
+Every nonzero cell of the golden dense matrix must be a sparse line, in
+row order then RoI order, or RoI order then row order with -t.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import rctest
+import modules.rcfuncs as rcf
+
+def densecells(text):
+    """
+    Take dense MXROI text.  Return (list of (Class, Subclass, Region,
+    Overlap) for nonzero cells in row order, {(Class, Region)}>class total).
+
+    A class with one subclass has only its class row, and its cells have
+    Subclass None.
+    """
+
+    lines = [x.split('\t') for x in text.splitlines()]
+    regions = lines[0][1:]
+    cells = []
+    totals = {}
+    for i, fields in enumerate(lines[1:]):
+        label = fields[0]
+        single = label.startswith('[') and \
+            (i + 2 == len(lines) or lines[i + 2][0].startswith('['))
+        for region, value in zip(regions, fields[1:]):
+            if value == '0.0':
+                continue
+            if label.startswith('['):
+                totals[(label.strip('[]'), region)] = float(value)
+                if single:
+                    cells.append((label.strip('[]'), None, region, value))
+            else:
+                cells.append(tuple(label.split('/', 1)) + (region, value))
+    return((cells, totals))
+
+class SparseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='repcalc-test-')
+        self.out = os.path.join(self.directory, 'sparse.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def runC(self, letters):
+        self.assertEqual(rcf.analysisC([rctest.TE, '0', '1', '2', '3',
+            rctest.ROI, '8', '0', '3', '4', self.out, rctest.CONFIG],
+            rctest.options(letters)), 0)
+        lines = rctest.readtext(self.out).splitlines()
+        self.assertEqual(lines[0], 'Class\tSubclass\tRegion\tOverlap')
+        return([tuple(x.split('\t')) for x in lines[1:]])
+
+    def test_sparse(self):
+        cells, totals = densecells(rctest.golden('mxroi.txt'))
+        regions = rctest.golden('mxroi.txt').split('\n')[0].split('\t')[1:]
+        for name, loader in rctest.loaders():
+            with self.subTest(loader=name), loader():
+                sparse = self.runC('cABs')
+                # The subclass of a class with one is written too.
+                subclasses = {}
+                for x in sparse:
+                    subclasses.setdefault(x[0], set()).add(x[1])
+                self.assertEqual([(x[0], None) + x[2:] \
+                    if len(subclasses[x[0]]) == 1 else x for x in sparse],
+                    cells)
+                self.assertIn(('Simple_repeat', 'No subclass'),
+                    [x[:2] for x in sparse])
+                self.assertNotIn('0.0', [x[3] for x in sparse])
+
+                # Subclasses of a class add up to its dense total.
+                sums = {}
+                for this_class, subclass, region, value in sparse:
+                    key = (this_class, region)
+                    sums[key] = sums.get(key, 0) + float(value)
+                self.assertEqual(sorted(sums), sorted(totals))
+                for key in totals:
+                    self.assertAlmostEqual(sums[key], totals[key], places=3)
+
+                # -t orders the same lines by RoI first.
+                by_region = self.runC('cABst')
+                self.assertEqual(by_region, sorted(sparse,
+                    key=lambda x: regions.index(x[2])))
+
+if __name__ == '__main__':
+    unittest.main()